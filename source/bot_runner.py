@@ -1,5 +1,11 @@
 import threading
 
+import warning_handler
+
+# the worker processes are forked before any thread is started: importing receiver creates the bot, whose
+# telebot.TeleBot starts its worker threads right away
+warning_handler.init_warning_pool()
+
 import receiver
 import subscriptions
 
@@ -11,7 +17,6 @@ def start_bot():
     Starts the chat receiver and the subscription handling mechanism in two different threads
 
     """
-
     subscriptions_thread = threading.Thread(target=subscriptions.start_subscriptions)
     receiver_thread = threading.Thread(target=receiver.start_receiver)
 
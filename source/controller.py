@@ -1,6 +1,9 @@
 import datetime
+import threading
+import time
+from collections import OrderedDict
 
-from requests import HTTPError
+from requests import RequestException
 
 import sender
 import text_templates
@@ -662,7 +665,7 @@ def detailed_general_warning(chat_id: int, warning: WarningCategory, postal_code
     data_service.set_user_state(chat_id, 2)
     try:
         warnings = nina_service.call_general_warning(warning)
-    except HTTPError:
+    except RequestException:
         error_handler(chat_id, ErrorCodes.NINA_API)
         return
     if len(warnings) == 0:
@@ -710,9 +713,98 @@ def ask_if_add_to_subscriptions(chat_id: int, warning: WarningCategory, postal_c
         sender.send_message(chat_id, answer, markup)
 
 
+_WARNING_MESSAGE_CACHE_SIZE = 256
+"""number of rendered warning messages that are kept, the least recently used ones are removed"""
+
+_WARNING_MESSAGE_LANGUAGE = "de"
+"""language of the detailed warnings the warning messages are rendered from"""
+
+_warning_messages = OrderedDict()
+"""dictionary (warning_id, version, language, text templates generation) -> (message : str, severity : WarningSeverity),
+least recently used first"""
+
+_warning_message_statistics = {"hits": 0, "misses": 0, "evictions": 0, "render_time_in_ms": 0.0}
+
+_WARNING_MESSAGES_LOCK = threading.Lock()
+
+
+def _render_general_warning_message(general_warning: nina_service.GeneralWarning,
+                                    detail: nina_service.DetailedWarning) -> str:
+    """
+    Fills the message for general warnings in with the general and the detailed warning
+
+    Args:
+        general_warning: GeneralWarning from the Nina API
+        detail: DetailedWarning of general_warning
+
+    Returns:
+        the message that is sent to the users
+    """
+    severity = text_templates.get_button_name(Button[detail.info.severity.name])
+    warning_type = general_warning.type.value if general_warning is not None else ""
+    start_date = general_warning.start_date if general_warning is not None else ""
+    return text_templates.get_general_warning_message(detail.info.event, detail.info.headline,
+                                                      detail.info.description, severity, warning_type, start_date,
+                                                      detail.info.date_expires, detail.status,
+                                                      detail.government_warning_url)
+
+
+def _get_general_warning_message(general_warning: nina_service.GeneralWarning) -> tuple[str, WarningSeverity]:
+    """
+    Returns the message for the warning, each version of a warning is only rendered once for all users it is sent to.
+    It is rendered again after text_templates.json changed.
+
+    Args:
+        general_warning: GeneralWarning from the Nina API
+
+    Returns:
+        tuple (message, severity of the warning)
+
+    Raises:
+        RequestException: if the detailed warning cannot be fetched
+    """
+    key = (general_warning.id, general_warning.version, _WARNING_MESSAGE_LANGUAGE,
+           text_templates.get_templates_generation())
+    with _WARNING_MESSAGES_LOCK:
+        cached_message = _warning_messages.get(key)
+        if cached_message is not None:
+            _warning_messages.move_to_end(key)
+            _warning_message_statistics["hits"] += 1
+            return cached_message
+        _warning_message_statistics["misses"] += 1
+
+    detail = nina_service.get_detailed_warning(general_warning.id, language=_WARNING_MESSAGE_LANGUAGE,
+                                               version=general_warning.version)
+    start_time = time.perf_counter()
+    cached_message = (_render_general_warning_message(general_warning, detail), detail.info.severity)
+    render_time_in_ms = (time.perf_counter() - start_time) * 1000
+
+    with _WARNING_MESSAGES_LOCK:
+        _warning_message_statistics["render_time_in_ms"] += render_time_in_ms
+        _warning_messages[key] = cached_message
+        _warning_messages.move_to_end(key)
+        while len(_warning_messages) > _WARNING_MESSAGE_CACHE_SIZE:
+            _warning_messages.popitem(last=False)
+            _warning_message_statistics["evictions"] += 1
+    return cached_message
+
+
+def get_warning_message_cache_statistics() -> dict:
+    """
+    Returns:
+        dict with 'hits', 'misses', 'evictions', 'size' and 'render_time_in_ms' (total time spent rendering the
+        messages of the misses)
+    """
+    with _WARNING_MESSAGES_LOCK:
+        statistics = _warning_message_statistics.copy()
+        statistics["size"] = len(_warning_messages)
+        return statistics
+
+
 def send_detailed_general_warnings(chat_id: int, general_warnings: list[nina_service.GeneralWarning],
                                    relevant_postal_codes: list[str],
-                                   detail_for_testing: nina_service.DetailedWarning = None) -> int:
+                                   detail_for_testing: nina_service.DetailedWarning = None,
+                                   in_background: bool = False, on_done=None) -> int:
     """
     This method will send a detailed warning for each warning in general_warnings when the warning is relevant for
     at least one of the given postal codes (relevant_postal_codes)
@@ -724,7 +816,11 @@ def send_detailed_general_warnings(chat_id: int, general_warnings: list[nina_ser
                             If the general warning has a postal code that is in this list
                             the detailed warning will be sent to the user with the chat_id
         detail_for_testing: DetailedWarning which is only used when the user asks for the test location
-
+        in_background: True if the warnings are enqueued behind the interactive replies in the lane of their severity
+                       instead of being sent right away (e.g. when the subscriptions are warned)
+        on_done: optional function (warning_id, error : Exception or None) that is called for every relevant warning
+                 once Telegram accepted its message (None) or it could not be sent (the error), with in_background
+                 this may happen after this method returned
 
     Returns:
         integer with the number of relevant warnings that were sent
@@ -736,33 +832,28 @@ def send_detailed_general_warnings(chat_id: int, general_warnings: list[nina_ser
         relevant_warning_ids = warning_handler.get_all_relevant_warning_ids(general_warnings, relevant_postal_codes)
 
     for warning_id in relevant_warning_ids:
+        general_warning = next((warning for warning in general_warnings if warning.id == warning_id), None)
         try:
             # just for the test location
             if detail_for_testing is not None:
-                detail = detail_for_testing
+                answer = _render_general_warning_message(general_warning, detail_for_testing)
+                severity = detail_for_testing.info.severity
+            else:
+                answer, severity = _get_general_warning_message(general_warning)
+            if in_background:
+                future = sender.enqueue_message(chat_id, answer, frontend_helper.get_warning_keyboard_buttons(),
+                                                severity=severity)
+                if on_done is not None:
+                    future.add_done_callback(
+                        lambda done_future, done_id=warning_id: on_done(done_id, done_future.exception()))
             else:
-                detail = nina_service.get_detailed_warning(warning_id)
-            event = detail.info.event
-            headline = detail.info.headline
-            description = detail.info.description
-            severity_value = detail.info.severity
-            severity = text_templates.get_button_name(Button[severity_value.name])
-            warning_type = ""
-            start_date = ""
-            for warning in general_warnings:
-                if warning.id == warning_id:
-                    warning_type = warning.type.value
-                    start_date = warning.start_date
-                    break
-            date_expires = detail.info.date_expires
-            status = detail.status
-            link = detail.government_warning_url
-            answer = text_templates.get_general_warning_message(event, headline, description, severity, warning_type,
-                                                                start_date, date_expires, status, link)
-            sender.send_message(chat_id, answer, frontend_helper.get_warning_keyboard_buttons())
+                sender.send_message(chat_id, answer, frontend_helper.get_warning_keyboard_buttons())
+                if on_done is not None:
+                    on_done(warning_id, None)
             data_service.set_user_state(chat_id, 2)
-        except HTTPError:
-            pass
+        except RequestException as e:
+            if on_done is not None:
+                on_done(warning_id, e)
     return len(relevant_warning_ids)
 
 
@@ -812,7 +903,7 @@ def covid_rules(chat_id: int, postal_code: str, district_id: str, rules: nina_se
         sender.send_chat_action(chat_id, "typing")
         try:
             rules = nina_service.get_covid_rules(district_id)
-        except HTTPError:
+        except RequestException:
             error_handler(chat_id, ErrorCodes.NINA_API)
             return
     location_name = get_location_name(district_id, postal_code)
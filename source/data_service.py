@@ -1,7 +1,12 @@
+import atexit
+import copy
 import json
 import os
+import struct
 import threading
+import time
 
+import storage
 from enum_types import Attributes
 from enum_types import Language
 from enum_types import ReceiveInformation
@@ -10,6 +15,8 @@ from enum_types import WarningSeverity
 _USER_DATA_PATH = "../source/data/data.json"
 _WARNINGS_ALREADY_RECEIVED_PATH = "../source/data/warnings_already_received.json"
 _ACTIVE_WARNINGS_PATH = "../source/data/active_warnings.json"
+_ACTIVE_WARNINGS_BINARY_PATH = "../source/data/active_warnings.bin"
+_SQLITE_DATABASE_PATH = "../source/data/data.sqlite"
 _CONFIG_PATH = "../config.json"
 
 DEFAULT_DATA = {
@@ -70,13 +77,424 @@ def _write_file(path: str, data: dict):
         json.dump(data, writefile, indent=4)
 
 
-if not os.path.exists(_USER_DATA_PATH):
-    _write_file(path=_USER_DATA_PATH, data={})
+def get_config() -> dict:
+    """
+    Returns:
+        Dict containing all config values
+    """
+    return _read_file(_CONFIG_PATH)
+
 
 if not os.path.exists(_ACTIVE_WARNINGS_PATH):
     _write_file(path=_ACTIVE_WARNINGS_PATH, data={})
 
 
+def _create_storage():
+    """
+    Creates the storage backend selected with "storage_backend" in config.json ("json" if it is not set).
+
+    Returns:
+        JsonStorage or SqliteStorage the user data is read from and written to
+    """
+    backend = get_config().get("storage_backend", "json")
+    if backend == "sqlite":
+        return storage.SqliteStorage(_SQLITE_DATABASE_PATH)
+    if backend == "json":
+        return storage.JsonStorage(_USER_DATA_PATH, _WARNINGS_ALREADY_RECEIVED_PATH)
+    raise ValueError("unknown storage_backend in config: " + str(backend))
+
+
+def _new_user() -> dict:
+    """
+    Returns:
+        a new user record with the default values (deep copy, so it does not share lists with DEFAULT_DATA)
+    """
+    return copy.deepcopy(DEFAULT_DATA)
+
+
+# user cache -----------------------------------------------------------------------------------------------------------
+# All user records are kept in memory (_user_cache) and served from there. Changes are written to the storage either
+# right away ("sync") or collected and written in one batch every user_cache_flush_interval_in_ms ("async"),
+# see "user_cache_flush_mode" in config.json. If the storage was changed by someone else, the cache is reloaded.
+
+USER_CACHE_LOCK = threading.RLock()
+
+_user_cache = {}
+_user_cache_token = None
+_dirty_chat_ids = set()
+_deleted_chat_ids = set()
+_flush_requested = threading.Event()
+_flush_thread = None
+
+_cache_statistics = {
+    "hits": 0,
+    "reloads": 0,
+    "flushes": 0,
+    "bytes_written": 0
+}
+
+
+def _refresh_user_cache() -> bool:
+    """
+    Loads all users from the storage if the cache is empty or the storage was changed by someone else.
+    Records that were changed but not written yet are kept.
+
+    Returns:
+        True if the users were loaded from the storage, False if the cache was up to date
+    """
+    # NO LOCK HERE
+    global _user_cache, _user_cache_token
+    token = _storage.state_token()
+    if token == _user_cache_token:
+        return False
+    all_users = _storage.load_users()
+    for cid in _dirty_chat_ids:
+        all_users[cid] = _user_cache[cid]
+    for cid in _deleted_chat_ids:
+        all_users.pop(cid, None)
+    _user_cache = all_users
+    _user_cache_token = token
+    _rebuild_subscription_index()
+    _cache_statistics["reloads"] += 1
+    return True
+
+
+def _flush_user_cache_locked():
+    # NO LOCK HERE
+    global _user_cache_token
+    if len(_dirty_chat_ids) == 0 and len(_deleted_chat_ids) == 0:
+        return
+    bytes_written = _storage.write_users(_user_cache, _dirty_chat_ids, _deleted_chat_ids)
+    _dirty_chat_ids.clear()
+    _deleted_chat_ids.clear()
+    _user_cache_token = _storage.state_token()
+    _cache_statistics["flushes"] += 1
+    _cache_statistics["bytes_written"] += bytes_written
+
+
+def flush_user_cache():
+    """
+    Writes all changed user records to the storage. Is called automatically on shutdown.
+    """
+    with USER_CACHE_LOCK:
+        _flush_user_cache_locked()
+
+
+def _flush_loop(interval_in_seconds: float):
+    """
+    Waits for changes and writes them after interval_in_seconds, so that all changes made in the meantime are written
+    together.
+    """
+    while True:
+        _flush_requested.wait()
+        time.sleep(interval_in_seconds)
+        _flush_requested.clear()
+        try:
+            flush_user_cache()
+        except Exception as e:
+            print("ERROR: writing user data failed\n" + str(e))
+
+
+def _user_changed():
+    """
+    Writes the changes right away in sync mode or wakes up the flush thread in async mode.
+    """
+    # NO LOCK HERE
+    global _flush_thread
+    if _user_cache_flush_mode != "async":
+        _flush_user_cache_locked()
+        return
+    if _flush_thread is None:
+        interval_in_seconds = _user_cache_flush_interval_in_ms / 1000
+        _flush_thread = threading.Thread(target=_flush_loop, args=(interval_in_seconds,), daemon=True)
+        _flush_thread.start()
+    _flush_requested.set()
+
+
+# subscription index ---------------------------------------------------------------------------------------------------
+# postal_code : str -> warning_category : str -> set of chat_ids : str of the users subscribed to this category there.
+# It is updated whenever a record in the user cache changes, so it always matches the cached subscriptions.
+
+_subscription_index = {}
+
+
+def _add_to_subscription_index(cid: str, user: dict or None):
+    # NO LOCK HERE
+    if user is None:
+        return
+    for postal_code, subscription in user.get(Attributes.LOCATIONS.value, {}).items():
+        categories = _subscription_index.setdefault(postal_code, {})
+        for warning_category in subscription:
+            if warning_category != "district_id":
+                categories.setdefault(warning_category, set()).add(cid)
+
+
+def _remove_from_subscription_index(cid: str, user: dict or None):
+    # NO LOCK HERE
+    if user is None:
+        return
+    for postal_code, subscription in user.get(Attributes.LOCATIONS.value, {}).items():
+        categories = _subscription_index.get(postal_code, {})
+        for warning_category in subscription:
+            chat_ids = categories.get(warning_category)
+            if chat_ids is not None:
+                chat_ids.discard(cid)
+                if len(chat_ids) == 0:
+                    del categories[warning_category]
+        if len(categories) == 0:
+            _subscription_index.pop(postal_code, None)
+
+
+def _rebuild_subscription_index():
+    # NO LOCK HERE
+    _subscription_index.clear()
+    for cid, user in _user_cache.items():
+        _add_to_subscription_index(cid, user)
+
+
+def get_user_cache_statistics() -> dict:
+    """
+    Returns:
+        dict with the number of cache hits (reads answered without loading the users from the storage), reloads from
+        the storage, flushes and bytes written
+    """
+    with USER_CACHE_LOCK:
+        return _cache_statistics.copy()
+
+
+atexit.register(flush_user_cache)
+
+
+# user session ---------------------------------------------------------------------------------------------------------
+
+
+_active_sessions = threading.local()
+
+
+class UserSession:
+    """
+    Context manager for handling one update of a user:
+
+        with data_service.UserSession(chat_id):
+            ...
+
+    The record of the user is loaded once when the session is opened. Until the session is closed, all getters and
+    setters of data_service for this chat that are called in the same thread read and change this record in memory.
+    When the session is closed, all changed fields are written in one go. If the session is left with an exception,
+    nothing is written, so a handler that failed halfway does not leave a partly updated record.
+    """
+
+    def __init__(self, chat_id: int):
+        self.chat_id = chat_id
+        self.user = None
+        self.changed = False
+        self.deleted = False
+        self._original_user = None
+        self._is_nested = False
+
+    def __enter__(self):
+        cid = str(self.chat_id)
+        sessions = _get_active_sessions()
+        if cid in sessions:
+            # nested session for the same chat: everything goes to the outer session, which commits
+            self._is_nested = True
+            return sessions[cid]
+        self.user = _load_user(self.chat_id)
+        self._original_user = copy.deepcopy(self.user)
+        sessions[cid] = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._is_nested:
+            return False
+        del _get_active_sessions()[str(self.chat_id)]
+        if self.changed and exc_type is None:
+            self.commit()
+        return False
+
+    def commit(self):
+        """
+        Writes the fields of the record that were changed during the session. Fields that were changed by someone else
+        in the meantime (e.g. by the subscriptions thread) are kept.
+        """
+        with USER_CACHE_LOCK:
+            if self.user is None:
+                _remove_user(self.chat_id)
+                return
+            current_user = _load_user(self.chat_id)
+            if current_user is None or self._original_user is None or self.deleted:
+                _store_user(self.chat_id, self.user)
+                return
+            for key, value in self.user.items():
+                if key not in self._original_user or self._original_user[key] != value:
+                    current_user[key] = value
+            _store_user(self.chat_id, current_user)
+
+
+def _get_active_sessions() -> dict:
+    """
+    Returns:
+        dict chat_id : str -> UserSession with the sessions opened in the current thread
+    """
+    if not hasattr(_active_sessions, "sessions"):
+        _active_sessions.sessions = {}
+    return _active_sessions.sessions
+
+
+def _get_user(chat_id: int) -> dict or None:
+    """
+    Arguments:
+        chat_id: Integer to identify the user
+
+    Returns:
+        a copy of the record of the user or None if the user is not in the database yet
+    """
+    session = _get_active_sessions().get(str(chat_id))
+    if session is not None:
+        return copy.deepcopy(session.user)
+    return _load_user(chat_id)
+
+
+def _load_user(chat_id: int) -> dict or None:
+    """
+    Arguments:
+        chat_id: Integer to identify the user
+
+    Returns:
+        a copy of the cached record of the user or None if the user is not in the database yet
+    """
+    with USER_CACHE_LOCK:
+        if not _refresh_user_cache():
+            _cache_statistics["hits"] += 1
+        user = _user_cache.get(str(chat_id))
+        return copy.deepcopy(user)
+
+
+def _get_or_create_user(chat_id: int) -> dict:
+    """
+    Arguments:
+        chat_id: Integer to identify the user
+
+    Returns:
+        the record of the user or a new record with default values if the user is not in the database yet
+    """
+    user = _get_user(chat_id)
+    if user is None:
+        user = _new_user()
+    return user
+
+
+def _save_user(chat_id: int, user: dict):
+    """
+    Arguments:
+        chat_id: Integer to identify the user
+        user: the complete record of the user
+    """
+    session = _get_active_sessions().get(str(chat_id))
+    if session is not None:
+        session.user = user
+        session.changed = True
+        return
+    _store_user(chat_id, user)
+
+
+def _store_user(chat_id: int, user: dict):
+    """
+    Puts the record into the user cache.
+
+    Arguments:
+        chat_id: Integer to identify the user
+        user: the complete record of the user
+    """
+    with USER_CACHE_LOCK:
+        _refresh_user_cache()
+        cid = str(chat_id)
+        _remove_from_subscription_index(cid, _user_cache.get(cid))
+        _user_cache[cid] = user
+        _add_to_subscription_index(cid, user)
+        _dirty_chat_ids.add(cid)
+        _deleted_chat_ids.discard(cid)
+        _user_changed()
+
+
+def _delete_user(chat_id: int):
+    """
+    Arguments:
+        chat_id: Integer to identify the user
+    """
+    session = _get_active_sessions().get(str(chat_id))
+    if session is not None:
+        session.user = None
+        session.changed = True
+        session.deleted = True
+        return
+    _remove_user(chat_id)
+
+
+def _remove_user(chat_id: int):
+    """
+    Removes the record from the user cache.
+
+    Arguments:
+        chat_id: Integer to identify the user
+    """
+    with USER_CACHE_LOCK:
+        _refresh_user_cache()
+        cid = str(chat_id)
+        if cid not in _user_cache:
+            return
+        _remove_from_subscription_index(cid, _user_cache[cid])
+        del _user_cache[cid]
+        _dirty_chat_ids.discard(cid)
+        _deleted_chat_ids.add(cid)
+        _user_changed()
+
+
+def _get_all_users() -> dict:
+    """
+    Returns:
+        dict chat_id : str -> user record : dict of all users (must not be changed)
+    """
+    with USER_CACHE_LOCK:
+        if not _refresh_user_cache():
+            _cache_statistics["hits"] += 1
+        return _user_cache.copy()
+
+
+_storage = _create_storage()
+_user_cache_flush_mode = get_config().get("user_cache_flush_mode", "sync")
+_user_cache_flush_interval_in_ms = get_config().get("user_cache_flush_interval_in_ms", 500)
+
+
+def _get_user_value(chat_id: int, attribute: Attributes):
+    """
+    Arguments:
+        chat_id: Integer to identify the user
+        attribute: Attributes of the value
+
+    Returns:
+        the value of the attribute of the user or the default value if the user is not in the database yet
+    """
+    user = _get_user(chat_id)
+    if user is None:
+        return copy.deepcopy(DEFAULT_DATA[attribute.value])
+    return user[attribute.value]
+
+
+def _set_user_value(chat_id: int, attribute: Attributes, new_value):
+    """
+    Sets the attribute of the user (chat_id) to new_value. Creates the user, if he does not exist already.
+
+    Arguments:
+        chat_id: Integer to identify the user
+        attribute: Attributes of the value
+        new_value: the new value
+    """
+    user = _get_or_create_user(chat_id)
+    user[attribute.value] = new_value
+    _save_user(chat_id, user)
+
+
 def set_receive_warnings(chat_id: int, new_value: bool):
     """
     Sets receive_warnings of the user (chat_id) to the new value (new_value).
@@ -86,15 +504,7 @@ def set_receive_warnings(chat_id: int, new_value: bool):
         chat_id: Integer to identify the user
         new_value: Boolean of the new value
     """
-    all_user = _read_file(_USER_DATA_PATH)
-    cid = str(chat_id)
-
-    if not (cid in all_user):
-        all_user[cid] = DEFAULT_DATA.copy()
-
-    all_user[cid][Attributes.RECEIVE_WARNINGS.value] = new_value
-
-    _write_file(_USER_DATA_PATH, all_user)
+    _set_user_value(chat_id, Attributes.RECEIVE_WARNINGS, new_value)
 
 
 def get_receive_warnings(chat_id: int) -> bool:
@@ -107,11 +517,7 @@ def get_receive_warnings(chat_id: int) -> bool:
     Returns:
         Boolean representing if the user currently wants to receive warnings
     """
-    all_user = _read_file(_USER_DATA_PATH)
-
-    if str(chat_id) in all_user:
-        return all_user[str(chat_id)][Attributes.RECEIVE_WARNINGS.value]
-    return DEFAULT_DATA[Attributes.RECEIVE_WARNINGS.value]
+    return _get_user_value(chat_id, Attributes.RECEIVE_WARNINGS)
 
 
 def get_user_state(chat_id: int) -> int:
@@ -124,11 +530,7 @@ def get_user_state(chat_id: int) -> int:
     Returns:
         Integer value of the state the user is currently in or 0 if the user is not in the database yet
     """
-    all_user = _read_file(_USER_DATA_PATH)
-
-    if str(chat_id) in all_user:
-        return all_user[str(chat_id)][Attributes.CURRENT_STATE.value]
-    return DEFAULT_DATA[Attributes.CURRENT_STATE.value]
+    return _get_user_value(chat_id, Attributes.CURRENT_STATE)
 
 
 def set_user_state(chat_id: int, new_state: int):
@@ -139,15 +541,7 @@ def set_user_state(chat_id: int, new_state: int):
         chat_id: Integer to identify the user
         new_state: Integer of the new state
     """
-    all_user = _read_file(_USER_DATA_PATH)
-    cid = str(chat_id)
-
-    if not (cid in all_user):
-        all_user[cid] = DEFAULT_DATA.copy()
-
-    all_user[cid][Attributes.CURRENT_STATE.value] = new_state
-
-    _write_file(_USER_DATA_PATH, all_user)
+    _set_user_value(chat_id, Attributes.CURRENT_STATE, new_state)
 
 
 def get_last_bot_message_id(chat_id: int) -> str:
@@ -160,11 +554,7 @@ def get_last_bot_message_id(chat_id: int) -> str:
     Returns:
         string with the last bot message id
     """
-    all_user = _read_file(_USER_DATA_PATH)
-
-    if str(chat_id) in all_user:
-        return all_user[str(chat_id)][Attributes.LAST_BOT_MESSAGE_ID.value]
-    return DEFAULT_DATA[Attributes.LAST_BOT_MESSAGE_ID.value]
+    return _get_user_value(chat_id, Attributes.LAST_BOT_MESSAGE_ID)
 
 
 def set_last_bot_message_id(chat_id: int, new_state: str) -> str:
@@ -178,16 +568,12 @@ def set_last_bot_message_id(chat_id: int, new_state: str) -> str:
     Returns:
         string with the previous message id ("None" if there was no previous message id)
     """
-    all_user = _read_file(_USER_DATA_PATH)
-    cid = str(chat_id)
-
-    if not (cid in all_user):
-        all_user[cid] = DEFAULT_DATA.copy()
+    user = _get_or_create_user(chat_id)
 
-    prev_id = all_user[cid][Attributes.LAST_BOT_MESSAGE_ID.value]
-    all_user[cid][Attributes.LAST_BOT_MESSAGE_ID.value] = new_state
+    prev_id = user[Attributes.LAST_BOT_MESSAGE_ID.value]
+    user[Attributes.LAST_BOT_MESSAGE_ID.value] = new_state
 
-    _write_file(_USER_DATA_PATH, all_user)
+    _save_user(chat_id, user)
     return prev_id
 
 
@@ -199,15 +585,7 @@ def set_auto_covid_information(chat_id: int, how_often: ReceiveInformation):
         chat_id: Integer to identify the user
         how_often: ReceiveInformation representing how often the user wants to receive covid information
     """
-    all_user = _read_file(_USER_DATA_PATH)
-    cid = str(chat_id)
-
-    if not (cid in all_user):
-        all_user[cid] = DEFAULT_DATA.copy()
-
-    all_user[cid][Attributes.COVID_AUTO_INFO.value] = how_often.value
-
-    _write_file(_USER_DATA_PATH, all_user)
+    _set_user_value(chat_id, Attributes.COVID_AUTO_INFO, how_often.value)
 
 
 def get_auto_covid_information(chat_id: int) -> ReceiveInformation:
@@ -220,12 +598,7 @@ def get_auto_covid_information(chat_id: int) -> ReceiveInformation:
     Returns:
         ReceiveInformation representing how often the user currently wants to receive covid updates
     """
-    all_user = _read_file(_USER_DATA_PATH)
-    cid = str(chat_id)
-
-    if cid in all_user:
-        return ReceiveInformation(all_user[cid][Attributes.COVID_AUTO_INFO.value])
-    return ReceiveInformation(DEFAULT_DATA[Attributes.COVID_AUTO_INFO.value])
+    return ReceiveInformation(_get_user_value(chat_id, Attributes.COVID_AUTO_INFO))
 
 
 def get_subscriptions(chat_id: int) -> dict:
@@ -238,11 +611,7 @@ def get_subscriptions(chat_id: int) -> dict:
     Returns:
         a dictionary of subscriptions of the user
     """
-    all_user = _read_file(_USER_DATA_PATH)
-
-    if str(chat_id) in all_user:
-        return all_user[str(chat_id)][Attributes.LOCATIONS.value]
-    return DEFAULT_DATA[Attributes.LOCATIONS.value]
+    return _get_user_value(chat_id, Attributes.LOCATIONS)
 
 
 def add_subscription(chat_id: int, postal_code: str, district_id: str, warning: str, warning_level: str):
@@ -256,13 +625,7 @@ def add_subscription(chat_id: int, postal_code: str, district_id: str, warning:
         warning: String with the warning for the subscription (int of nina_service WarnType)
         warning_level: String representing the Level a warning is relevant to the user
     """
-    all_user = _read_file(_USER_DATA_PATH)
-    cid = str(chat_id)
-
-    if not (cid in all_user):
-        all_user[cid] = DEFAULT_DATA.copy()
-
-    user = all_user[cid]
+    user = _get_or_create_user(chat_id)
 
     if not (postal_code in user[Attributes.LOCATIONS.value]):
         user[Attributes.LOCATIONS.value][postal_code] = {
@@ -272,7 +635,7 @@ def add_subscription(chat_id: int, postal_code: str, district_id: str, warning:
     else:
         user[Attributes.LOCATIONS.value][postal_code][warning] = warning_level
 
-    _write_file(_USER_DATA_PATH, all_user)
+    _save_user(chat_id, user)
 
 
 def delete_subscription(chat_id: int, postal_code: str, warning: str):
@@ -284,13 +647,10 @@ def delete_subscription(chat_id: int, postal_code: str, warning: str):
         postal_code: postal code of the subscription (key)
         warning: String with the warning of WarnType (e.g. WEATHER)
     """
-    all_user = _read_file(_USER_DATA_PATH)
-    cid = str(chat_id)
-
-    if not (cid in all_user):
+    user = _get_user(chat_id)
+    if user is None:
         return
 
-    user = all_user[cid]
     if not (postal_code in user[Attributes.LOCATIONS.value]):
         return
 
@@ -299,7 +659,7 @@ def delete_subscription(chat_id: int, postal_code: str, warning: str):
     if number_of_warnings_left <= 1:
         del user[Attributes.LOCATIONS.value][postal_code]
 
-    _write_file(_USER_DATA_PATH, all_user)
+    _save_user(chat_id, user)
 
 
 def get_favorites(chat_id: int) -> list[dict]:
@@ -312,11 +672,7 @@ def get_favorites(chat_id: int) -> list[dict]:
     Returns:
         list of dictionaries with the favorites (locations the user set or default locations)
     """
-    all_user = _read_file(_USER_DATA_PATH)
-
-    if str(chat_id) in all_user:
-        return all_user[str(chat_id)][Attributes.FAVORITES.value]
-    return DEFAULT_DATA[Attributes.FAVORITES.value]
+    return _get_user_value(chat_id, Attributes.FAVORITES)
 
 
 def add_favorite(chat_id: int, postal_code: str, district_id: str) -> list[dict]:
@@ -333,13 +689,9 @@ def add_favorite(chat_id: int, postal_code: str, district_id: str) -> list[dict]
     Returns:
         list of dictionaries representing the favorites after the new one has been added
     """
-    all_user = _read_file(_USER_DATA_PATH)
-    cid = str(chat_id)
+    user = _get_or_create_user(chat_id)
 
-    if not (cid in all_user):
-        all_user[cid] = DEFAULT_DATA.copy()
-
-    current_favorites = all_user[cid][Attributes.FAVORITES.value]
+    current_favorites = user[Attributes.FAVORITES.value]
     i = 0
     location = {
         "postal_code": postal_code,
@@ -354,7 +706,7 @@ def add_favorite(chat_id: int, postal_code: str, district_id: str) -> list[dict]
         if prev_favorite == location:
             break
 
-    _write_file(_USER_DATA_PATH, all_user)
+    _save_user(chat_id, user)
     return current_favorites
 
 
@@ -407,11 +759,7 @@ def get_language(chat_id: int) -> Language:
     Returns:
         Language the user has currently active or the default language
     """
-    all_user = _read_file(_USER_DATA_PATH)
-
-    if str(chat_id) in all_user:
-        return Language(all_user[str(chat_id)][Attributes.LANGUAGE.value])
-    return Language(DEFAULT_DATA[Attributes.LANGUAGE.value])
+    return Language(_get_user_value(chat_id, Attributes.LANGUAGE))
 
 
 def set_language(chat_id: int, new_language: Language):
@@ -422,27 +770,11 @@ def set_language(chat_id: int, new_language: Language):
         chat_id: Integer to identify the user
         new_language: Language represents the new language the user wants
     """
-    all_user = _read_file(_USER_DATA_PATH)
-    cid = str(chat_id)
-
-    if not (cid in all_user):
-        all_user[cid] = DEFAULT_DATA.copy()
-
-    all_user[cid][Attributes.LANGUAGE.value] = new_language.value
-
-    _write_file(_USER_DATA_PATH, all_user)
+    _set_user_value(chat_id, Attributes.LANGUAGE, new_language.value)
 
 
 def set_default_level(chat_id: int, new_level: WarningSeverity):
-    all_users = _read_file(_USER_DATA_PATH)
-    cid = str(chat_id)
-
-    if not (cid in all_users):
-        all_users[cid] = DEFAULT_DATA.copy()
-
-    all_users[cid][Attributes.DEFAULT_LEVEL.value] = new_level.value
-
-    _write_file(_USER_DATA_PATH, all_users)
+    _set_user_value(chat_id, Attributes.DEFAULT_LEVEL, new_level.value)
 
 
 def get_default_level(chat_id: int) -> WarningSeverity:
@@ -457,11 +789,7 @@ def get_default_level(chat_id: int) -> WarningSeverity:
         WarningSeverity the user has currently as the default level. "Manual" if
         user does not exist in database.
     """
-    all_user = _read_file(_USER_DATA_PATH)
-
-    if str(chat_id) in all_user:
-        return WarningSeverity(all_user[str(chat_id)][Attributes.DEFAULT_LEVEL.value])
-    return WarningSeverity(DEFAULT_DATA[Attributes.DEFAULT_LEVEL.value])
+    return WarningSeverity(_get_user_value(chat_id, Attributes.DEFAULT_LEVEL))
 
 
 def get_all_chat_ids() -> list[int]:
@@ -470,7 +798,7 @@ def get_all_chat_ids() -> list[int]:
         list of all chat_ids that are saved in the database
     """
     chat_ids = []
-    all_users = _read_file(_USER_DATA_PATH)
+    all_users = _get_all_users()
     for key, value in all_users.items():
         chat_ids.append(int(key))
     return chat_ids
@@ -481,25 +809,66 @@ def get_chat_ids_of_warned_users() -> list[int]:
     Returns:
         list of all chat_ids that have receiveWarnings set to True
     """
-    return list(filter(lambda chat_id: get_receive_warnings(chat_id), get_all_chat_ids()))
+    all_users = _get_all_users()
+    return [int(chat_id) for chat_id, user in all_users.items() if user[Attributes.RECEIVE_WARNINGS.value]]
 
 
-def add_warning_id_to_users_warnings_received_list(chat_id: int, general_warning_id: str):
+def get_district_ids_of_all_favorites() -> set[str]:
+    """
+    Returns:
+        set of the district ids of the favorites of all users
+    """
+    all_users = _get_all_users()
+    return {favorite["district_id"] for user in all_users.values()
+            for favorite in user[Attributes.FAVORITES.value]}
+
+
+def get_subscribers_for_postal_codes(postal_codes: list[str], warning_category: str) -> dict[int, dict]:
     """
+    Returns all users that want to receive warnings and are subscribed to the warning category for at least one of the
+    given postal codes. Only the subscriptions for these postal codes are returned.
+
     Args:
-        chat_id: of the user
-        general_warning_id: of the warning that should be added to users warnings_already_received list
+        postal_codes: list of postal codes, e.g. all postal codes a warning is active in
+        warning_category: string with the value of the WarningCategory
+
+    Returns:
+        dict chat_id : int -> dict postal_code : str -> subscription : dict (like in get_subscriptions)
+    """
+    subscribers = {}
+    with USER_CACHE_LOCK:
+        _refresh_user_cache()
+        for postal_code in postal_codes:
+            categories = _subscription_index.get(postal_code)
+            if categories is None:
+                continue
+            for cid in categories.get(warning_category, ()):
+                user = _user_cache[cid]
+                if not user[Attributes.RECEIVE_WARNINGS.value]:
+                    continue
+                subscription = user[Attributes.LOCATIONS.value][postal_code]
+                subscribers.setdefault(int(cid), {})[postal_code] = copy.deepcopy(subscription)
+    return subscribers
+
+
+def get_chat_ids_that_received_warning(general_warning_id: str) -> set[int]:
     """
-    user_data = _read_file(_WARNINGS_ALREADY_RECEIVED_PATH)
-    chat_id_string = str(chat_id)
+    Args:
+        general_warning_id: id of the warning
 
-    if chat_id_string not in user_data:
-        user_data[chat_id_string] = []
+    Returns:
+        set of the chat ids of all users that have already received the warning
+    """
+    return {int(chat_id) for chat_id in _storage.load_chat_ids_that_received_warning(general_warning_id)}
 
-    list_of_received_warnings = user_data[chat_id_string]
-    list_of_received_warnings.append(general_warning_id)
 
-    _write_file(_WARNINGS_ALREADY_RECEIVED_PATH, user_data)
+def add_warning_id_to_users_warnings_received_list(chat_id: int, general_warning_id: str):
+    """
+    Args:
+        chat_id: of the user
+        general_warning_id: of the warning that should be added to users warnings_already_received list
+    """
+    _storage.add_received_warning_id(str(chat_id), general_warning_id)
 
 
 def get_users_already_received_warning_ids(chat_id: int) -> list[str]:
@@ -509,13 +878,7 @@ def get_users_already_received_warning_ids(chat_id: int) -> list[str]:
     Returns:
         a list of the warning_ids of warnings the user has already received
     """
-    user_data = _read_file(_WARNINGS_ALREADY_RECEIVED_PATH)
-    chat_id_string = str(chat_id)
-
-    if chat_id_string not in user_data:
-        return []
-
-    return user_data[chat_id_string]
+    return _storage.load_received_warning_ids(str(chat_id))
 
 
 def has_user_already_received_warning(chat_id: int, general_warning_id: str) -> bool:
@@ -541,15 +904,13 @@ def delete_all_subscriptions(chat_id: int):
     Args:
         chat_id: to identify the user
     """
-    all_user = _read_file(_USER_DATA_PATH)
-    cid = str(chat_id)
-
-    if not (cid in all_user):
+    user = _get_user(chat_id)
+    if user is None:
         return
 
-    all_user[cid][Attributes.LOCATIONS.value] = DEFAULT_DATA[Attributes.LOCATIONS.value]
+    user[Attributes.LOCATIONS.value] = copy.deepcopy(DEFAULT_DATA[Attributes.LOCATIONS.value])
 
-    _write_file(_USER_DATA_PATH, all_user)
+    _save_user(chat_id, user)
 
 
 def reset_favorites(chat_id: int):
@@ -559,15 +920,13 @@ def reset_favorites(chat_id: int):
     Args:
         chat_id: to identify the user
     """
-    all_user = _read_file(_USER_DATA_PATH)
-    cid = str(chat_id)
-
-    if not (cid in all_user):
+    user = _get_user(chat_id)
+    if user is None:
         return
 
-    all_user[cid][Attributes.FAVORITES.value] = DEFAULT_DATA[Attributes.FAVORITES.value]
+    user[Attributes.FAVORITES.value] = copy.deepcopy(DEFAULT_DATA[Attributes.FAVORITES.value])
 
-    _write_file(_USER_DATA_PATH, all_user)
+    _save_user(chat_id, user)
 
 
 def delete_user(chat_id: int):
@@ -577,57 +936,294 @@ def delete_user(chat_id: int):
     Args:
         chat_id: to identify the user
     """
-    # delete user from the data json
-    all_user = _read_file(_USER_DATA_PATH)
-    cid = str(chat_id)
-
-    if cid in all_user:
-        del all_user[cid]
-        _write_file(_USER_DATA_PATH, all_user)
+    _delete_user(chat_id)
 
     # also delete user from warnings already received
-    user_data = _read_file(_WARNINGS_ALREADY_RECEIVED_PATH)
-    chat_id_string = str(chat_id)
-
-    if chat_id_string in user_data:
-        del user_data[chat_id_string]
-        _write_file(_WARNINGS_ALREADY_RECEIVED_PATH, user_data)
+    _storage.delete_received_warning_ids(str(chat_id))
 
 
 ACTIVE_WARNINGS_LOCK = threading.Lock()
 
+_ACTIVE_WARNINGS_MAGIC = b"NWAW"
+_ACTIVE_WARNINGS_FORMAT_VERSION = 1
+_UNKNOWN_WARNING_VERSION = -1
+
+_active_warnings = None
+"""dict with the content of active_warnings.bin:
+'token' (mtime and size of the file), 'postal_codes' (list of postal codes, bit i of a bitset stands for entry i),
+'indices' (postal code -> i), 'bitsets' (warning id -> bitset), 'versions' (warning id -> version),
+'postal_code_lists' (warning id -> list of postal codes, decoded when first needed)"""
+
+
+def _get_bitset_of_postal_codes(postal_codes, indices: dict) -> int:
+    """
+    Args:
+        postal_codes: postal codes, the ones missing in indices are ignored
+        indices: dict postal code -> bit
+
+    Returns:
+        bitset with the bits of the postal codes set
+    """
+    bitset = 0
+    for postal_code in postal_codes:
+        index = indices.get(postal_code)
+        if index is not None:
+            bitset |= 1 << index
+    return bitset
+
+
+def _get_postal_codes_of_bitset(bitset: int, postal_codes: list[str]) -> list[str]:
+    """
+    Args:
+        bitset: bitset of postal codes
+        postal_codes: list of postal codes, bit i stands for entry i
+
+    Returns:
+        list of the postal codes whose bits are set, in the order of postal_codes
+    """
+    bits = bin(bitset)[:1:-1]  # bit 0 first
+    result = []
+    index = bits.find("1")
+    while index != -1:
+        result.append(postal_codes[index])
+        index = bits.find("1", index + 1)
+    return result
+
+
+def _encode_active_warnings(postal_codes: list[str], bitsets: dict, versions: dict) -> bytes:
+    """
+    Encodes the active warnings in the binary format of active_warnings.bin:
+    magic, format version, the postal codes (bit i stands for entry i) and for every warning its id, version and
+    bitset (little endian, without trailing zero bytes)
+
+    Args:
+        postal_codes: list of postal codes
+        bitsets: dict warning id -> bitset
+        versions: dict warning id -> version, missing versions are stored as unknown
+
+    Returns:
+        content of active_warnings.bin
+    """
+    encoded_postal_codes = "\n".join(postal_codes).encode("utf-8")
+    parts = [_ACTIVE_WARNINGS_MAGIC, struct.pack("<BII", _ACTIVE_WARNINGS_FORMAT_VERSION, len(postal_codes),
+                                                  len(encoded_postal_codes)),
+             encoded_postal_codes, struct.pack("<I", len(bitsets))]
+    for warning_id, bitset in bitsets.items():
+        encoded_warning_id = warning_id.encode("utf-8")
+        encoded_bitset = bitset.to_bytes((bitset.bit_length() + 7) // 8, "little")
+        parts.append(struct.pack("<H", len(encoded_warning_id)))
+        parts.append(encoded_warning_id)
+        parts.append(struct.pack("<qI", versions.get(warning_id, _UNKNOWN_WARNING_VERSION), len(encoded_bitset)))
+        parts.append(encoded_bitset)
+    return b"".join(parts)
+
+
+def _decode_active_warnings(content: bytes) -> tuple[list[str], dict, dict]:
+    """
+    Args:
+        content: content of active_warnings.bin
+
+    Returns:
+        tuple (postal codes, dict warning id -> bitset, dict warning id -> version)
+
+    Raises:
+        ValueError: if content is not in the format of active_warnings.bin
+    """
+    if content[:4] != _ACTIVE_WARNINGS_MAGIC:
+        raise ValueError("not an active warnings file")
+    format_version, number_of_postal_codes, postal_codes_length = struct.unpack_from("<BII", content, 4)
+    if format_version != _ACTIVE_WARNINGS_FORMAT_VERSION:
+        raise ValueError("unknown active warnings format version " + str(format_version))
+    offset = 4 + struct.calcsize("<BII")
+    postal_codes = content[offset:offset + postal_codes_length].decode("utf-8").split("\n")
+    if number_of_postal_codes == 0:
+        postal_codes = []
+    offset += postal_codes_length
+
+    (number_of_warnings,) = struct.unpack_from("<I", content, offset)
+    offset += 4
+    bitsets = {}
+    versions = {}
+    for _ in range(number_of_warnings):
+        (warning_id_length,) = struct.unpack_from("<H", content, offset)
+        offset += 2
+        warning_id = content[offset:offset + warning_id_length].decode("utf-8")
+        offset += warning_id_length
+        version, bitset_length = struct.unpack_from("<qI", content, offset)
+        offset += struct.calcsize("<qI")
+        bitsets[warning_id] = int.from_bytes(content[offset:offset + bitset_length], "little")
+        offset += bitset_length
+        if version != _UNKNOWN_WARNING_VERSION:
+            versions[warning_id] = version
+    return postal_codes, bitsets, versions
+
+
+def _set_active_warnings(postal_codes: list[str], bitsets: dict, versions: dict):
+    """
+    Writes the active warnings to a temporary file next to _ACTIVE_WARNINGS_BINARY_PATH and replaces it with the
+    temporary file, so readers never see a partially written file.
+
+    Args:
+        postal_codes: list of postal codes, bit i of the bitsets stands for entry i
+        bitsets: dict warning id -> bitset
+        versions: dict warning id -> version
+    """
+    # NO LOCK HERE
+    global _active_warnings
+    temporary_path = _ACTIVE_WARNINGS_BINARY_PATH + ".tmp"
+    with open(temporary_path, "wb") as file_object:
+        file_object.write(_encode_active_warnings(postal_codes, bitsets, versions))
+    os.replace(temporary_path, _ACTIVE_WARNINGS_BINARY_PATH)
+
+    status = os.stat(_ACTIVE_WARNINGS_BINARY_PATH)
+    _active_warnings = {"token": (status.st_mtime_ns, status.st_size), "postal_codes": postal_codes,
+                        "indices": {postal_code: index for index, postal_code in enumerate(postal_codes)},
+                        "bitsets": bitsets, "versions": versions, "postal_code_lists": {}}
+
+
+def _get_active_warnings() -> dict:
+    """
+    Returns the content of active_warnings.bin, it is only read again if the file changed.
+    Without active_warnings.bin, the postal code lists of active_warnings.json are converted once.
+
+    Returns:
+        dict described at _active_warnings (must not be changed)
+    """
+    # NO LOCK HERE
+    global _active_warnings
+    if not os.path.exists(_ACTIVE_WARNINGS_BINARY_PATH):
+        postal_code_lists = _read_file(_ACTIVE_WARNINGS_PATH) if os.path.exists(_ACTIVE_WARNINGS_PATH) else {}
+        postal_codes = sorted({postal_code for postal_code_list in postal_code_lists.values()
+                               for postal_code in postal_code_list})
+        indices = {postal_code: index for index, postal_code in enumerate(postal_codes)}
+        bitsets = {warning_id: _get_bitset_of_postal_codes(postal_code_list, indices)
+                   for warning_id, postal_code_list in postal_code_lists.items()}
+        _set_active_warnings(postal_codes, bitsets, {})
+        return _active_warnings
+
+    status = os.stat(_ACTIVE_WARNINGS_BINARY_PATH)
+    token = (status.st_mtime_ns, status.st_size)
+    if _active_warnings is None or _active_warnings["token"] != token:
+        with open(_ACTIVE_WARNINGS_BINARY_PATH, "rb") as file_object:
+            postal_codes, bitsets, versions = _decode_active_warnings(file_object.read())
+        _active_warnings = {"token": token, "postal_codes": postal_codes,
+                            "indices": {postal_code: index for index, postal_code in enumerate(postal_codes)},
+                            "bitsets": bitsets, "versions": versions, "postal_code_lists": {}}
+    return _active_warnings
+
 
 def get_active_warnings_dict() -> dict:
     """
     Returns:
-        Dict containing all active warnings
+        Dict warning id -> list of the postal codes the warning is active in, for all active warnings
+        (the lists must not be changed)
     """
     with ACTIVE_WARNINGS_LOCK:
-        return _read_file(_ACTIVE_WARNINGS_PATH)
+        active_warnings = _get_active_warnings()
+        postal_code_lists = active_warnings["postal_code_lists"]
+        for warning_id, bitset in active_warnings["bitsets"].items():
+            if warning_id not in postal_code_lists:
+                postal_code_lists[warning_id] = _get_postal_codes_of_bitset(bitset, active_warnings["postal_codes"])
+        return dict(postal_code_lists)
 
 
-def _set_active_warnings_dict(new_data: dict):
+def get_active_warning_bitsets() -> dict:
     """
+    Returns:
+        Dict warning id -> bitset of the postal codes the warning is active in, for all active warnings.
+        Compare them with get_postal_code_bitset.
+    """
+    with ACTIVE_WARNINGS_LOCK:
+        return dict(_get_active_warnings()["bitsets"])
+
+
+def get_postal_code_bitset(postal_codes: list[str]) -> int:
+    """
+    Args:
+        postal_codes: list of postal codes
+
+    Returns:
+        bitset of the postal codes that can be intersected with the bitsets of get_active_warning_bitsets,
+        postal codes no active warning is active in are left out
+    """
+    with ACTIVE_WARNINGS_LOCK:
+        return _get_bitset_of_postal_codes(postal_codes, _get_active_warnings()["indices"])
+
+
+def get_active_warning_versions() -> dict:
+    """
+    Returns:
+        Dict warning id -> version of the warning the postal codes in the active warnings were computed for
+    """
+    with ACTIVE_WARNINGS_LOCK:
+        return dict(_get_active_warnings()["versions"])
+
+
+def _get_active_warnings_with_postal_codes(postal_codes: list[str]) -> tuple[list[str], dict]:
+    """
+    Returns the postal codes of active_warnings.bin with all missing postal codes of the given list appended and
+    the bitsets of all active warnings
+
     Args:
-        new_data: dict that will be written to _active_warnings_path
+        postal_codes: list of postal codes that have to be in the result
 
+    Returns:
+        tuple (postal codes, dict warning id -> bitset), both are copies
     """
     # NO LOCK HERE
-    _write_file(_ACTIVE_WARNINGS_PATH, new_data)
+    active_warnings = _get_active_warnings()
+    all_postal_codes = list(active_warnings["postal_codes"])
+    indices = active_warnings["indices"]
+    for postal_code in postal_codes:
+        if postal_code not in indices:
+            all_postal_codes.append(postal_code)
+    return all_postal_codes, dict(active_warnings["bitsets"])
 
 
 def write_to_active_warnings_dict(key: int, new_data: list[any]):
     """
-    Writes any given data to active_warnings_path.
+    Writes the postal codes of a warning to active_warnings_path.
 
     Args:
         key: int representing key of new dict entry
-        new_data: list representing value of new dict entry
+        new_data: list of postal codes, value of the new dict entry
+    """
+    with ACTIVE_WARNINGS_LOCK:
+        postal_codes, bitsets = _get_active_warnings_with_postal_codes(new_data)
+        indices = {postal_code: index for index, postal_code in enumerate(postal_codes)}
+        bitsets[key] = _get_bitset_of_postal_codes(new_data, indices)
+        _set_active_warnings(postal_codes, bitsets, _get_active_warnings()["versions"])
+
+
+def update_active_warnings_dict(new_bitsets: dict, postal_codes: list[str], keys_to_remove=(),
+                                versions: dict = None):
+    """
+    Applies all changes to the active warnings with a single write of active_warnings_path.
+
+    Args:
+        new_bitsets: dict warning id -> bitset of postal codes, added or replacing existing entries
+        postal_codes: list of postal codes, bit i of new_bitsets stands for entry i
+            (e.g. place_converter.get_postal_code_index_table())
+        keys_to_remove: warning ids whose entries will be deleted
+        versions: dict warning id -> version, replaces all saved versions, None to keep them
     """
     with ACTIVE_WARNINGS_LOCK:
-        active_warnings = _read_file(_ACTIVE_WARNINGS_PATH)
-        active_warnings[key] = new_data
-        _set_active_warnings_dict(active_warnings)
+        active_warnings = _get_active_warnings()
+        bitsets = dict(active_warnings["bitsets"])
+        if active_warnings["postal_codes"] != postal_codes:
+            # the saved bitsets are converted to the given postal codes
+            indices = {postal_code: index for index, postal_code in enumerate(postal_codes)}
+            for warning_id, bitset in bitsets.items():
+                bitsets[warning_id] = _get_bitset_of_postal_codes(
+                    _get_postal_codes_of_bitset(bitset, active_warnings["postal_codes"]), indices)
+
+        for key in keys_to_remove:
+            bitsets.pop(key, None)
+        bitsets.update(new_bitsets)
+        if versions is None:
+            versions = {warning_id: version for warning_id, version in active_warnings["versions"].items()
+                        if warning_id in bitsets}
+        _set_active_warnings(list(postal_codes), bitsets, dict(versions))
 
 
 def remove_from_active_warnings_dict(key_to_remove: int):
@@ -638,9 +1234,12 @@ def remove_from_active_warnings_dict(key_to_remove: int):
         key_to_remove: key of entry that will be deleted
     """
     with ACTIVE_WARNINGS_LOCK:
-        active_warnings = _read_file(_ACTIVE_WARNINGS_PATH)
-        del active_warnings[key_to_remove]
-        _set_active_warnings_dict(active_warnings)
+        active_warnings = _get_active_warnings()
+        bitsets = dict(active_warnings["bitsets"])
+        del bitsets[key_to_remove]
+        versions = dict(active_warnings["versions"])
+        versions.pop(key_to_remove, None)
+        _set_active_warnings(active_warnings["postal_codes"], bitsets, versions)
 
 
 def get_user_subscription_postal_codes(chat_id: int) -> list[str]:
@@ -653,18 +1252,9 @@ def get_user_subscription_postal_codes(chat_id: int) -> list[str]:
     Returns:
         list of all postal codes the user is subscribed to
     """
-    all_user = _read_file(_USER_DATA_PATH)
-    cid = str(chat_id)
-
-    if not (cid in all_user):
+    user = _get_user(chat_id)
+    if user is None:
         return []
 
-    return list(all_user[cid][Attributes.LOCATIONS.value].keys())
-
+    return list(user[Attributes.LOCATIONS.value].keys())
 
-def get_config() -> dict:
-    """
-    Returns:
-        Dict containing all config values
-    """
-    return _read_file(_CONFIG_PATH)
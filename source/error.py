@@ -20,6 +20,8 @@ def is_location(text: str) -> bool:
     Returns:
           boolean whether given string is a location
     """
+    if place_converter.is_exact_location_name(text):
+        return True
     location_lower = text.lower()
     suggestion_dicts = place_converter.get_non_covid_dict_suggestions(text)
     for dic in suggestion_dicts:
@@ -1,3 +1,8 @@
+import functools
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from datetime import datetime
 from typing import List
@@ -7,10 +12,102 @@ from enum_types import WarningCategory
 from enum_types import WarningType
 
 import requests
+import requests.adapters
+import data_service
 import nina_string_helper
 
 _API_URL = "https://warnung.bund.de/api31"
 
+_HTTP_POOL_SIZE = 10
+"""number of kept-alive connections to the Nina API"""
+
+_HTTP_TIMEOUT_IN_SECONDS = (3.05, 10)
+"""(connect timeout, read timeout) of every request to the Nina API"""
+
+_HTTP_MAX_RETRIES = 3
+"""number of retries after a connection error, timeout or 5xx response"""
+
+_HTTP_BACKOFF_IN_SECONDS = 0.5
+"""wait before the first retry, doubled for every further retry"""
+
+
+def _create_session() -> requests.Session:
+    """
+    Creates the session used for all requests to the Nina API, connections are reused between requests
+    :return: the session
+    """
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=_HTTP_POOL_SIZE, pool_maxsize=_HTTP_POOL_SIZE)
+    session.mount("https://", adapter)
+    return session
+
+
+_session = _create_session()
+
+_request_statistics = {}
+"""dictionary endpoint: str -> {'requests', 'errors', 'retries', 'total_latency_in_ms', 'max_latency_in_ms'}"""
+
+_REQUEST_STATISTICS_LOCK = threading.Lock()
+
+
+def _record_request(endpoint: str, latency_in_ms: float, failed: bool, retried: bool):
+    """
+    Adds one request to the statistics of the endpoint
+    :param endpoint: name of the endpoint
+    :param latency_in_ms: duration of the request
+    :param failed: True if the request raised an error or got an error response
+    :param retried: True if the request will be retried
+    """
+    with _REQUEST_STATISTICS_LOCK:
+        statistics = _request_statistics.setdefault(endpoint, {"requests": 0, "errors": 0, "retries": 0,
+                                                               "total_latency_in_ms": 0.0,
+                                                               "max_latency_in_ms": 0.0})
+        statistics["requests"] += 1
+        statistics["total_latency_in_ms"] += latency_in_ms
+        statistics["max_latency_in_ms"] = max(statistics["max_latency_in_ms"], latency_in_ms)
+        if failed:
+            statistics["errors"] += 1
+        if retried:
+            statistics["retries"] += 1
+
+
+def get_request_statistics() -> dict:
+    """
+    Returns the latency and error counters of the requests to the Nina API
+    :return: dictionary endpoint -> {'requests', 'errors', 'retries', 'total_latency_in_ms', 'max_latency_in_ms'}
+    """
+    with _REQUEST_STATISTICS_LOCK:
+        return {endpoint: statistics.copy() for endpoint, statistics in _request_statistics.items()}
+
+
+def _get(api_string: str, endpoint: str, headers: dict = None) -> requests.Response:
+    """
+    Gets api_string from the Nina API with the shared session.
+    Connection errors, timeouts and 5xx responses are retried with exponential backoff.
+    :param api_string: the path of the request, appended to _API_URL
+    :param endpoint: name of the endpoint in the request statistics
+    :param headers: additional request headers, can be None
+    :return: the successful response (including 304 Not Modified for conditional requests)
+    :raises HTTPError: if the response still is an error response after all retries
+    :raises ConnectionError, Timeout: if the Nina API still is not reachable after all retries
+    """
+    for attempt in range(_HTTP_MAX_RETRIES + 1):
+        can_retry = attempt < _HTTP_MAX_RETRIES
+        start_time = time.perf_counter()
+        try:
+            response = _session.get(_API_URL + api_string, headers=headers, timeout=_HTTP_TIMEOUT_IN_SECONDS)
+        except (requests.ConnectionError, requests.Timeout):
+            _record_request(endpoint, (time.perf_counter() - start_time) * 1000, True, can_retry)
+            if not can_retry:
+                raise
+        else:
+            should_retry = can_retry and response.status_code >= 500
+            _record_request(endpoint, (time.perf_counter() - start_time) * 1000, not response.ok, should_retry)
+            if not should_retry:
+                response.raise_for_status()
+                return response
+        time.sleep(_HTTP_BACKOFF_IN_SECONDS * 2 ** attempt)
+
 
 @dataclass
 class CovidRules:
@@ -37,6 +134,96 @@ def _get_safely(dict, key: str):
         return None
 
 
+_COVID_DOCUMENT_CACHE_SIZE = 512
+"""number of covid documents kept in memory, there are about 400 districts"""
+
+_covid_document_ttl_in_seconds = data_service.get_config().get("covid_document_ttl_in_seconds", 3600)
+"""age up to which a covid document is served without fetching it again"""
+
+_covid_prefetch_interval_in_seconds = data_service.get_config().get("covid_prefetch_interval_in_seconds", 0)
+"""interval of fetching the covid documents of the districts in the users' favorites, 0 to not prefetch"""
+
+_covid_documents = OrderedDict()
+"""dictionary district_id: str -> (time of the fetch : float, response : dict), least recently used first"""
+
+_covid_document_statistics = {"hits": 0, "misses": 0, "evictions": 0, "prefetches": 0}
+
+_COVID_DOCUMENTS_LOCK = threading.Lock()
+
+
+def _fetch_covid_document(district_id: str) -> dict:
+    """
+    Fetches the covid document of the district and stores it in _covid_documents
+    :param district_id: district id with 12 characters
+    :return: the decoded json response
+    :raises HTTPError:
+    """
+    covid_info_api = "/appdata/covid/covidrules/DE/"
+    response = _get(covid_info_api + district_id + ".json", covid_info_api + "{id}.json").json()
+    with _COVID_DOCUMENTS_LOCK:
+        _covid_documents[district_id] = (time.monotonic(), response)
+        _covid_documents.move_to_end(district_id)
+        while len(_covid_documents) > _COVID_DOCUMENT_CACHE_SIZE:
+            _covid_documents.popitem(last=False)
+            _covid_document_statistics["evictions"] += 1
+    return response
+
+
+def _get_covid_document(district_id: str) -> dict:
+    """
+    Returns the covid document of the district, covid rules and covid infos are both read from it.
+    The document is fetched again after _covid_document_ttl_in_seconds.
+    :param district_id: Each district may have different covid_rules
+    :return: the decoded json response (must not be changed)
+    :raises HTTPError:
+    """
+    district_id = nina_string_helper.expand_location_id_with_zeros(district_id)
+    with _COVID_DOCUMENTS_LOCK:
+        document = _covid_documents.get(district_id)
+        if document is not None and time.monotonic() - document[0] < _covid_document_ttl_in_seconds:
+            _covid_documents.move_to_end(district_id)
+            _covid_document_statistics["hits"] += 1
+            return document[1]
+        _covid_document_statistics["misses"] += 1
+    return _fetch_covid_document(district_id)
+
+
+def get_covid_document_cache_statistics() -> dict:
+    """
+    Returns the counters of the covid document cache
+    :return: dictionary with 'hits', 'misses', 'evictions', 'prefetches' and 'size'
+    """
+    with _COVID_DOCUMENTS_LOCK:
+        statistics = _covid_document_statistics.copy()
+        statistics["size"] = len(_covid_documents)
+        return statistics
+
+
+def _prefetch_covid_documents_loop():
+    """
+    Fetches the covid documents of all districts in the users' favorites every _covid_prefetch_interval_in_seconds
+    """
+    while True:
+        for district_id in data_service.get_district_ids_of_all_favorites():
+            try:
+                _fetch_covid_document(nina_string_helper.expand_location_id_with_zeros(district_id))
+                with _COVID_DOCUMENTS_LOCK:
+                    _covid_document_statistics["prefetches"] += 1
+            except Exception as e:
+                print("ERROR: prefetching covid document of district " + district_id + " failed\n" + str(e))
+        time.sleep(_covid_prefetch_interval_in_seconds)
+
+
+def init_covid_prefetch():
+    """
+    Starts prefetching the covid documents of the users' favorites, if covid_prefetch_interval_in_seconds is set
+    """
+    if _covid_prefetch_interval_in_seconds <= 0:
+        return
+    print("Initializing Covid Prefetch")
+    threading.Thread(target=_prefetch_covid_documents_loop, daemon=True).start()
+
+
 def get_covid_rules(district_id: str) -> CovidRules or None:
     """
     Gets current covid rules from the NinaApi for a city and returns them as a CovidRules class
@@ -45,13 +232,8 @@ def get_covid_rules(district_id: str) -> CovidRules or None:
     :return: CovidRules class, None if we did not get a valid response from the Nina API
     :raises HTTPError:
     """
-    district_id = nina_string_helper.expand_location_id_with_zeros(district_id)
-
     # aktuelle Coronameldungen abrufen nach Gebietscode
-    covid_info_api = "/appdata/covid/covidrules/DE/"
-    response_raw = requests.get(_API_URL + covid_info_api + district_id + ".json")
-
-    response = response_raw.json()
+    response = _get_covid_document(district_id)
 
     rules_list = _get_safely(response, "rules")
 
@@ -97,13 +279,8 @@ def get_covid_infos(district_id: str) -> CovidInfo:
     :return: CovidInfo class
     :raises HTTPError:
     """
-    district_id = nina_string_helper.expand_location_id_with_zeros(district_id)
-
     # aktuelle Coronameldungen abrufen nach Gebietscode
-    covid_info_api = "/appdata/covid/covidrules/DE/"
-
-    response_raw = requests.get(_API_URL + covid_info_api + district_id + ".json")
-    response = response_raw.json()
+    response = _get_covid_document(district_id)
     infektion_danger_level = response["level"]["headline"]
 
     inzidenz_split = str(response["level"]["range"]).split("\n")
@@ -164,17 +341,178 @@ def _translate_time(nina_time: str) -> str:
     return normal_time_string
 
 
-def _poll_general_warning(api_string: str) -> list[GeneralWarning]:
+_snapshot_ttl_in_seconds = data_service.get_config().get("warning_snapshot_ttl_in_seconds", 60)
+"""age up to which a snapshot of a feed is served without refreshing it"""
+
+_snapshot_max_stale_in_seconds = data_service.get_config().get("warning_snapshot_max_stale_in_seconds", 600)
+"""age up to which an expired snapshot is still served while it is refreshed in the background"""
+
+_snapshots = {}
+"""dictionary api_string: str -> (time of the fetch : float, warnings of the feed : list[GeneralWarning])"""
+
+_snapshots_in_flight = {}
+"""dictionary api_string: str -> threading.Event, set when the running fetch of the feed is done"""
+
+_snapshot_statistics = {"hits": 0, "stale_hits": 0, "fetches": 0, "waits": 0, "errors": 0}
+
+_SNAPSHOT_LOCK = threading.Lock()
+
+
+def _fetch_snapshot(api_string: str, done: threading.Event) -> list[GeneralWarning]:
+    """
+    Fetches the feed and stores the result in _snapshots. Callers waiting for done are woken up in any case.
+    :param api_string: the string for the exact api we poll for
+    :param done: event of the fetch in _snapshots_in_flight
+    :return: the warnings of the feed
+    :raises HTTPError:
+    """
+    try:
+        warnings = _fetch_general_warning(api_string)
+        with _SNAPSHOT_LOCK:
+            _snapshots[api_string] = (time.monotonic(), warnings)
+            _snapshot_statistics["fetches"] += 1
+        return warnings
+    except Exception:
+        with _SNAPSHOT_LOCK:
+            _snapshot_statistics["errors"] += 1
+        raise
+    finally:
+        with _SNAPSHOT_LOCK:
+            del _snapshots_in_flight[api_string]
+        done.set()
+
+
+def _refresh_snapshot_in_background(api_string: str, done: threading.Event):
+    """
+    Fetches the feed in a daemon thread, errors are printed and the old snapshot is kept
+    :param api_string: the string for the exact api we poll for
+    :param done: event of the fetch in _snapshots_in_flight
+    """
+    def refresh():
+        try:
+            _fetch_snapshot(api_string, done)
+        except Exception as e:
+            print("ERROR: refreshing feed " + api_string + " failed\n" + str(e))
+
+    threading.Thread(target=refresh, daemon=True).start()
+
+
+def get_snapshot_statistics() -> dict:
+    """
+    Returns the counters of the warning feed snapshots
+    :return: dictionary with 'hits', 'stale_hits', 'fetches', 'waits' and 'errors'
+    """
+    with _SNAPSHOT_LOCK:
+        return _snapshot_statistics.copy()
+
+
+def _poll_general_warning(api_string: str, allow_stale: bool = True) -> list[GeneralWarning]:
     """
     biwapp, katwarn, mowas, dwd, lhp and police-warnings are all generally the same
-    this is the general method to poll those
+    this is the general method to poll those.
+    The result is shared by all callers for _snapshot_ttl_in_seconds. Only one fetch per feed runs at a time,
+    concurrent callers wait for it. An expired snapshot is served while it is refreshed in the background,
+    until it is older than _snapshot_max_stale_in_seconds.
     :param api_string: the string for the exact api we poll for
+    :param allow_stale: if False, an expired snapshot is not served, the caller waits for the fetch instead
     :return: a list of all warnings that are actual. An empty list is returned if there are none
     :raises HTTPError:
     """
-    response_raw = requests.get(_API_URL + api_string)
-    response = response_raw.json()
+    while True:
+        with _SNAPSHOT_LOCK:
+            snapshot = _snapshots.get(api_string)
+            age = time.monotonic() - snapshot[0] if snapshot is not None else None
+            if age is not None and age < _snapshot_ttl_in_seconds:
+                _snapshot_statistics["hits"] += 1
+                return list(snapshot[1])
+
+            done = _snapshots_in_flight.get(api_string)
+            start_fetch = done is None
+            if start_fetch:
+                done = threading.Event()
+                _snapshots_in_flight[api_string] = done
+
+            if allow_stale and age is not None and age < _snapshot_max_stale_in_seconds:
+                _snapshot_statistics["stale_hits"] += 1
+                if start_fetch:
+                    _refresh_snapshot_in_background(api_string, done)
+                return list(snapshot[1])
+
+            if not start_fetch:
+                _snapshot_statistics["waits"] += 1
+
+        if start_fetch:
+            return list(_fetch_snapshot(api_string, done))
 
+        # another caller is fetching the feed, use its result (or fetch again if it failed)
+        done.wait()
+
+
+_feed_validators = {}
+"""dictionary api_string: str -> {'etag', 'last_modified', 'size', 'warnings'} of the last full response of the feed"""
+
+_conditional_request_statistics = {}
+"""dictionary api_string: str -> {'200', '304', 'bytes_saved'}"""
+
+_FEED_VALIDATORS_LOCK = threading.Lock()
+
+
+def get_conditional_request_statistics() -> dict:
+    """
+    Returns how often each feed was downloaded (200) or unchanged (304) and how many bytes the 304 responses saved
+    :return: dictionary api_string -> {'200', '304', 'bytes_saved'}
+    """
+    with _FEED_VALIDATORS_LOCK:
+        return {feed: statistics.copy() for feed, statistics in _conditional_request_statistics.items()}
+
+
+def _fetch_general_warning(api_string: str) -> list[GeneralWarning]:
+    """
+    Fetches and parses the warnings of a feed from the Nina API.
+    The request is conditional (If-None-Match / If-Modified-Since) if the feed was fetched before, on 304 Not Modified
+    the previously parsed warnings are reused.
+    :param api_string: the string for the exact api we poll for
+    :return: a list of all warnings that are actual. An empty list is returned if there are none
+    :raises HTTPError:
+    """
+    with _FEED_VALIDATORS_LOCK:
+        validators = _feed_validators.get(api_string)
+        statistics = _conditional_request_statistics.setdefault(api_string, {"200": 0, "304": 0, "bytes_saved": 0})
+
+    headers = {}
+    if validators is not None:
+        if validators["etag"] is not None:
+            headers["If-None-Match"] = validators["etag"]
+        if validators["last_modified"] is not None:
+            headers["If-Modified-Since"] = validators["last_modified"]
+
+    response_raw = _get(api_string, api_string, headers)
+    if response_raw.status_code == 304 and validators is not None:
+        with _FEED_VALIDATORS_LOCK:
+            statistics["304"] += 1
+            statistics["bytes_saved"] += validators["size"]
+        return list(validators["warnings"])
+
+    warning_list = _parse_general_warnings(response_raw.json())
+    _set_known_warning_versions(api_string, warning_list)
+    with _FEED_VALIDATORS_LOCK:
+        statistics["200"] += 1
+        etag = response_raw.headers.get("ETag")
+        last_modified = response_raw.headers.get("Last-Modified")
+        if etag is None and last_modified is None:
+            _feed_validators.pop(api_string, None)
+        else:
+            _feed_validators[api_string] = {"etag": etag, "last_modified": last_modified,
+                                            "size": len(response_raw.content), "warnings": list(warning_list)}
+    return warning_list
+
+
+def _parse_general_warnings(response) -> list[GeneralWarning]:
+    """
+    Parses the response of a mapData feed
+    :param response: the decoded json response
+    :return: a list of all warnings that are actual. An empty list is returned if there are none
+    """
     warning_list = []
 
     if response is None:
@@ -195,64 +533,85 @@ def _poll_general_warning(api_string: str) -> list[GeneralWarning]:
     return warning_list
 
 
-def poll_biwapp_warning() -> list[GeneralWarning]:
+def _set_known_warning_versions(api_string: str, warning_list: list[GeneralWarning]):
+    """
+    Replaces the known versions of the warnings of a feed with the versions of its current warnings, the warnings that
+    are not in the feed anymore are forgotten
+    :param api_string: the string for the exact api we polled
+    :param warning_list: the current warnings of the feed
+    """
+    current_versions = {warning.id: warning.version for warning in warning_list}
+    with _KNOWN_WARNING_VERSIONS_LOCK:
+        for warning_id in _warning_ids_of_feed.get(api_string, set()) - current_versions.keys():
+            _known_warning_versions.pop(warning_id, None)
+        _known_warning_versions.update(current_versions)
+        _warning_ids_of_feed[api_string] = set(current_versions)
+
+
+def poll_biwapp_warning(allow_stale: bool = True) -> list[GeneralWarning]:
     """
     polls the current biwap warnings
+    :param allow_stale: if False, an expired snapshot of the feed is not served
     :return: a list of GeneralWarnings, list ist empty if there are no current warnings
     :raises HTTPError:
     """
     biwapp_api = "/biwapp/mapData.json"
-    return _poll_general_warning(biwapp_api)
+    return _poll_general_warning(biwapp_api, allow_stale)
 
 
-def poll_katwarn_warning() -> list[GeneralWarning]:
+def poll_katwarn_warning(allow_stale: bool = True) -> list[GeneralWarning]:
     """
     polls the current katwarn warnings
+    :param allow_stale: if False, an expired snapshot of the feed is not served
     :return: a list of GeneralWarnings, list ist empty if there are no current warnings
     :raises HTTPError:
     """
     katwarn_api = "/katwarn/mapData.json"
-    return _poll_general_warning(katwarn_api)
+    return _poll_general_warning(katwarn_api, allow_stale)
 
 
-def poll_mowas_warning() -> list[GeneralWarning]:
+def poll_mowas_warning(allow_stale: bool = True) -> list[GeneralWarning]:
     """
     polls the current mowas warnings
+    :param allow_stale: if False, an expired snapshot of the feed is not served
     :return: a list of GeneralWarnings, list ist empty if there are no current warnings
     :raises HTTPError:
     """
     mowas_api = "/mowas/mapData.json"
-    return _poll_general_warning(mowas_api)
+    return _poll_general_warning(mowas_api, allow_stale)
 
 
-def poll_dwd_warning() -> list[GeneralWarning]:
+def poll_dwd_warning(allow_stale: bool = True) -> list[GeneralWarning]:
     """
     polls the current dwd warnings
+    :param allow_stale: if False, an expired snapshot of the feed is not served
     :return: a list of GeneralWarnings, list ist empty if there are no current warnings
     :raises HTTPError:
     """
     dwd_api = "/dwd/mapData.json"
-    return _poll_general_warning(dwd_api)
+    return _poll_general_warning(dwd_api, allow_stale)
 
 
-def poll_lhp_warning() -> list[GeneralWarning]:
+def poll_lhp_warning(allow_stale: bool = True) -> list[GeneralWarning]:
     """
     polls the current lhp warnings
+    :param allow_stale: if False, an expired snapshot of the feed is not served
     :return: a list of GeneralWarnings, list ist empty if there are no current warnings
     :raises HTTPError:
     """
     lhp_api = "/lhp/mapData.json"
-    return _poll_general_warning(lhp_api)
+    return _poll_general_warning(lhp_api, allow_stale)
 
 
-def poll_police_warning() -> list[GeneralWarning]:
+def poll_police_warning(allow_stale: bool = True) -> list[GeneralWarning]:
     """
     polls the current police warnings
+    :param allow_stale: if False, an expired snapshot of the feed is not served
     :return: a list of GeneralWarnings, list ist empty if there are no current warnings
     :raises HTTPError:
     """
     police_api = "/police/mapData.json"
-    return _poll_general_warning(police_api)
+    return _poll_general_warning(police_api, allow_stale)
 
 
 @dataclass
@@ -336,17 +695,75 @@ def _get_detailed_warning_infos(response_infos, language: str) -> DetailedWarnin
     return None
 
 
-def get_detailed_warning(warning_id: str, language: str = "de") -> DetailedWarning:
+_DETAILED_WARNING_CACHE_SIZE = 512
+"""number of DetailedWarnings and of DetailedWarningGeos kept in memory"""
+
+_known_warning_versions = {}
+"""dictionary warning_id: str -> version of the warning in the last poll of its feed : int"""
+
+_warning_ids_of_feed = {}
+"""dictionary api_string: str -> ids of the warnings in the last poll of the feed : set[str]"""
+
+_KNOWN_WARNING_VERSIONS_LOCK = threading.Lock()
+
+
+def _get_cache_statistics(cached_function) -> dict:
     """
-    This method should be called after a warning with one of the poll_****_warning methods was received
+    Args:
+        cached_function: function wrapped with functools.lru_cache
+    Returns:
+        dict with the counters of the cache of cached_function
+    """
+    cache_info = cached_function.cache_info()
+    return {"hits": cache_info.hits, "misses": cache_info.misses, "size": cache_info.currsize,
+            "max_size": cache_info.maxsize}
+
+
+def get_detailed_warning_cache_statistics() -> dict:
+    """
+    Returns:
+        dict 'detailed_warning' and 'detailed_warning_geo' -> {'hits', 'misses', 'size', 'max_size'}
+    """
+    return {"detailed_warning": _get_cache_statistics(_get_detailed_warning_of_version),
+            "detailed_warning_geo": _get_cache_statistics(_get_detailed_warning_geo_of_version)}
+
+
+def get_detailed_warning(warning_id: str, language: str = "de", version: int = None) -> DetailedWarning:
+    """
+    This method should be called after a warning with one of the poll_****_warning methods was received.
+    Each version of a warning is only fetched once per language, a new version is fetched again.
     Args:
         warning_id: warning id is extracted from the poll_****_warning method return type: GeneralWarning.id
         language: what language will be returned
+        version: GeneralWarning.version of the warning, if None the version of the last poll is used
     Returns:
          the detailed Warning as a DetailedWarning class
     Raises: HTTPError
     """
-    response_raw = requests.get(_API_URL + "/warnings/" + warning_id + ".json")
+    if version is None:
+        version = _known_warning_versions.get(warning_id)
+    if version is None:
+        # the warning was not polled, so there is no version to check the cached warning with
+        return _fetch_detailed_warning(warning_id, language)
+    return _get_detailed_warning_of_version(warning_id, version, language)
+
+
+@functools.lru_cache(maxsize=_DETAILED_WARNING_CACHE_SIZE)
+def _get_detailed_warning_of_version(warning_id: str, version: int, language: str) -> DetailedWarning:
+    return _fetch_detailed_warning(warning_id, language)
+
+
+def _fetch_detailed_warning(warning_id: str, language: str) -> DetailedWarning:
+    """
+    Fetches the detailed warning from the Nina API
+    Args:
+        warning_id: warning id is extracted from the poll_****_warning method return type: GeneralWarning.id
+        language: what language will be returned
+    Returns:
+         the detailed Warning as a DetailedWarning class
+    Raises: HTTPError
+    """
+    response_raw = _get("/warnings/" + warning_id + ".json", "/warnings/{id}.json")
     response = response_raw.json()
 
     id_response = _get_safely(response, "identifier")
@@ -378,11 +795,13 @@ class DetailedWarningGeo:
     affected_areas: list[GeoCoordinates]
 
 
-def get_detailed_warning_geo(warning_id: str) -> DetailedWarningGeo:
+def get_detailed_warning_geo(warning_id: str, version: int = None) -> DetailedWarningGeo:
     """
-    This method should be called after a warning with one of the poll_****_warning methods was received
+    This method should be called after a warning with one of the poll_****_warning methods was received.
+    Each version of a warning is only fetched once, a new version is fetched again.
     Args:
         warning_id: warning id is extracted from the poll_****_warning method return type: GeneralWarning.id
+        version: GeneralWarning.version of the warning, if None the version of the last poll is used
 
     Returns:
         the detailed Warning as a geojson
@@ -390,7 +809,32 @@ def get_detailed_warning_geo(warning_id: str) -> DetailedWarningGeo:
     Raises:
          HTTPError:
     """
-    response_raw = requests.get(_API_URL + "/warnings/" + warning_id + ".geojson")
+    if version is None:
+        version = _known_warning_versions.get(warning_id)
+    if version is None:
+        # the warning was not polled, so there is no version to check the cached warning with
+        return _fetch_detailed_warning_geo(warning_id)
+    return _get_detailed_warning_geo_of_version(warning_id, version)
+
+
+@functools.lru_cache(maxsize=_DETAILED_WARNING_CACHE_SIZE)
+def _get_detailed_warning_geo_of_version(warning_id: str, version: int) -> DetailedWarningGeo:
+    return _fetch_detailed_warning_geo(warning_id)
+
+
+def _fetch_detailed_warning_geo(warning_id: str) -> DetailedWarningGeo:
+    """
+    Fetches the geojson of the detailed warning from the Nina API
+    Args:
+        warning_id: warning id is extracted from the poll_****_warning method return type: GeneralWarning.id
+
+    Returns:
+        the detailed Warning as a geojson
+
+    Raises:
+         HTTPError:
+    """
+    response_raw = _get("/warnings/" + warning_id + ".geojson", "/warnings/{id}.geojson")
     response = response_raw.json()
 
     features = _get_safely(response, "features")
@@ -448,15 +892,86 @@ def call_general_warning(warning: WarningCategory) -> list[GeneralWarning]:
     return _call_general_warning_map[warning]()
 
 
-def get_all_active_warnings() -> list[tuple[GeneralWarning, WarningCategory]]:
+_feeds_of_warning_category = {
+    WarningCategory.WEATHER: [poll_dwd_warning],
+    WarningCategory.FLOOD: [poll_lhp_warning],
+    WarningCategory.CIVIL_PROTECTION: [poll_biwapp_warning, poll_mowas_warning, poll_katwarn_warning,
+                                       poll_police_warning],
+}
+
+_warning_id_prefix_of_feed = {
+    "poll_dwd_warning": "dwd.",
+    "poll_lhp_warning": "lhp.",
+    "poll_biwapp_warning": "biw.",
+    "poll_mowas_warning": "mow.",
+    "poll_katwarn_warning": "kat.",
+    "poll_police_warning": "pol.",
+}
+"""dictionary feed: str -> prefix of the ids of the warnings of the feed : str"""
+
+_feed_executor = ThreadPoolExecutor(max_workers=6, thread_name_prefix="nina_feed")
+"""thread pool polling the mapData feeds of get_all_active_warnings concurrently"""
+
+_feed_errors = {}
+"""dictionary feed: str -> error of the last poll of the feed : str, only contains feeds whose last poll failed"""
+
+_FEED_ERRORS_LOCK = threading.Lock()
+
+
+def get_feed_errors() -> dict:
+    """
+    Returns the feeds whose last poll in get_all_active_warnings failed
+    :return: dictionary feed name -> error message
+    """
+    with _FEED_ERRORS_LOCK:
+        return _feed_errors.copy()
+
+
+def get_feed_of_warning(warning_id: str) -> str or None:
+    """
+    Returns the feed a warning is polled from, derived from the prefix of its id
+    :param warning_id: id of the warning
+    :return: feed name as in get_feed_errors() or None if the prefix belongs to no known feed
     """
+    for feed, prefix in _warning_id_prefix_of_feed.items():
+        if warning_id.startswith(prefix):
+            return feed
+    return None
+
+
+def get_all_active_warnings(failed_feeds: set = None) -> list[tuple[GeneralWarning, WarningCategory]]:
+    """
+    Polls all feeds concurrently. If a feed fails, its error is printed and kept in get_feed_errors() and the
+    warnings of all other feeds are still returned. Expired snapshots are not served, so the periodic jobs always work
+    on warnings younger than warning_snapshot_ttl_in_seconds.
+
+    Args:
+        failed_feeds: optional set the names of the feeds that failed in this call are added to. get_feed_errors() is
+                      shared by all callers and only meant for reporting
 
     Returns: List of tuples consisting of GeneralWarning and WarningCategory
 
     """
-    warnings = []
+    polls = []
     for warn_type in WarningCategory:
-        for warning in call_general_warning(warn_type):
+        for poll_feed in _feeds_of_warning_category.get(warn_type, []):
+            polls.append((warn_type, poll_feed.__name__, _feed_executor.submit(poll_feed, allow_stale=False)))
+
+    warnings = []
+    for (warn_type, feed, future) in polls:
+        try:
+            feed_warnings = future.result()
+        except Exception as e:
+            print("ERROR: polling feed " + feed + " failed\n" + str(e))
+            with _FEED_ERRORS_LOCK:
+                _feed_errors[feed] = str(e)
+            if failed_feeds is not None:
+                failed_feeds.add(feed)
+            continue
+
+        with _FEED_ERRORS_LOCK:
+            _feed_errors.pop(feed, None)
+        for warning in feed_warnings:
             warnings.append((warning, warn_type))
 
     return warnings
@@ -1,3 +1,6 @@
+import re
+
+
 def find_specific(s: str, index: int, sub_str: str) -> bool:
     """
     searches in string s, starting at index, if the next characters are sub_str
@@ -31,6 +34,9 @@ def extract_till_char(s: str, index: int, stop_char: str) -> str:
     return extracted_string
 
 
+_HTML_TOKEN_PATTERN = re.compile(r'<|>|/p|br|href=')
+"""every position filter_html_tags reacts to, all other characters are only copied (or skipped inside of tags)"""
+
 def filter_html_tags(s: str) -> str:
     """
     filters html tags from the string s.
@@ -46,21 +52,35 @@ def filter_html_tags(s: str) -> str:
 
     &nbsp; (== nonbreaking space) replaced with space
 
+    The string is read once: only the positions found by _HTML_TOKEN_PATTERN are looked at one by one, the text
+    between them is copied as a whole. The descriptions of warnings are only filtered once per version, the filtered
+    text is cached with the DetailedWarning (see nina_service.get_detailed_warning).
+
     Arguments:
         s: String that will be filtered. Has to be valid html code.
     Returns:
         Filtered String
     """
-    # return s
-    filtered_string = ""
+    filtered_parts = []
     opened_brackets_counter = 0
 
     link = ""  # brauchen wir um hlinks aus den html tags rauszukopieren, da wir diese eigentlich insgesamt löschen
     in_text = False
 
     s = s.replace("&nbsp;", " ")
+    length = len(s)
+    next_index = 0  # first index that was not handled yet
+
+    for token in _HTML_TOKEN_PATTERN.finditer(s):
+        i = token.start()
+
+        # plain characters before the token
+        if next_index < i and opened_brackets_counter == 0:
+            filtered_parts.append(s[next_index:i])
+            if len(link) != 0 and s[i] == "<" and in_text:
+                filtered_parts.append(": " + link)
+                link = ""
 
-    for i in range(0, len(s)):
         c = s[i]
 
         if c == '<':
@@ -68,25 +88,31 @@ def filter_html_tags(s: str) -> str:
             opened_brackets_counter += 1
 
         if opened_brackets_counter == 0:
-            filtered_string += c
-            if len(link) != 0 and i + 1 < len(s) and s[i + 1] == "<" and in_text:
-                filtered_string += ": " + link
+            filtered_parts.append(c)
+            if len(link) != 0 and i + 1 < length and s[i + 1] == "<" and in_text:
+                filtered_parts.append(": " + link)
                 link = ""
 
-        if find_specific(s, i, "/p"):
-            filtered_string += '\n'
-
-        if not in_text and find_specific(s, i, "br"):
-            filtered_string += '\n'
-
-        if find_specific(s, i, "href="):
-            link = extract_till_char(s, i + len("href=\""), '"')
-
-        if c == '>':
+        if c == '/':  # "/p"
+            filtered_parts.append('\n')
+        elif c == 'b':  # "br"
+            if not in_text:
+                filtered_parts.append('\n')
+        elif c == 'h':  # "href="
+            link_start = i + len("href=\"")
+            link_end = s.find('"', link_start)
+            link = s[link_start:] if link_end == -1 else s[link_start:link_end]
+        elif c == '>':
             opened_brackets_counter -= 1
             in_text = True
 
-    return filtered_string
+        # the other characters of "/p", "br" and "href=" are plain characters
+        next_index = i + 1
+
+    if next_index < length and opened_brackets_counter == 0:
+        filtered_parts.append(s[next_index:])
+
+    return "".join(filtered_parts)
 
 
 def expand_location_id_with_zeros(location_id: str) -> str:
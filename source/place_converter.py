@@ -1,12 +1,18 @@
+import heapq
+import threading
+import time
+from collections import Counter, OrderedDict
+from types import MappingProxyType
 from typing import List, Union, Any, Tuple
 
-import requests
 import shapely
-from fuzzywuzzy import process
+from fuzzywuzzy import process, utils
 import geopy
 from geopy.geocoders import Nominatim
 from shapely.geometry import Polygon
 
+import reference_data
+
 # District => Kreis
 # Place => Ort
 # Places are needed for everything besides Covid info
@@ -21,79 +27,352 @@ _places_dictionary = {}
 """dictionary place_id : str -> place_name : str"""
 
 _postal_code_dictionary = {}
-"""dictionary postal_code: str -> [place_name : str, district_id : str, polygon_area : list[[float, float]]]"""
+"""dictionary postal_code: str -> [place_name : str, district_id : str, polygon_area : list[[float, float]]],
+polygon_area is a read only numpy array of the points if the reference data were read from the snapshot"""
 
 _postal_place_dictionary = {}
 """dictionary postal_code: str -> place_name : str"""
 
+_postal_code_tree = None
+"""shapely.STRtree of the polygon areas of all postal codes in _postal_code_list"""
+
+_postal_code_list = []
+"""list postal_code : str sorted, index i is the dense index of the postal code and of its geometry in _postal_code_tree"""
+
+_postal_code_indices = {}
+"""dictionary postal_code: str -> dense index : int (position in _postal_code_list)"""
+
+_district_ids_by_name = {}
+"""dictionary district_name : str -> district ids : list[str] in the order of _districts_dictionary"""
+
+_place_ids_by_name = {}
+"""dictionary place_name : str -> place ids : list[str] in the order of _places_dictionary"""
+
+_postal_codes_by_place_name = {}
+"""dictionary place_name : str -> postal codes : list[str] in the order of _postal_place_dictionary"""
+
+_SUGGESTION_CANDIDATE_LIMIT = 500
+"""number of names with the most shared trigrams that are scored by fuzzywuzzy for a suggestion request"""
+
+_trigram_indices = {}
+"""dictionary name of the dictionary : str -> trigram index (see _build_trigram_index)"""
+
+_SUGGESTION_CACHE_SIZE = 1024
+"""number of normalized queries whose suggestions are kept in memory"""
+
+_suggestion_cache = OrderedDict()
+"""dictionary (function name : str, normalized query : str, suggestion_limit : int) -> suggestions : tuple of read only
+dicts, least recently used first"""
+
+_suggestion_cache_statistics = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+_SUGGESTION_CACHE_LOCK = threading.Lock()
 
-def _fill_districts_dict() -> None:
+_REFERENCE_DATA_SNAPSHOT_PATH = "../source/data/reference_data.bin"
+"""snapshot of the districts, places and postal code areas, see reference_data.py"""
+
+_reference_data_statistics = {"created_at": 0.0, "refreshes": 0, "refresh_errors": 0}
+
+_REFERENCE_DATA_STATISTICS_LOCK = threading.Lock()
+
+
+def _build_name_index(dictionary: dict) -> dict:
     """
-    Fills the _districts_dictionary dictionary with selected infos from
-    https://warnung.bund.de/assets/json/converted_corona_kreise.json
-    Format: district_id -> district_name
+    Builds the reverse multimap of the given dictionary
+
+    Arguments:
+        dictionary (dict): dictionary id : str -> name : str
+    Returns:
+        name_index (dict): dictionary name : str -> ids : list[str] in the order of the given dictionary
     """
-    converted_covid_districts = requests.get('https://warnung.bund.de/assets/json/converted_corona_kreise.json').json()
-    for district_id, district_description in converted_covid_districts.items():
-        _districts_dictionary[district_id] = district_description["n"]
+    name_index = {}
+    for key, name in dictionary.items():
+        name_index.setdefault(name, []).append(key)
+    return name_index
 
 
-_fill_districts_dict()
+def _build_postal_code_tree(postal_code_dictionary: dict) -> tuple:
+    """
+    Assigns every postal code a dense index (in sorted order) and builds a spatial index of the polygon areas
 
+    Arguments:
+        postal_code_dictionary (dict): postal_code : str -> [place_name, district_id, polygon_area]
+    Returns:
+        (tree, postal_code_list, postal_code_indices) (tuple): see _postal_code_tree, _postal_code_list and
+        _postal_code_indices
+    """
+    postal_codes = sorted(postal_code_dictionary)
+    polygons = [shapely.Polygon(postal_code_dictionary[postal_code][2]) for postal_code in postal_codes]
+    postal_code_indices = {postal_code: index for index, postal_code in enumerate(postal_codes)}
+    return shapely.STRtree(polygons), postal_codes, postal_code_indices
 
-def _fill_places_dict() -> None:
+
+def _normalize_name(name: str) -> str:
     """
-    Fills the _places_dictionary dictionary with selected infos from
-    https://www.xrepository.de/api/xrepository/urn:de:bund:destatis:bevoelkerungsstatistik:schluessel:rs_2021-07-31
-    /download/Regionalschl_ssel_2021-07-31.json
-    Format: place_id -> place_name
+    Returns the given name normalized like fuzz.WRatio does it before scoring: non ascii characters (umlauts and ß) are
+    removed, other characters that are no letters or digits become spaces, then it is lower cased and trimmed
+
+    Arguments:
+        name (str): the given name
+    Returns:
+        normalized_name (str): the normalized name, two names with the same normalized name get the same scores
     """
-    bevoelkerungsstaat_key = requests.get(
-        'https://www.xrepository.de/api/xrepository/urn:de:bund:destatis:bevoelkerungsstatistik:schluessel:rs_2021-07'
-        '-31/download/Regionalschl_ssel_2021-07-31.json').json()
-    for area_triple in bevoelkerungsstaat_key['daten']:
-        if area_triple[2] is None:
-            _places_dictionary[area_triple[0]] = area_triple[1]
-        else:
-            possible_district_id = area_triple[0][0:5]
-            try:
-                _districts_dictionary[possible_district_id]
-            except KeyError:
-                pass
-            else:
-                _places_dictionary[area_triple[0]] = area_triple[1]
+    return utils.full_process(name, force_ascii=True)
 
 
-_fill_places_dict()
+def _get_trigrams(words: list[str]) -> set[str]:
+    """
+    Returns the trigrams of the given normalized words, every word is padded with spaces so that short words and word
+    beginnings get trigrams too
+
+    Arguments:
+        words (list[str]): the words of a name after _normalize_name
+    Returns:
+        trigrams (set[str]): set of trigrams, empty if there are no words
+    """
+    trigrams = set()
+    for word in words:
+        padded_word = " " + word + " "
+        for i in range(len(padded_word) - 2):
+            trigrams.add(padded_word[i:i + 3])
+    return trigrams
 
 
-def _fill_postal_code_dict() -> None:
+def _build_trigram_index(dictionary: dict) -> dict:
     """
-    Fills the _postal_code_dictionary dictionary with selected infos from
-    https://public.opendatasoft.com/api/records/1.0/search/?dataset=georef-germany-postleitzahl&q=&rows=-1
-    Format: postal_code : str -> [place_name : str, district_id : str, polygon_area : list[[float, float]]]
+    Builds inverted indices from the trigrams and from the words of the names in the given dictionary to the positions
+    of their keys
+
+    Arguments:
+        dictionary (dict): dictionary id : str -> name : str
+    Returns:
+        trigram_index (dict): {'keys': list[str], 'trigram_counts': list[int],
+        'trigrams': dict trigram : str -> list[int], 'words': dict word : str -> list[int]}
     """
-    postal_code_table = requests.get(
-        'https://public.opendatasoft.com/api/records/1.0/search/?dataset=georef-germany-postleitzahl&q=&rows=-1').json()
-    for record in postal_code_table['records']:
-        _postal_code_dictionary[record['fields']['plz_code']] = [record['fields']['plz_name'],
-                                                                 record['fields']['krs_code'],
-                                                                 record['fields']['geometry']['coordinates'][0]]
+    keys = list(dictionary)
+    trigram_counts = []
+    trigrams = {}
+    words = {}
+    for position, key in enumerate(keys):
+        words_of_name = set(_normalize_name(dictionary[key]).split())
+        trigrams_of_name = _get_trigrams(words_of_name)
+        trigram_counts.append(len(trigrams_of_name))
+        for trigram in trigrams_of_name:
+            trigrams.setdefault(trigram, []).append(position)
+        for word in words_of_name:
+            words.setdefault(word, []).append(position)
+    return {'keys': keys, 'trigram_counts': trigram_counts, 'trigrams': trigrams, 'words': words}
 
 
-_fill_postal_code_dict()
+def _clear_suggestion_cache() -> None:
+    """
+    Removes all cached suggestions, has to be called whenever the dictionaries are filled again
+    """
+    with _SUGGESTION_CACHE_LOCK:
+        _suggestion_cache.clear()
+        _suggestion_cache_statistics["invalidations"] += 1
 
 
-def _fill_postal_place_dict() -> None:
+def _set_reference_data(districts: dict, places: dict, postal_codes: dict, created_at: float) -> None:
     """
-    Fills the _postal_name_dictionary dictionary with selected infos from _postal_code_dictionary
-    Format: postal_code : str -> place_name : str
+    Builds all indices for the given reference data and then replaces the dictionaries and indices in use at once,
+    cached suggestions of the previous reference data are removed
+
+    Arguments:
+        districts (dict): district_id : str -> district_name : str
+        places (dict): place_id : str -> place_name : str
+        postal_codes (dict): postal_code : str -> [place_name, district_id, polygon_area]
+        created_at (float): unix time of the download of the reference data
+    """
+    global _districts_dictionary, _places_dictionary, _postal_code_dictionary, _postal_place_dictionary, \
+        _district_ids_by_name, _place_ids_by_name, _postal_codes_by_place_name, \
+        _postal_code_tree, _postal_code_list, _postal_code_indices, _trigram_indices
+    postal_places = {postal_code: record[0] for postal_code, record in postal_codes.items()}
+    district_ids_by_name, place_ids_by_name, postal_codes_by_place_name = \
+        _build_name_index(districts), _build_name_index(places), _build_name_index(postal_places)
+    tree, postal_code_list, postal_code_indices = _build_postal_code_tree(postal_codes)
+    trigram_indices = {'places': _build_trigram_index(places),
+                       'postal_places': _build_trigram_index(postal_places),
+                       'districts': _build_trigram_index(districts)}
+
+    _districts_dictionary, _places_dictionary, _postal_code_dictionary, _postal_place_dictionary = \
+        districts, places, postal_codes, postal_places
+    _district_ids_by_name, _place_ids_by_name, _postal_codes_by_place_name = \
+        district_ids_by_name, place_ids_by_name, postal_codes_by_place_name
+    _postal_code_tree, _postal_code_list, _postal_code_indices = tree, postal_code_list, postal_code_indices
+    _trigram_indices = trigram_indices
+    with _REFERENCE_DATA_STATISTICS_LOCK:
+        _reference_data_statistics["created_at"] = created_at
+    _clear_suggestion_cache()
+
+
+def _download_reference_data() -> None:
+    """
+    Downloads the reference data, stores them in the snapshot at _REFERENCE_DATA_SNAPSHOT_PATH and uses them
+    """
+    created_at = time.time()
+    districts, places, postal_codes = reference_data.download_reference_data()
+    try:
+        reference_data.write_snapshot(_REFERENCE_DATA_SNAPSHOT_PATH, districts, places, postal_codes, created_at)
+    except OSError as e:
+        print("ERROR: writing the reference data snapshot failed\n" + str(e))
+    _set_reference_data(districts, places, postal_codes, created_at)
+
+
+def _load_reference_data() -> None:
+    """
+    Uses the reference data of the snapshot at _REFERENCE_DATA_SNAPSHOT_PATH, they are downloaded if there is no
+    readable snapshot
+    """
+    try:
+        created_at, districts, places, postal_codes = reference_data.read_snapshot(_REFERENCE_DATA_SNAPSHOT_PATH)
+    except (OSError, ValueError) as e:
+        print("Downloading the reference data, the snapshot could not be read: " + str(e))
+        _download_reference_data()
+    else:
+        _set_reference_data(districts, places, postal_codes, created_at)
+
+
+_load_reference_data()
+
+
+def get_reference_data_statistics() -> dict:
+    """
+    Returns:
+        statistics (dict): dictionary with 'created_at' (unix time of the download of the reference data in use),
+        'refreshes' and 'refresh_errors'
+    """
+    with _REFERENCE_DATA_STATISTICS_LOCK:
+        return _reference_data_statistics.copy()
+
+
+def _refresh_reference_data_loop(interval_in_seconds: float) -> None:
+    """
+    Downloads the reference data again whenever the reference data in use are older than interval_in_seconds
+    """
+    while True:
+        with _REFERENCE_DATA_STATISTICS_LOCK:
+            age_in_seconds = time.time() - _reference_data_statistics["created_at"]
+        time.sleep(max(interval_in_seconds - age_in_seconds, 0))
+        try:
+            _download_reference_data()
+            with _REFERENCE_DATA_STATISTICS_LOCK:
+                _reference_data_statistics["refreshes"] += 1
+        except Exception as e:
+            with _REFERENCE_DATA_STATISTICS_LOCK:
+                _reference_data_statistics["refresh_errors"] += 1
+            print("ERROR: refreshing the reference data failed\n" + str(e))
+            time.sleep(min(interval_in_seconds, 3600))
+
+
+def init_reference_data_refresh(interval_in_seconds: float) -> None:
+    """
+    Starts refreshing the reference data in the background, the suggestions are answered from the previous reference
+    data until the new ones are ready
+
+    Arguments:
+        interval_in_seconds (float): maximum age of the reference data, 0 to not refresh them
+    """
+    if interval_in_seconds <= 0:
+        return
+    refresh_thread = threading.Thread(target=_refresh_reference_data_loop, args=(interval_in_seconds,), daemon=True)
+    refresh_thread.start()
+
+
+def get_suggestion_cache_statistics() -> dict:
+    """
+    Returns the counters of the suggestion cache
+
+    Returns:
+        statistics (dict): dictionary with 'hits', 'misses', 'evictions', 'invalidations', 'size' and 'hit_rate'
+    """
+    with _SUGGESTION_CACHE_LOCK:
+        statistics = _suggestion_cache_statistics.copy()
+        statistics["size"] = len(_suggestion_cache)
+    requests_count = statistics["hits"] + statistics["misses"]
+    statistics["hit_rate"] = statistics["hits"] / requests_count if requests_count else 0.0
+    return statistics
+
+
+def _get_cached_suggestions(get_suggestions, given_string: str, suggestion_limit: int) -> tuple:
+    """
+    Returns the suggestions of get_suggestions for the normalized given string from the suggestion cache, they are
+    computed and cached if they are not cached yet
+
+    Arguments:
+        get_suggestions (function): function (normalized_string : str, suggestion_limit : int) -> list[dict]
+        given_string (str): the given name or postal code
+        suggestion_limit (int): limits the number of suggestions to the top x
+    Returns:
+        suggestions (tuple): tuple of read only dicts (MappingProxyType), shared between all callers
+    """
+    normalized_string = _normalize_name(given_string)
+    key = (get_suggestions.__name__, normalized_string, suggestion_limit)
+    with _SUGGESTION_CACHE_LOCK:
+        suggestions = _suggestion_cache.get(key)
+        if suggestions is not None:
+            _suggestion_cache.move_to_end(key)
+            _suggestion_cache_statistics["hits"] += 1
+            return suggestions
+        _suggestion_cache_statistics["misses"] += 1
+        invalidations = _suggestion_cache_statistics["invalidations"]
+
+    suggestions = tuple(MappingProxyType(suggestion) for suggestion in get_suggestions(normalized_string,
+                                                                                        suggestion_limit))
+    with _SUGGESTION_CACHE_LOCK:
+        if invalidations != _suggestion_cache_statistics["invalidations"]:
+            return suggestions  # computed from the previous dictionaries
+        _suggestion_cache[key] = suggestions
+        _suggestion_cache.move_to_end(key)
+        while len(_suggestion_cache) > _SUGGESTION_CACHE_SIZE:
+            _suggestion_cache.popitem(last=False)
+            _suggestion_cache_statistics["evictions"] += 1
+    return suggestions
+
+
+def _extract_suggestions(name: str, dictionary: dict, index_name: str, suggestion_limit: int) -> list[tuple]:
+    """
+    Returns the same (name, score, id) tuples as process.extract(name, dictionary, limit=suggestion_limit), but only a
+    shortlist of the dictionary is scored: the _SUGGESTION_CANDIDATE_LIMIT names sharing the largest part of their
+    trigrams with the given name and all names sharing a whole word with it (fuzz.WRatio scores those high because of
+    its token set ratios).
+    The shortlist keeps the order of the dictionary, so ties are resolved like in process.extract.
+
+    Arguments:
+        name (str): the given name
+        dictionary (dict): dictionary id : str -> name : str
+        index_name (str): key of the trigram index of the dictionary in _trigram_indices
+        suggestion_limit (int): limits the number of suggestions to the top x
+    Returns:
+        suggestions (list[tuple]): list of (name, score, id) tuples
     """
-    for record in _postal_code_dictionary:
-        _postal_place_dictionary[record] = _postal_code_dictionary[record][0]
+    if len(dictionary) <= 2 * _SUGGESTION_CANDIDATE_LIMIT:
+        # a shortlist would not save much for small dictionaries like _districts_dictionary
+        return process.extract(name, dictionary, limit=suggestion_limit)
+
+    trigram_index = _trigram_indices[index_name]
+    words = set(_normalize_name(name).split())
+    trigrams = _get_trigrams(words)
+    shared_trigram_counts = Counter()
+    for trigram in trigrams:
+        shared_trigram_counts.update(trigram_index['trigrams'].get(trigram, ()))
 
+    if len(shared_trigram_counts) < suggestion_limit:
+        # too few names share a trigram with the given name (e.g. a typo in a short name), score all names
+        return process.extract(name, dictionary, limit=suggestion_limit)
 
-_fill_postal_place_dict()
+    # the share of the trigrams of the shorter name (overlap coefficient) ranks names that contain the given name or
+    # are contained in it high, like the partial ratios of fuzz.WRatio do
+    trigram_counts = trigram_index['trigram_counts']
+    candidate_positions = set(heapq.nlargest(
+        max(_SUGGESTION_CANDIDATE_LIMIT, suggestion_limit), shared_trigram_counts,
+        key=lambda position: shared_trigram_counts[position] / min(len(trigrams), trigram_counts[position])))
+    for word in words:
+        candidate_positions.update(trigram_index['words'].get(word, ()))
+
+    keys = trigram_index['keys']
+    candidates = {keys[position]: dictionary[keys[position]] for position in sorted(candidate_positions)}
+    return process.extract(name, candidates, limit=suggestion_limit)
 
 
 def _get_exact_address_from_coordinates(latitude: float, longitude: float) -> Tuple[str, str]:
@@ -109,6 +388,46 @@ def _get_exact_address_from_coordinates(latitude: float, longitude: float) -> Tu
     return place_name, postal_code
 
 
+def _get_postal_code_of_coordinates(latitude: float, longitude: float) -> Union[str, None]:
+    """
+    Returns the postal code whose area contains the given coordinates, looked up in the _postal_code_tree
+
+    Arguments:
+        latitude (float): latitude of coordinate
+        longitude (float): longitude of coordinate
+    Returns:
+        postal_code (str): the postal code, the smallest one if the coordinates are on the border of several areas,
+        None if the coordinates are outside of all postal code areas
+    """
+    # the polygon areas are stored as [longitude, latitude]
+    indices = _postal_code_tree.query(shapely.Point(longitude, latitude), predicate="intersects")
+    if len(indices) == 0:
+        return None
+    return _postal_code_list[min(indices)]
+
+
+def _get_postal_code_from_coordinates(latitude: float, longitude: float, nominatim_fallback: bool) -> str:
+    """
+    Returns the postal code of the given coordinates from the postal code areas, Nominatim is only asked for
+    coordinates outside of all postal code areas (e.g. on the sea)
+
+    Arguments:
+        latitude (float): latitude of coordinate
+        longitude (float): longitude of coordinate
+        nominatim_fallback (bool): whether Nominatim is asked if the coordinates are outside of all areas
+    Returns:
+        postal_code (str): the postal code
+    Raises:
+        KeyError: if the coordinates are outside of all areas and nominatim_fallback is False
+    """
+    postal_code = _get_postal_code_of_coordinates(latitude, longitude)
+    if postal_code is not None:
+        return postal_code
+    if not nominatim_fallback:
+        raise KeyError((latitude, longitude))
+    return _get_exact_address_from_coordinates(latitude, longitude)[1]
+
+
 def _get_suggestions_for_place_name(place_name: str, suggestion_limit: int) -> list[dict]:
     """
     Returns a list of dicts {'place_name', 'place_id'} with suggestions for the given place name
@@ -119,7 +438,7 @@ def _get_suggestions_for_place_name(place_name: str, suggestion_limit: int) -> l
     Returns:
         similar_places_dicts (list[dict]): list of suggested dicts
     """
-    similar_place_names = process.extract(place_name, _places_dictionary, limit=suggestion_limit)
+    similar_place_names = _extract_suggestions(place_name, _places_dictionary, 'places', suggestion_limit)
     similar_places_dicts = []
     for place_info in similar_place_names:
         similar_place_dict = {'place_name': place_info[0], 'place_id': place_info[2]}
@@ -137,7 +456,8 @@ def _get_suggestion_dicts_for_non_covid_place_name(place_name: str, suggestion_l
     Returns:
         similar_places_dicts (list[dict]): list of suggested dicts
     """
-    similar_place_names = process.extract(place_name, _postal_place_dictionary, limit=suggestion_limit)
+    similar_place_names = _extract_suggestions(place_name, _postal_place_dictionary, 'postal_places',
+                                               suggestion_limit)
     similar_places_dicts = []
     for place_info in similar_place_names:
         district_id = _postal_code_dictionary[place_info[2]][1]
@@ -178,7 +498,7 @@ def _get_suggestions_for_district_name(district_name: str, suggestion_limit: int
     Returns:
         similar_districts_dicts (list[dict]): list of suggested dicts
     """
-    similar_district_names = process.extract(district_name, _districts_dictionary, limit=suggestion_limit)
+    similar_district_names = _extract_suggestions(district_name, _districts_dictionary, 'districts', suggestion_limit)
     similar_districts_dicts = []
     for district_info in similar_district_names:
         similar_district_dict = {'district_name': district_info[0], 'district_id': district_info[2]}
@@ -309,16 +629,15 @@ def get_dicts_for_exact_district_name(district_name: str) -> list[dict]:
         district_dicts (list[dict]): list of dicts, can be empty
     """
     district_dicts = []
-    for district_id in _districts_dictionary.keys():
-        if _districts_dictionary[district_id] == district_name:
-            place_id = district_id + "0000000"
-            try:
-                place_name = _places_dictionary[place_id]
-            except KeyError:
-                place_name = None
-            district_dict = {'place_name': place_name, 'place_id': place_id, 'district_name': district_name,
-                             'district_id': district_id}
-            district_dicts.append(district_dict)
+    for district_id in _district_ids_by_name.get(district_name, []):
+        place_id = district_id + "0000000"
+        try:
+            place_name = _places_dictionary[place_id]
+        except KeyError:
+            place_name = None
+        district_dict = {'place_name': place_name, 'place_id': place_id, 'district_name': district_name,
+                         'district_id': district_id}
+        district_dicts.append(district_dict)
     return district_dicts  # can be empty
 
 
@@ -332,24 +651,35 @@ def get_dicts_for_exact_place_name(place_name: str) -> list[dict]:
         matching_place_dicts (list[dict]): list of suggested dicts
     """
     matching_place_dicts = []
-    for place_id in _places_dictionary.keys():
-        if _places_dictionary[place_id] == place_name:
-            district_id = place_id[0:5]
-            district_name = _districts_dictionary[district_id]
-            place_dict = {'place_name': place_name, 'place_id': place_id, 'district_name': district_name,
-                          'district_id': district_id}
-            matching_place_dicts.append(place_dict)
+    for place_id in _place_ids_by_name.get(place_name, []):
+        district_id = place_id[0:5]
+        district_name = _districts_dictionary[district_id]
+        place_dict = {'place_name': place_name, 'place_id': place_id, 'district_name': district_name,
+                      'district_id': district_id}
+        matching_place_dicts.append(place_dict)
     return matching_place_dicts
 
 
-def get_dict_suggestions(given_string: str, suggestion_limit=11) -> list[dict]:
+def is_exact_location_name(name: str) -> bool:
+    """
+    Returns whether the given name is exactly the name of a postal code area or of a district, without fuzzy search
+
+    Arguments:
+        name (str): the given name
+    Returns:
+        is_exact_location_name (bool): True if the name is known
+    """
+    return name in _postal_codes_by_place_name or name in _district_ids_by_name
+
+
+def _get_dict_suggestions(given_string: str, suggestion_limit: int) -> list[dict]:
     """
     Returns a list of dicts {'place_name', 'place_id', 'district_name', 'district_id'} with suggestions for the given
     district or place name (alphabetic string) or postal code (numeric string)
 
     Arguments:
         given_string (str): the given name or postal code
-        suggestion_limit (int): limits the number of suggestions to the top x, 11 by default
+        suggestion_limit (int): limits the number of suggestions to the top x
     Returns:
         dict_suggestions (list[dict]): list of suggested dicts
     """
@@ -359,14 +689,28 @@ def get_dict_suggestions(given_string: str, suggestion_limit=11) -> list[dict]:
         return _get_place_and_district_dict_suggestions(given_string, suggestion_limit)
 
 
-def get_non_covid_dict_suggestions(given_string: str, suggestion_limit=11) -> list[dict]:
+def get_dict_suggestions(given_string: str, suggestion_limit=11) -> tuple:
+    """
+    Returns dicts {'place_name', 'place_id', 'district_name', 'district_id'} with suggestions for the given
+    district or place name (alphabetic string) or postal code (numeric string), cached for the normalized given string
+
+    Arguments:
+        given_string (str): the given name or postal code
+        suggestion_limit (int): limits the number of suggestions to the top x, 11 by default
+    Returns:
+        dict_suggestions (tuple): tuple of suggested read only dicts
+    """
+    return _get_cached_suggestions(_get_dict_suggestions, given_string, suggestion_limit)
+
+
+def _get_non_covid_dict_suggestions(given_string: str, suggestion_limit: int) -> list[dict]:
     """
     Returns a list of dicts {'place_name', 'postal_code', 'district_id', 'district_name'} with suggestions for the given
     place name (alphabetic string) or postal code (numeric string)
 
     Arguments:
         given_string (str): the given name or postal code
-        suggestion_limit (int): limits the number of suggestions to the top x, 11 by default
+        suggestion_limit (int): limits the number of suggestions to the top x
     Returns:
         dict_suggestions (list[dict]): list of suggested dicts
     """
@@ -385,6 +729,20 @@ def get_non_covid_dict_suggestions(given_string: str, suggestion_limit=11) -> li
         return _get_suggestion_dicts_for_non_covid_place_name(given_string, suggestion_limit)
 
 
+def get_non_covid_dict_suggestions(given_string: str, suggestion_limit=11) -> tuple:
+    """
+    Returns dicts {'place_name', 'postal_code', 'district_id', 'district_name'} with suggestions for the given
+    place name (alphabetic string) or postal code (numeric string), cached for the normalized given string
+
+    Arguments:
+        given_string (str): the given name or postal code
+        suggestion_limit (int): limits the number of suggestions to the top x, 11 by default
+    Returns:
+        dict_suggestions (tuple): tuple of suggested read only dicts
+    """
+    return _get_cached_suggestions(_get_non_covid_dict_suggestions, given_string, suggestion_limit)
+
+
 def get_place_name_from_dict(dictionary: dict) -> Any:
     """
     Returns the place name in a dictionary, if there is one
@@ -445,7 +803,8 @@ def get_district_id_from_dict(dictionary: dict) -> str:
     return dictionary['district_id']
 
 
-def get_suggestion_dicts_from_coordinates(latitude: float, longitude: float, suggestion_limit=11) -> list[dict]:
+def get_suggestion_dicts_from_coordinates(latitude: float, longitude: float, suggestion_limit=11,
+                                          nominatim_fallback=True) -> list[dict]:
     """
     Returns a list of dicts {'place_name', 'place_id', 'district_name', 'district_id', 'postal_code'} that fit the given
     coordinates
@@ -454,18 +813,17 @@ def get_suggestion_dicts_from_coordinates(latitude: float, longitude: float, sug
         latitude (float): latitude of coordinate
         longitude (float): longitude of coordinate
         suggestion_limit (int): limits the number of suggestions to the top x, 11 by default
+        nominatim_fallback (bool): whether Nominatim is asked for coordinates outside of all postal code areas
     Returns:
         suggested_dicts (list[dict]): dicts that fit the infos
     """
-    place_tuple = _get_exact_address_from_coordinates(latitude, longitude)
-
-    postal_code = place_tuple[1]
+    postal_code = _get_postal_code_from_coordinates(latitude, longitude, nominatim_fallback)
     suggested_dicts_postal_code = _get_dicts_for_postal_code(postal_code, suggestion_limit)
 
     return suggested_dicts_postal_code
 
 
-def get_non_covid_dict_from_coordinates(latitude: float, longitude: float) -> dict:
+def get_non_covid_dict_from_coordinates(latitude: float, longitude: float, nominatim_fallback=True) -> dict:
     """
     Returns a dict {'postal_code', 'place_name', 'district_name', 'district_id'} that fits the given
     coordinates
@@ -473,12 +831,11 @@ def get_non_covid_dict_from_coordinates(latitude: float, longitude: float) -> di
     Arguments:
         latitude (float): latitude of coordinate
         longitude (float): longitude of coordinate
+        nominatim_fallback (bool): whether Nominatim is asked for coordinates outside of all postal code areas
     Returns:
         postal_dict (dict): dict that fits the infos
     """
-    place_tuple = _get_exact_address_from_coordinates(latitude, longitude)
-
-    postal_code = place_tuple[1]
+    postal_code = _get_postal_code_from_coordinates(latitude, longitude, nominatim_fallback)
     record = _postal_code_dictionary[postal_code]
 
     postal_dict = {'postal_code': postal_code, 'place_name': record[0],
@@ -487,10 +844,74 @@ def get_non_covid_dict_from_coordinates(latitude: float, longitude: float) -> di
     return postal_dict
 
 
+def _get_postal_code_indices_in_polygon(coordinate_list: list) -> list[int]:
+    """
+    Returns the dense indices of the postal codes whose area overlaps with the given polygon coordinates, areas that
+    only touch the polygon along a line are left out
+
+    Arguments:
+        coordinate_list (list): a list containing coordinates, making up a valid polygon
+    Returns:
+        indices (list[int]): sorted dense indices (positions in _postal_code_list)
+    """
+    polygon = shapely.Polygon(coordinate_list)
+    # the tree only checks the exact predicate for postal code areas whose bounding box overlaps the polygon
+    candidate_indices = sorted(_postal_code_tree.query(polygon, predicate="intersects"))
+    if len(candidate_indices) == 0:
+        return []
+
+    intersections = shapely.intersection(polygon, _postal_code_tree.geometries.take(candidate_indices))
+    return [int(index) for index, intersection in zip(candidate_indices, intersections)
+            if not isinstance(intersection, shapely.geometry.multilinestring.MultiLineString)]
+
+
+def get_postal_code_index_table() -> list[str]:
+    """
+    Returns the postal codes in the order of their dense index, bit i of a postal code bitset stands for entry i
+
+    Returns:
+        postal_codes (list[str]): all postal codes, sorted (must not be changed)
+    """
+    return _postal_code_list
+
+
+def get_postal_code_bitset(postal_codes: list[str]) -> int:
+    """
+    Returns the given postal codes as a bitset, bit i is set if the postal code with dense index i is in the list
+
+    Arguments:
+        postal_codes (list[str]): the given postal codes, unknown postal codes are ignored
+    Returns:
+        bitset (int): the postal codes as bitset
+    """
+    bitset = 0
+    for postal_code in postal_codes:
+        index = _postal_code_indices.get(postal_code)
+        if index is not None:
+            bitset |= 1 << index
+    return bitset
+
+
+def get_postal_code_bitset_in_polygon(coordinate_list: list) -> int:
+    """
+    Returns the postal codes of places that overlap with the given polygon coordinates as a bitset
+    (see get_postal_code_bitset)
+
+    Arguments:
+        coordinate_list (list): a list containing coordinates, making up a valid polygon
+    Returns:
+        bitset (int): the postal codes as bitset, 0 if no match is found
+    """
+    bitset = 0
+    for index in _get_postal_code_indices_in_polygon(coordinate_list):
+        bitset |= 1 << index
+    return bitset
+
+
 def get_postal_code_dicts_in_polygon(coordinate_list: list) -> list[dict]:
     """
         Returns a list of dicts {'postal_code', 'place_name', 'district_id', 'district_name'} of places that overlap
-        with the given polygon coordinates.
+        with the given polygon coordinates, sorted by postal code.
 
         Arguments:
             coordinate_list (list): a list containing coordinates, making up a valid polygon
@@ -499,19 +920,13 @@ def get_postal_code_dicts_in_polygon(coordinate_list: list) -> list[dict]:
         """
 
     list_of_matches = []
-    polygon = shapely.Polygon(coordinate_list)
-    for place in _postal_code_dictionary:
-        place_coordinates = _postal_code_dictionary[place][2]
-        place_poly = shapely.Polygon(place_coordinates)
-
-        if polygon.intersects(place_poly):
-            intersections = polygon.intersection(place_poly)
-            if not isinstance(intersections, shapely.geometry.multilinestring.MultiLineString):
-                district_id = _postal_code_dictionary[place][1]
-                district_name = _districts_dictionary[district_id]
-                matching_dict = {'postal_code': place, 'place_name': _postal_code_dictionary[place][0],
-                                 'district_id': district_id, 'district_name': district_name}
-                list_of_matches.append(matching_dict)
+    for index in _get_postal_code_indices_in_polygon(coordinate_list):
+        place = _postal_code_list[index]
+        district_id = _postal_code_dictionary[place][1]
+        district_name = _districts_dictionary[district_id]
+        matching_dict = {'postal_code': place, 'place_name': _postal_code_dictionary[place][0],
+                         'district_id': district_id, 'district_name': district_name}
+        list_of_matches.append(matching_dict)
     return list_of_matches
 
 
@@ -1,3 +1,5 @@
+import functools
+
 import telebot.types as typ
 
 import bot
@@ -5,6 +7,8 @@ import controller
 import data_service
 import error
 import frontend_helper
+import nina_service
+import place_converter
 import warning_handler
 
 from enum_types import Commands, WarningCategory, ErrorCodes
@@ -12,6 +16,28 @@ from enum_types import Commands, WarningCategory, ErrorCodes
 bot = bot.bot
 
 
+# user session for every update ----------------------------------------------------------------------------------------
+
+
+def with_user_session(handler):
+    """
+    Decorator for the bot handlers: runs the handler in a data_service.UserSession of the chat the update came from,
+    so the user data is read once and all changes are written once at the end of the update.
+
+    Args:
+        handler: bot handler that gets a Message or a CallbackQuery
+    """
+    @functools.wraps(handler)
+    def handler_in_session(update):
+        if isinstance(update, typ.CallbackQuery):
+            chat_id = update.message.chat.id
+        else:
+            chat_id = update.chat.id
+        with data_service.UserSession(chat_id):
+            handler(update)
+    return handler_in_session
+
+
 # filter for callback handlers -----------------------------------------------------------------------------------------
 
 
@@ -118,6 +144,7 @@ def filter_command_message(message: typ.Message) -> bool:
 
 
 @bot.message_handler(func=filter_normal_message)
+@with_user_session
 def normal_message_handler(message: typ.Message):
     """
     Callc correct message handler based on current state and message.
@@ -235,6 +262,7 @@ def normal_message_handler(message: typ.Message):
 
 
 @bot.message_handler(func=filter_command_message)
+@with_user_session
 def command_message_handler(message: typ.Message):
     """
     Calls correct message handler based on given message.
@@ -276,6 +304,7 @@ def start(message: typ.Message):
 
 
 @bot.message_handler(content_types=['location'])
+@with_user_session
 def send_location_pressed(message: typ.Message):
     """
     This method is called whenever the user sends a location in the chat and will give the location to the controller
@@ -292,6 +321,7 @@ def send_location_pressed(message: typ.Message):
 
 
 @bot.callback_query_handler(func=filter_callback_manual_warning_covid)
+@with_user_session
 def covid_button(call: typ.CallbackQuery):
     """
     This method is a callback_handler for the covid inline buttons and will call the methods needed to give the user
@@ -307,6 +337,7 @@ def covid_button(call: typ.CallbackQuery):
 
 
 @bot.callback_query_handler(func=filter_callback_manual_warning_other)
+@with_user_session
 def other_warnings_button(call: typ.CallbackQuery):
     """
     This method is a callback_handler for the warning (weather, civil protection, flood) inline buttons (suggestions)
@@ -341,6 +372,7 @@ def other_warnings_button(call: typ.CallbackQuery):
 
 
 @bot.callback_query_handler(func=filter_callback_auto_warning)
+@with_user_session
 def auto_warning_button(call: typ.CallbackQuery):
     """
     This method is a callback_handler for the automatic warning inline buttons and will call the methods needed to set
@@ -359,6 +391,7 @@ def auto_warning_button(call: typ.CallbackQuery):
 
 
 @bot.callback_query_handler(func=filter_callback_auto_covid_updates)
+@with_user_session
 def auto_covid_updates_button(call: typ.CallbackQuery):
     """
     This method is a callback_handler for the automatic covid updates inline buttons and will call the methods needed
@@ -378,6 +411,7 @@ def auto_covid_updates_button(call: typ.CallbackQuery):
 
 
 @bot.callback_query_handler(func=filter_callback_add_subscription)
+@with_user_session
 def add_subscription_callback(call: typ.CallbackQuery):
     """
     This method is a callback_handler for the inline buttons when adding a subscription
@@ -391,6 +425,7 @@ def add_subscription_callback(call: typ.CallbackQuery):
 
 
 @bot.callback_query_handler(func=filter_callback_delete_subscription)
+@with_user_session
 def delete_subscription_callback(call: typ.CallbackQuery):
     """
     This method is a callback_handler for the inline buttons when deleting a subscription
@@ -403,6 +438,7 @@ def delete_subscription_callback(call: typ.CallbackQuery):
 
 
 @bot.callback_query_handler(func=filter_callback_cancel)
+@with_user_session
 def cancel_button(call: typ.CallbackQuery):
     """
     This method is a callback_handler for cancel inline buttons and will delete the inline buttons
@@ -415,6 +451,7 @@ def cancel_button(call: typ.CallbackQuery):
 
 
 @bot.callback_query_handler(func=filter_callback_just_cancel)
+@with_user_session
 def just_cancel_button(call: typ.CallbackQuery):
     """
     This method is a callback_handler for cancel inline buttons and will delete the inline buttons
@@ -426,6 +463,7 @@ def just_cancel_button(call: typ.CallbackQuery):
 
 
 @bot.callback_query_handler(func=filter_callback_add_favorite)
+@with_user_session
 def add_favorite(call: typ.CallbackQuery):
     """
     This method is called whenever the user presses a button for adding a favorite
@@ -444,6 +482,7 @@ def add_favorite(call: typ.CallbackQuery):
 
 
 @bot.callback_query_handler(func=filter_callback_set_default_level)
+@with_user_session
 def set_default_level(call: typ.CallbackQuery):
     """
     This method gets called when the user selects a default level for all Warnings
@@ -460,6 +499,7 @@ def set_default_level(call: typ.CallbackQuery):
 
 
 @bot.callback_query_handler(func=filter_callback_delete_data)
+@with_user_session
 def delete_data(call: typ.CallbackQuery):
     """
     This method gets called when the user presses yes when deleting data
@@ -472,6 +512,7 @@ def delete_data(call: typ.CallbackQuery):
 
 
 @bot.callback_query_handler(func=filter_callback_send_emergency_pdf)
+@with_user_session
 def send_pdf(call: typ.CallbackQuery):
     """
     This method gets called when the user presses yes when asking if the pdf should be sent
@@ -513,4 +554,7 @@ def covid_helper(chat_id: int, message_string: str):
 def start_receiver():
     print("Receiver running...")
     warning_handler.init_warning_handler()
+    nina_service.init_covid_prefetch()
+    place_converter.init_reference_data_refresh(
+        data_service.get_config().get("reference_data_refresh_interval_in_seconds", 86400))
     bot.polling()
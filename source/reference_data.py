@@ -0,0 +1,251 @@
+import argparse
+import json
+import os
+import struct
+import time
+
+import numpy
+import requests
+
+# The reference data are the districts, the places and the postal code areas place_converter searches in. They are
+# downloaded from the sources below. A snapshot of them is stored in reference_data.bin, so that the bot can start
+# without waiting for the downloads (see place_converter).
+
+
+DISTRICTS_URL = 'https://warnung.bund.de/assets/json/converted_corona_kreise.json'
+
+PLACES_URL = 'https://www.xrepository.de/api/xrepository/urn:de:bund:destatis:bevoelkerungsstatistik:schluessel:' \
+             'rs_2021-07-31/download/Regionalschl_ssel_2021-07-31.json'
+
+POSTAL_CODES_URL = 'https://public.opendatasoft.com/api/records/1.0/search/?dataset=georef-germany-postleitzahl&q=' \
+                   '&rows=-1'
+
+_SNAPSHOT_MAGIC = b"NWRD"
+
+_SNAPSHOT_FORMAT_VERSION = 1
+"""version of the binary format of reference_data.bin, snapshots of other versions are not read"""
+
+
+def parse_districts(converted_covid_districts: dict) -> dict:
+    """
+    Args:
+        converted_covid_districts: decoded json of DISTRICTS_URL
+
+    Returns:
+        dict district_id -> district_name
+    """
+    return {district_id: district_description["n"]
+            for district_id, district_description in converted_covid_districts.items()}
+
+
+def parse_places(bevoelkerungsstaat_key: dict, districts: dict) -> dict:
+    """
+    Args:
+        bevoelkerungsstaat_key: decoded json of PLACES_URL
+        districts: dict district_id -> district_name, places of other districts are left out
+
+    Returns:
+        dict place_id -> place_name
+    """
+    places = {}
+    for area_triple in bevoelkerungsstaat_key['daten']:
+        if area_triple[2] is None or area_triple[0][0:5] in districts:
+            places[area_triple[0]] = area_triple[1]
+    return places
+
+
+def parse_postal_codes(postal_code_table: dict) -> dict:
+    """
+    Args:
+        postal_code_table: decoded json of POSTAL_CODES_URL
+
+    Returns:
+        dict postal_code -> [place_name, district_id, polygon_area : list[[float, float]]]
+    """
+    return {record['fields']['plz_code']: [record['fields']['plz_name'],
+                                           record['fields']['krs_code'],
+                                           record['fields']['geometry']['coordinates'][0]]
+            for record in postal_code_table['records']}
+
+
+def download_reference_data() -> tuple[dict, dict, dict]:
+    """
+    Returns:
+        tuple (districts, places, postal codes) downloaded from the sources, see the parse functions for the formats
+    """
+    districts = parse_districts(requests.get(DISTRICTS_URL).json())
+    places = parse_places(requests.get(PLACES_URL).json(), districts)
+    postal_codes = parse_postal_codes(requests.get(POSTAL_CODES_URL).json())
+    return districts, places, postal_codes
+
+
+def read_reference_data_files(districts_path: str, places_path: str, postal_codes_path: str) -> tuple[dict, dict, dict]:
+    """
+    Args:
+        districts_path: path of a downloaded copy of DISTRICTS_URL
+        places_path: path of a downloaded copy of PLACES_URL
+        postal_codes_path: path of a downloaded copy of POSTAL_CODES_URL
+
+    Returns:
+        tuple (districts, places, postal codes), see the parse functions for the formats
+    """
+    with open(districts_path, "r", encoding="utf-8") as file_object:
+        districts = parse_districts(json.load(file_object))
+    with open(places_path, "r", encoding="utf-8") as file_object:
+        places = parse_places(json.load(file_object), districts)
+    with open(postal_codes_path, "r", encoding="utf-8") as file_object:
+        postal_codes = parse_postal_codes(json.load(file_object))
+    return districts, places, postal_codes
+
+
+def _encode_strings(strings) -> bytes:
+    encoded_strings = "\n".join(strings).encode("utf-8")
+    return struct.pack("<I", len(encoded_strings)) + encoded_strings
+
+
+def _decode_strings(content: bytes, offset: int, count: int) -> tuple[list[str], int]:
+    (length,) = struct.unpack_from("<I", content, offset)
+    offset += 4
+    strings = content[offset:offset + length].decode("utf-8").split("\n") if count > 0 else []
+    if len(strings) != count:
+        raise ValueError("broken reference data snapshot")
+    return strings, offset + length
+
+
+def encode_snapshot(districts: dict, places: dict, postal_codes: dict, created_at: float) -> bytes:
+    """
+    Encodes the reference data in the binary format of reference_data.bin:
+    magic, format version, time of the download and the number of districts, places and postal codes, then the ids and
+    names as newline separated utf-8 strings, the number of points of every postal code area and all points as float64
+    pairs (little endian)
+
+    Args:
+        districts: dict district_id -> district_name
+        places: dict place_id -> place_name
+        postal_codes: dict postal_code -> [place_name, district_id, polygon_area]
+        created_at: unix time of the download of the reference data
+
+    Returns:
+        content of reference_data.bin
+
+    Raises:
+        ValueError: if a polygon area is not a list of [longitude, latitude] points
+    """
+    areas = []
+    for postal_code, record in postal_codes.items():
+        area = numpy.asarray(record[2], dtype="<f8")
+        if area.ndim != 2 or area.shape[1] != 2:
+            raise ValueError("polygon area of postal code " + postal_code + " is not a list of points")
+        areas.append(area)
+    point_counts = numpy.array([len(area) for area in areas], dtype="<u4")
+    points = numpy.concatenate(areas) if len(areas) > 0 else numpy.empty((0, 2), dtype="<f8")
+
+    parts = [_SNAPSHOT_MAGIC, struct.pack("<BdIII", _SNAPSHOT_FORMAT_VERSION, created_at, len(districts), len(places),
+                                          len(postal_codes)),
+             _encode_strings(districts.keys()), _encode_strings(districts.values()),
+             _encode_strings(places.keys()), _encode_strings(places.values()),
+             _encode_strings(postal_codes.keys()), _encode_strings(record[0] for record in postal_codes.values()),
+             _encode_strings(record[1] for record in postal_codes.values()),
+             point_counts.tobytes(), points.tobytes()]
+    return b"".join(parts)
+
+
+def decode_snapshot(content: bytes) -> tuple[float, dict, dict, dict]:
+    """
+    Args:
+        content: content of reference_data.bin
+
+    Returns:
+        tuple (created_at, districts, places, postal codes), see encode_snapshot, the polygon areas are numpy arrays
+        of shape (number of points, 2)
+
+    Raises:
+        ValueError: if content is not a snapshot in the current format version
+    """
+    if content[:4] != _SNAPSHOT_MAGIC:
+        raise ValueError("not a reference data snapshot")
+    try:
+        format_version, created_at, district_count, place_count, postal_code_count = \
+            struct.unpack_from("<BdIII", content, 4)
+        if format_version != _SNAPSHOT_FORMAT_VERSION:
+            raise ValueError("reference data snapshot has format version " + str(format_version))
+        offset = 4 + struct.calcsize("<BdIII")
+        district_ids, offset = _decode_strings(content, offset, district_count)
+        district_names, offset = _decode_strings(content, offset, district_count)
+        place_ids, offset = _decode_strings(content, offset, place_count)
+        place_names, offset = _decode_strings(content, offset, place_count)
+        postal_code_list, offset = _decode_strings(content, offset, postal_code_count)
+        postal_place_names, offset = _decode_strings(content, offset, postal_code_count)
+        postal_district_ids, offset = _decode_strings(content, offset, postal_code_count)
+
+        point_counts = numpy.frombuffer(content, dtype="<u4", count=postal_code_count, offset=offset)
+        offset += point_counts.nbytes
+        point_count = int(point_counts.sum())
+        points = numpy.frombuffer(content, dtype="<f8", count=2 * point_count, offset=offset).reshape(-1, 2)
+        if offset + points.nbytes != len(content):
+            raise ValueError("broken reference data snapshot")
+    except struct.error as e:
+        raise ValueError("broken reference data snapshot") from e
+
+    # the polygon areas stay read only numpy views of content, building millions of small lists would take seconds
+    ends = numpy.cumsum(point_counts).tolist()
+    starts = [0] + ends[:-1]
+    postal_codes = {postal_code: [place_name, district_id, points[start:end]]
+                    for postal_code, place_name, district_id, start, end
+                    in zip(postal_code_list, postal_place_names, postal_district_ids, starts, ends)}
+    return created_at, dict(zip(district_ids, district_names)), dict(zip(place_ids, place_names)), postal_codes
+
+
+def read_snapshot(path: str) -> tuple[float, dict, dict, dict]:
+    """
+    Args:
+        path: path of reference_data.bin
+
+    Returns:
+        tuple (created_at, districts, places, postal codes), see encode_snapshot
+
+    Raises:
+        OSError: if the snapshot cannot be read
+        ValueError: if the file is not a snapshot in the current format version
+    """
+    with open(path, "rb") as file_object:
+        return decode_snapshot(file_object.read())
+
+
+def write_snapshot(path: str, districts: dict, places: dict, postal_codes: dict, created_at: float):
+    """
+    Writes the reference data to path, readers never see a partly written snapshot
+
+    Args:
+        path: path of reference_data.bin
+        districts: dict district_id -> district_name
+        places: dict place_id -> place_name
+        postal_codes: dict postal_code -> [place_name, district_id, polygon_area]
+        created_at: unix time of the download of the reference data
+    """
+    content = encode_snapshot(districts, places, postal_codes, created_at)
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "wb") as file_object:
+        file_object.write(content)
+    os.replace(temporary_path, path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Builds the reference data snapshot place_converter starts from, "
+                                                 "from the online sources or from downloaded copies of them")
+    parser.add_argument("--districts", help="path of a downloaded copy of " + DISTRICTS_URL)
+    parser.add_argument("--places", help="path of a downloaded copy of " + PLACES_URL)
+    parser.add_argument("--postal-codes", help="path of a downloaded copy of " + POSTAL_CODES_URL)
+    parser.add_argument("--output", default="data/reference_data.bin", help="path of the snapshot")
+    arguments = parser.parse_args()
+
+    local_paths = [arguments.districts, arguments.places, arguments.postal_codes]
+    if all(path is not None for path in local_paths):
+        reference_data = read_reference_data_files(*local_paths)
+    elif any(path is not None for path in local_paths):
+        parser.error("--districts, --places and --postal-codes have to be given together")
+    else:
+        reference_data = download_reference_data()
+    write_snapshot(arguments.output, *reference_data, time.time())
+    print(f"Wrote {len(reference_data[0])} districts, {len(reference_data[1])} places and "
+          f"{len(reference_data[2])} postal codes to {arguments.output}")
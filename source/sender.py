@@ -1,12 +1,379 @@
+import bisect
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+import telebot.apihelper
 import telebot.types
 
 import bot
 import data_service
+from enum_types import WarningSeverity
 bot = bot.bot
 
 
+# outbound queue -------------------------------------------------------------------------------------------------------
+# Every message goes through one queue that is worked off by _sender_workers threads. A global token bucket keeps the
+# bot below the limit Telegram sets for all chats together and a token bucket per chat below the limit for one chat.
+# The queue has one lane per priority: interactive replies are sent first, then the warnings from Extreme to Moderate,
+# then the bulk of Minor warnings. A message that waits longer than _lane_max_wait_in_seconds is sent now and then
+# before the messages of higher lanes, so a storm of Severe warnings does not starve the others. Interactive replies
+# and Extreme warnings are never put behind them.
+
+
+class TokenBucket:
+    """
+    Allows rate events per second on average and bursts of up to capacity events.
+    A caller reserves a token and then waits the returned time, so waiting callers are served in the order of their
+    reservations.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """
+        Returns:
+            seconds to wait until the reserved token is available
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return max(0.0, -self._tokens / self.rate)
+
+    def pause(self, seconds: float):
+        """
+        No token is available for the next seconds (e.g. after Telegram answered with retry_after)
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens = min(self._tokens, -seconds * self.rate)
+
+
+INTERACTIVE_LANE = 0
+"""lane of the replies to a user, they are sent first"""
+
+EXTREME_LANE = 1
+
+SEVERE_LANE = 2
+
+MODERATE_LANE = 3
+
+BULK_LANE = 4
+"""lane of Minor warnings and all other messages nobody waits for"""
+
+_LANE_NAMES = ("interactive", "extreme", "severe", "moderate", "bulk")
+
+_WARNING_LANES = {WarningSeverity.EXTREME: EXTREME_LANE, WarningSeverity.SEVERE: SEVERE_LANE,
+                  WarningSeverity.MODERATE: MODERATE_LANE}
+
+LATENCY_HISTOGRAM_BOUNDS_IN_SECONDS = (0.1, 0.5, 1, 5, 10, 30, 60, 300)
+"""upper bounds of the buckets of the latency histograms, the last bucket counts all slower messages"""
+
+_STARVATION_PROMOTION_INTERVAL = 10
+"""at most one overdue message of a lower lane is sent before the messages of higher lanes per this many messages"""
+
+_SEND_MAX_RETRIES = 5
+"""number of times a message is sent again after Telegram answered with 429 Too Many Requests"""
+
+_CHAT_BUCKET_LIMIT = 10000
+"""number of per chat token buckets that are kept, the least recently used ones are removed"""
+
+_sender_workers = data_service.get_config().get("sender_workers", 8)
+
+_global_bucket = TokenBucket(data_service.get_config().get("sender_messages_per_second", 30),
+                             data_service.get_config().get("sender_messages_per_second", 30))
+
+_messages_per_chat_per_second = data_service.get_config().get("sender_messages_per_chat_per_second", 1)
+
+_lane_max_wait_in_seconds = data_service.get_config().get("sender_lane_max_wait_in_seconds", 60)
+
+_chat_buckets = OrderedDict()
+"""dictionary chat_id -> TokenBucket, least recently used first"""
+
+_lanes = [deque() for _ in _LANE_NAMES]
+"""one deque of _OutboundMessage per lane, oldest first"""
+
+_LANES_CONDITION = threading.Condition()
+
+_chats_in_progress = set()
+"""chat ids a worker is sending to, their other messages stay in the lanes until the worker is done, guarded by
+_LANES_CONDITION"""
+
+_messages_since_promotion = _STARVATION_PROMOTION_INTERVAL
+"""messages taken from the lanes since the last overdue message was promoted, guarded by _LANES_CONDITION"""
+
+_send_statistics = {"enqueued": 0, "sent": 0, "failed": 0, "retries": 0, "throttled": 0, "starvation_promotions": 0,
+                    "throttle_wait_seconds": 0.0, "send_latency_seconds": 0.0, "max_send_latency_seconds": 0.0}
+
+_lane_statistics = {lane_name: {"sent": 0, "latency_histogram": [0] * (len(LATENCY_HISTOGRAM_BOUNDS_IN_SECONDS) + 1)}
+                    for lane_name in _LANE_NAMES}
+"""dictionary lane name -> {'sent', 'latency_histogram'}, see LATENCY_HISTOGRAM_BOUNDS_IN_SECONDS"""
+
+_SENDER_LOCK = threading.Lock()
+
+_worker_threads = []
+
+
+class _OutboundMessage:
+    """
+    A message in one of the _lanes: send_function(chat_id) does the request to Telegram, the result or the exception
+    is set on future
+    """
+
+    def __init__(self, chat_id: int, send_function, lane: int):
+        self.chat_id = chat_id
+        self.send_function = send_function
+        self.lane = lane
+        self.future = Future()
+        self.enqueued_at = time.monotonic()
+
+
+def _get_chat_bucket(chat_id: int) -> TokenBucket:
+    with _SENDER_LOCK:
+        bucket = _chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(_messages_per_chat_per_second, 1)
+            _chat_buckets[chat_id] = bucket
+            while len(_chat_buckets) > _CHAT_BUCKET_LIMIT:
+                _chat_buckets.popitem(last=False)
+        _chat_buckets.move_to_end(chat_id)
+        return bucket
+
+
+def _wait_for_tokens(chat_bucket: TokenBucket):
+    """
+    Waits until the chat and the whole bot may send the next message
+    """
+    wait_in_seconds = chat_bucket.reserve()
+    if wait_in_seconds > 0:
+        time.sleep(wait_in_seconds)
+    global_wait_in_seconds = _global_bucket.reserve()
+    if global_wait_in_seconds > 0:
+        time.sleep(global_wait_in_seconds)
+    wait_in_seconds += global_wait_in_seconds
+    if wait_in_seconds > 0:
+        with _SENDER_LOCK:
+            _send_statistics["throttled"] += 1
+            _send_statistics["throttle_wait_seconds"] += wait_in_seconds
+
+
+def _get_retry_after(exception: Exception) -> float:
+    """
+    Returns:
+        seconds Telegram asks to wait if the exception is a 429 Too Many Requests, else None
+    """
+    if isinstance(exception, telebot.apihelper.ApiTelegramException) and exception.error_code == 429:
+        return exception.result_json.get("parameters", {}).get("retry_after", 1)
+    return None
+
+
+def is_permanent_error(exception: Exception) -> bool:
+    """
+    Returns:
+        True if Telegram refused the message for good (4xx other than 429, e.g. the bot was blocked or the chat does
+        not exist), sending it again would fail the same way
+    """
+    return isinstance(exception, telebot.apihelper.ApiTelegramException) and 400 <= exception.error_code < 500 \
+        and exception.error_code != 429
+
+
+def _deliver(message: _OutboundMessage):
+    """
+    Sends the message within the rate limits, it is sent again if Telegram answers with retry_after
+    """
+    chat_bucket = _get_chat_bucket(message.chat_id)
+    for retry in range(_SEND_MAX_RETRIES + 1):
+        _wait_for_tokens(chat_bucket)
+        try:
+            result = message.send_function(message.chat_id)
+        except Exception as e:
+            retry_after = _get_retry_after(e)
+            if retry_after is None or retry == _SEND_MAX_RETRIES:
+                with _SENDER_LOCK:
+                    _send_statistics["failed"] += 1
+                message.future.set_exception(e)
+                return
+            _global_bucket.pause(retry_after)
+            chat_bucket.pause(retry_after)
+            with _SENDER_LOCK:
+                _send_statistics["retries"] += 1
+            continue
+
+        latency_in_seconds = time.monotonic() - message.enqueued_at
+        with _SENDER_LOCK:
+            lane_statistics = _lane_statistics[_LANE_NAMES[message.lane]]
+            lane_statistics["sent"] += 1
+            lane_statistics["latency_histogram"][
+                bisect.bisect_left(LATENCY_HISTOGRAM_BOUNDS_IN_SECONDS, latency_in_seconds)] += 1
+            _send_statistics["sent"] += 1
+            _send_statistics["send_latency_seconds"] += latency_in_seconds
+            _send_statistics["max_send_latency_seconds"] = max(_send_statistics["max_send_latency_seconds"],
+                                                               latency_in_seconds)
+        message.future.set_result(result)
+        return
+
+
+def _find_sendable_message(lane: deque) -> int:
+    """
+    Returns:
+        index of the oldest message in the lane to a chat no worker is sending to, None if there is none
+    """
+    for index, message in enumerate(lane):
+        if message.chat_id not in _chats_in_progress:
+            return index
+    return None
+
+
+def _remove_message(lane: deque, index: int) -> _OutboundMessage:
+    message = lane[index]
+    del lane[index]
+    return message
+
+
+def _pop_next_message() -> _OutboundMessage:
+    """
+    Takes the oldest message of the highest lane that can be sent. A message that waited longer than
+    _lane_max_wait_in_seconds in a lower lane is taken instead, but only once per _STARVATION_PROMOTION_INTERVAL
+    messages and never before interactive replies or Extreme warnings. Must be called with _LANES_CONDITION held.
+
+    Returns:
+        the message, None if all messages in the lanes go to chats a worker is sending to
+    """
+    global _messages_since_promotion
+    next_lane, next_index = None, None
+    for lane_number, lane in enumerate(_lanes):
+        next_index = _find_sendable_message(lane)
+        if next_index is not None:
+            next_lane = lane_number
+            break
+    if next_lane is None:
+        return None
+
+    if next_lane > EXTREME_LANE and _messages_since_promotion >= _STARVATION_PROMOTION_INTERVAL:
+        overdue_before = time.monotonic() - _lane_max_wait_in_seconds
+        overdue_lane, overdue_index, overdue_enqueued_at = None, None, overdue_before
+        for lane_number in range(next_lane + 1, len(_lanes)):
+            index = _find_sendable_message(_lanes[lane_number])
+            if index is not None and _lanes[lane_number][index].enqueued_at <= overdue_enqueued_at:
+                overdue_lane, overdue_index = lane_number, index
+                overdue_enqueued_at = _lanes[lane_number][index].enqueued_at
+        if overdue_lane is not None:
+            _messages_since_promotion = 0
+            with _SENDER_LOCK:
+                _send_statistics["starvation_promotions"] += 1
+            return _remove_message(_lanes[overdue_lane], overdue_index)
+    _messages_since_promotion += 1
+    return _remove_message(_lanes[next_lane], next_index)
+
+
+def _take_next_message() -> _OutboundMessage:
+    """
+    Waits until a message can be taken and claims its chat in _chats_in_progress. Messages to a claimed chat stay in
+    their lanes, so a reply to a user is still sent before the warnings queued for the same user. Taking and claiming
+    happen under one lock, so two workers never send to the same chat at the same time.
+    """
+    with _LANES_CONDITION:
+        message = _pop_next_message()
+        while message is None:
+            _LANES_CONDITION.wait()
+            message = _pop_next_message()
+        _chats_in_progress.add(message.chat_id)
+        return message
+
+
+def _sender_worker_loop():
+    """
+    Sends the messages of the _lanes. Messages to one chat are sent one after another, see _take_next_message.
+    """
+    while True:
+        message = _take_next_message()
+        try:
+            _deliver(message)
+        finally:
+            with _LANES_CONDITION:
+                _chats_in_progress.discard(message.chat_id)
+                # messages to the chat may be waiting in the lanes
+                _LANES_CONDITION.notify()
+
+
+def _start_sender_workers():
+    with _SENDER_LOCK:
+        if len(_worker_threads) > 0:
+            return
+        for _ in range(max(_sender_workers, 1)):
+            worker_thread = threading.Thread(target=_sender_worker_loop, daemon=True)
+            worker_thread.start()
+            _worker_threads.append(worker_thread)
+
+
+def _enqueue(chat_id: int, send_function, lane: int) -> Future:
+    """
+    Puts a request to Telegram into one of the _lanes, the workers are started with the first message
+
+    Args:
+        chat_id: an integer for the chatID that the request is sent to
+        send_function: function (chat_id) -> result of the request
+        lane: INTERACTIVE_LANE, EXTREME_LANE, SEVERE_LANE, MODERATE_LANE or BULK_LANE
+
+    Returns:
+        Future with the result of send_function
+    """
+    _start_sender_workers()
+    message = _OutboundMessage(chat_id, send_function, lane)
+    with _SENDER_LOCK:
+        _send_statistics["enqueued"] += 1
+    with _LANES_CONDITION:
+        _lanes[lane].append(message)
+        _LANES_CONDITION.notify()
+    return message.future
+
+
+def get_send_statistics() -> dict:
+    """
+    Returns:
+        dict with the counters of the outbound queue, 'queue_depth' (messages waiting),
+        'average_send_latency_seconds' (time from enqueueing to sending) and 'lanes':
+        dict lane name -> {'queue_depth', 'sent', 'latency_histogram'}, see LATENCY_HISTOGRAM_BOUNDS_IN_SECONDS
+    """
+    with _LANES_CONDITION:
+        lane_depths = [len(lane) for lane in _lanes]
+    with _SENDER_LOCK:
+        statistics = _send_statistics.copy()
+        statistics["lanes"] = {lane_name: {"queue_depth": lane_depth, "sent": lane_statistics["sent"],
+                                           "latency_histogram": lane_statistics["latency_histogram"].copy()}
+                               for (lane_name, lane_statistics), lane_depth in zip(_lane_statistics.items(),
+                                                                                   lane_depths)}
+    statistics["queue_depth"] = sum(lane_depths)
+    statistics["average_send_latency_seconds"] = \
+        statistics["send_latency_seconds"] / statistics["sent"] if statistics["sent"] > 0 else 0.0
+    return statistics
+
+
+def _remember_last_inline_message(chat_id: int, message: telebot.types.Message, reply_markup):
+    """
+    Only the last message with inline buttons is kept, the previous one is deleted
+    """
+    if isinstance(reply_markup, telebot.types.InlineKeyboardMarkup):
+        prev_message_id = data_service.set_last_bot_message_id(chat_id, message.id)
+        if prev_message_id != "None":
+            delete_message(chat_id, int(prev_message_id))
+
+
 def send_message(chat_id: int, message_string: str, reply_markup=None) -> telebot.types.Message:
     """
+    Sends the message in the interactive lane before all messages enqueued in the background and waits until it is
+    sent
+
     Args:
         chat_id: an integer for the chatID that the message is sent to
         message_string: a string for the message that is sent
@@ -14,16 +381,44 @@ def send_message(chat_id: int, message_string: str, reply_markup=None) -> telebo
     Returns:
         The message that was sent
     """
-    message = bot.send_message(chat_id, message_string, reply_markup=reply_markup)
-    if isinstance(reply_markup, telebot.types.InlineKeyboardMarkup):
-        prev_message_id = data_service.set_last_bot_message_id(chat_id, message.id)
-        if prev_message_id != "None":
-            delete_message(chat_id, int(prev_message_id))
+    message = _enqueue(chat_id, lambda cid: bot.send_message(cid, message_string, reply_markup=reply_markup),
+                       INTERACTIVE_LANE).result()
+    _remember_last_inline_message(chat_id, message, reply_markup)
     return message
 
 
+def enqueue_message(chat_id: int, message_string: str, reply_markup=None,
+                    severity: WarningSeverity = None) -> Future:
+    """
+    Sends the message in the background after all interactive replies, without waiting for it
+
+    Args:
+        chat_id: an integer for the chatID that the message is sent to
+        message_string: a string for the message that is sent
+        reply_markup: optional reply_markup
+        severity: WarningSeverity of the warning in the message, Extreme warnings are sent first. Minor warnings and
+                  messages without severity are sent last
+    Returns:
+        Future with the message that was sent
+    """
+    def send_in_background(cid: int) -> telebot.types.Message:
+        message = bot.send_message(cid, message_string, reply_markup=reply_markup)
+        _remember_last_inline_message(cid, message, reply_markup)
+        return message
+
+    future = _enqueue(chat_id, send_in_background, _WARNING_LANES.get(severity, BULK_LANE))
+    future.add_done_callback(_log_failed_background_message)
+    return future
+
+
+def _log_failed_background_message(future: Future):
+    if future.exception() is not None:
+        print("ERROR: sending a message in the background failed\n" + str(future.exception()))
+
+
 def send_document(chat_id: int, document, caption: str, reply_markup=None):
-    bot.send_document(chat_id, document, caption=caption, reply_markup=reply_markup)
+    _enqueue(chat_id, lambda cid: bot.send_document(cid, document, caption=caption, reply_markup=reply_markup),
+             INTERACTIVE_LANE).result()
 
 
 def send_chat_action(chat_id: int, action: str):
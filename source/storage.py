@@ -0,0 +1,381 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+
+from enum_types import Attributes
+
+# A storage backend persists the user records (the dicts stored per chat id in data.json) and the lists of warnings
+# every user has already received. data_service decides which backend is used (see "storage_backend" in config.json)
+# and only talks to it through the methods below, so both backends are interchangeable.
+
+
+def _read_json(path: str) -> dict:
+    with open(path, "r") as file_object:
+        return json.loads(file_object.read())
+
+
+def _write_json(path: str, data: dict) -> int:
+    content = json.dumps(data, indent=4)
+    with open(path, "w+") as file_object:
+        file_object.write(content)
+    return len(content)
+
+
+class JsonStorage:
+    """
+    Stores all users in one json file and all received warnings in another one.
+    Every write rewrites the whole file, this is the format the bot has always used.
+    """
+
+    def __init__(self, user_data_path: str, warnings_already_received_path: str):
+        self.user_data_path = user_data_path
+        self.warnings_already_received_path = warnings_already_received_path
+        self._received_warnings = None
+        self._received_warnings_token = None
+        self._received_warnings_lock = threading.RLock()
+
+        if not os.path.exists(self.user_data_path):
+            _write_json(self.user_data_path, {})
+        if not os.path.exists(self.warnings_already_received_path):
+            _write_json(self.warnings_already_received_path, {})
+
+    def load_users(self) -> dict:
+        """
+        Returns:
+            dict chat_id : str -> user record : dict of all users
+        """
+        return _read_json(self.user_data_path)
+
+    def load_user(self, chat_id: str) -> dict or None:
+        """
+        Args:
+            chat_id: str to identify the user
+
+        Returns:
+            the record of the user or None if the user does not exist
+        """
+        return self.load_users().get(chat_id)
+
+    def save_user(self, chat_id: str, record: dict):
+        """
+        Inserts or replaces the record of the user.
+
+        Args:
+            chat_id: str to identify the user
+            record: the complete record of the user
+        """
+        all_users = self.load_users()
+        all_users[chat_id] = record
+        _write_json(self.user_data_path, all_users)
+
+    def delete_user(self, chat_id: str) -> bool:
+        """
+        Args:
+            chat_id: str to identify the user
+
+        Returns:
+            True if the user existed and was deleted
+        """
+        all_users = self.load_users()
+        if chat_id not in all_users:
+            return False
+        del all_users[chat_id]
+        _write_json(self.user_data_path, all_users)
+        return True
+
+    def write_users(self, all_users: dict, changed_chat_ids: set[str], deleted_chat_ids: set[str]) -> int:
+        """
+        Persists a batch of changes. The json file can only be written as a whole, so all_users is written.
+
+        Args:
+            all_users: dict chat_id : str -> user record : dict with the complete current data
+            changed_chat_ids: chat ids of the users that were inserted or changed
+            deleted_chat_ids: chat ids of the users that were deleted
+
+        Returns:
+            number of bytes written
+        """
+        return _write_json(self.user_data_path, all_users)
+
+    def state_token(self) -> tuple:
+        """
+        Returns:
+            a value that changes whenever data.json is written (also by someone else)
+        """
+        stat = os.stat(self.user_data_path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def _get_received_warnings(self) -> dict:
+        """
+        Returns:
+            the parsed content of warnings_already_received.json, it is only parsed again if the file changed
+        """
+        # NO LOCK HERE
+        stat = os.stat(self.warnings_already_received_path)
+        token = stat.st_mtime_ns, stat.st_size
+        if token != self._received_warnings_token:
+            self._received_warnings = _read_json(self.warnings_already_received_path)
+            self._received_warnings_token = token
+        return self._received_warnings
+
+    def _set_received_warnings(self, user_data: dict):
+        # NO LOCK HERE
+        _write_json(self.warnings_already_received_path, user_data)
+        stat = os.stat(self.warnings_already_received_path)
+        self._received_warnings = user_data
+        self._received_warnings_token = stat.st_mtime_ns, stat.st_size
+
+    def load_received_warning_ids(self, chat_id: str) -> list[str]:
+        """
+        Args:
+            chat_id: str to identify the user
+
+        Returns:
+            list of the ids of all warnings the user has already received
+        """
+        with self._received_warnings_lock:
+            return list(self._get_received_warnings().get(chat_id, []))
+
+    def load_chat_ids_that_received_warning(self, warning_id: str) -> set[str]:
+        """
+        Args:
+            warning_id: id of the warning
+
+        Returns:
+            set of the chat ids of all users that have already received the warning
+        """
+        with self._received_warnings_lock:
+            return {chat_id for chat_id, warning_ids in self._get_received_warnings().items()
+                    if warning_id in warning_ids}
+
+    def add_received_warning_id(self, chat_id: str, warning_id: str):
+        """
+        Args:
+            chat_id: str to identify the user
+            warning_id: id of the warning that was sent to the user
+        """
+        with self._received_warnings_lock:
+            user_data = self._get_received_warnings()
+            if chat_id not in user_data:
+                user_data[chat_id] = []
+            user_data[chat_id].append(warning_id)
+            self._set_received_warnings(user_data)
+
+    def delete_received_warning_ids(self, chat_id: str):
+        """
+        Args:
+            chat_id: str to identify the user
+        """
+        with self._received_warnings_lock:
+            user_data = self._get_received_warnings()
+            if chat_id in user_data:
+                del user_data[chat_id]
+                self._set_received_warnings(user_data)
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    chat_id TEXT PRIMARY KEY,
+    current_state INTEGER,
+    receive_warnings INTEGER,
+    receive_covid_information INTEGER,
+    default_level TEXT,
+    language TEXT,
+    last_bot_message_id
+);
+CREATE TABLE IF NOT EXISTS subscriptions (
+    chat_id TEXT NOT NULL REFERENCES users (chat_id) ON DELETE CASCADE,
+    postal_code TEXT NOT NULL,
+    district_id TEXT NOT NULL,
+    warning TEXT NOT NULL,
+    warning_level TEXT NOT NULL,
+    PRIMARY KEY (chat_id, postal_code, warning)
+);
+CREATE INDEX IF NOT EXISTS idx_subscriptions_postal_code ON subscriptions (postal_code);
+CREATE TABLE IF NOT EXISTS favorites (
+    chat_id TEXT NOT NULL REFERENCES users (chat_id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    postal_code TEXT NOT NULL,
+    district_id TEXT NOT NULL,
+    PRIMARY KEY (chat_id, position)
+);
+CREATE TABLE IF NOT EXISTS received_warnings (
+    chat_id TEXT NOT NULL,
+    warning_id TEXT NOT NULL,
+    PRIMARY KEY (chat_id, warning_id)
+);
+CREATE INDEX IF NOT EXISTS idx_received_warnings_warning_id ON received_warnings (warning_id);
+"""
+
+_USER_COLUMNS = [Attributes.CURRENT_STATE.value, Attributes.RECEIVE_WARNINGS.value,
+                 Attributes.COVID_AUTO_INFO.value, Attributes.DEFAULT_LEVEL.value, Attributes.LANGUAGE.value,
+                 Attributes.LAST_BOT_MESSAGE_ID.value]
+
+
+class SqliteStorage:
+    """
+    Stores users, subscriptions, favorites and received warnings in separate tables of a sqlite database.
+    Reading or writing a user only touches the rows of this user instead of the whole data set.
+    """
+
+    def __init__(self, database_path: str):
+        self.database_path = database_path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(database_path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA foreign_keys=ON")
+        self._connection.executescript(_SCHEMA)
+        self._connection.commit()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def _record_from_rows(self, chat_id: str, user_row: tuple) -> dict:
+        # columns that are NULL were missing in the record that was saved
+        record = {column: value for column, value in zip(_USER_COLUMNS, user_row) if value is not None}
+        if Attributes.RECEIVE_WARNINGS.value in record:
+            record[Attributes.RECEIVE_WARNINGS.value] = bool(record[Attributes.RECEIVE_WARNINGS.value])
+
+        locations = {}
+        for postal_code, district_id, warning, warning_level in self._connection.execute(
+                "SELECT postal_code, district_id, warning, warning_level FROM subscriptions WHERE chat_id = ? "
+                "ORDER BY rowid", (chat_id,)):
+            if postal_code not in locations:
+                locations[postal_code] = {"district_id": district_id}
+            locations[postal_code][warning] = warning_level
+        record[Attributes.LOCATIONS.value] = locations
+
+        record[Attributes.FAVORITES.value] = [
+            {"postal_code": postal_code, "district_id": district_id}
+            for postal_code, district_id in self._connection.execute(
+                "SELECT postal_code, district_id FROM favorites WHERE chat_id = ? ORDER BY position", (chat_id,))
+        ]
+        return record
+
+    def load_users(self) -> dict:
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT chat_id, " + ", ".join(_USER_COLUMNS) + " FROM users ORDER BY rowid").fetchall()
+            return {row[0]: self._record_from_rows(row[0], row[1:]) for row in rows}
+
+    def load_user(self, chat_id: str) -> dict or None:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT " + ", ".join(_USER_COLUMNS) + " FROM users WHERE chat_id = ?", (chat_id,)).fetchone()
+            if row is None:
+                return None
+            return self._record_from_rows(chat_id, row)
+
+    def _save_user(self, chat_id: str, record: dict):
+        # NO LOCK HERE
+        values = [record.get(column) for column in _USER_COLUMNS]
+        self._connection.execute(
+            "INSERT INTO users (chat_id, " + ", ".join(_USER_COLUMNS) + ") VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (chat_id) DO UPDATE SET " + ", ".join(column + " = excluded." + column
+                                                              for column in _USER_COLUMNS),
+            [chat_id] + values)
+
+        self._connection.execute("DELETE FROM subscriptions WHERE chat_id = ?", (chat_id,))
+        for postal_code, subscription in record.get(Attributes.LOCATIONS.value, {}).items():
+            for warning, warning_level in subscription.items():
+                if warning == "district_id":
+                    continue
+                self._connection.execute(
+                    "INSERT INTO subscriptions (chat_id, postal_code, district_id, warning, warning_level) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (chat_id, postal_code, subscription["district_id"], warning, warning_level))
+
+        self._connection.execute("DELETE FROM favorites WHERE chat_id = ?", (chat_id,))
+        self._connection.executemany(
+            "INSERT INTO favorites (chat_id, position, postal_code, district_id) VALUES (?, ?, ?, ?)",
+            [(chat_id, position, favorite["postal_code"], favorite["district_id"])
+             for position, favorite in enumerate(record.get(Attributes.FAVORITES.value, []))])
+
+    def save_user(self, chat_id: str, record: dict):
+        with self._lock, self._connection:
+            self._save_user(chat_id, record)
+
+    def delete_user(self, chat_id: str) -> bool:
+        with self._lock, self._connection:
+            cursor = self._connection.execute("DELETE FROM users WHERE chat_id = ?", (chat_id,))
+            return cursor.rowcount > 0
+
+    def write_users(self, all_users: dict, changed_chat_ids: set[str], deleted_chat_ids: set[str]) -> int:
+        # only the rows of changed and deleted users are written, in one transaction
+        bytes_written = 0
+        with self._lock, self._connection:
+            for chat_id in deleted_chat_ids:
+                self._connection.execute("DELETE FROM users WHERE chat_id = ?", (chat_id,))
+            for chat_id in changed_chat_ids:
+                self._save_user(chat_id, all_users[chat_id])
+                bytes_written += len(json.dumps(all_users[chat_id]))
+        return bytes_written
+
+    def state_token(self) -> int:
+        # data_version only changes when another connection commits
+        with self._lock:
+            return self._connection.execute("PRAGMA data_version").fetchone()[0]
+
+    def load_received_warning_ids(self, chat_id: str) -> list[str]:
+        with self._lock:
+            return [row[0] for row in self._connection.execute(
+                "SELECT warning_id FROM received_warnings WHERE chat_id = ? ORDER BY rowid", (chat_id,))]
+
+    def load_chat_ids_that_received_warning(self, warning_id: str) -> set[str]:
+        with self._lock:
+            return {row[0] for row in self._connection.execute(
+                "SELECT chat_id FROM received_warnings WHERE warning_id = ?", (warning_id,))}
+
+    def add_received_warning_id(self, chat_id: str, warning_id: str):
+        with self._lock, self._connection:
+            self._connection.execute("INSERT OR IGNORE INTO received_warnings (chat_id, warning_id) VALUES (?, ?)",
+                                     (chat_id, warning_id))
+
+    def delete_received_warning_ids(self, chat_id: str):
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM received_warnings WHERE chat_id = ?", (chat_id,))
+
+
+def migrate_json_to_sqlite(user_data_path: str, warnings_already_received_path: str, database_path: str) -> int:
+    """
+    Copies all users and received warnings from the json files into the sqlite database at database_path.
+    Users that already exist in the database are overwritten, the json files are not changed.
+
+    Args:
+        user_data_path: path of data.json
+        warnings_already_received_path: path of warnings_already_received.json
+        database_path: path of the sqlite database, it is created if it does not exist
+
+    Returns:
+        number of users that were migrated
+    """
+    json_storage = JsonStorage(user_data_path, warnings_already_received_path)
+    sqlite_storage = SqliteStorage(database_path)
+    all_users = json_storage.load_users()
+    all_received_warnings = _read_json(warnings_already_received_path)
+
+    with sqlite_storage._lock, sqlite_storage._connection:
+        for chat_id, record in all_users.items():
+            sqlite_storage._save_user(chat_id, record)
+        for chat_id, warning_ids in all_received_warnings.items():
+            sqlite_storage._connection.executemany(
+                "INSERT OR IGNORE INTO received_warnings (chat_id, warning_id) VALUES (?, ?)",
+                [(chat_id, warning_id) for warning_id in warning_ids])
+
+    sqlite_storage.close()
+    return len(all_users)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrates the json user data of the bot into a sqlite database")
+    parser.add_argument("--users", default="data/data.json", help="path of data.json")
+    parser.add_argument("--received", default="data/warnings_already_received.json",
+                        help="path of warnings_already_received.json")
+    parser.add_argument("--database", default="data/data.sqlite", help="path of the sqlite database")
+    arguments = parser.parse_args()
+
+    number_of_users = migrate_json_to_sqlite(arguments.users, arguments.received, arguments.database)
+    print(f"Migrated {number_of_users} user(s) to {arguments.database}")
@@ -1,11 +1,18 @@
+import threading
 import time
 
 import controller
 import data_service
 import enum_types
 import nina_service
+import sender
 from nina_service import WarningCategory, GeneralWarning
 
+_pending_warnings = set()
+"""(chat_id, warning_id) of the warnings that are enqueued but not sent yet, they are not enqueued again"""
+
+_PENDING_WARNINGS_LOCK = threading.Lock()
+
 
 def start_subscriptions():
     """
@@ -20,57 +27,110 @@ def start_subscriptions():
     print("Subscriptions running...")
     subscription_timer_in_seconds = data_service.get_config()['subscription_timer_in_seconds']
     while True:
-        warn_users()
+        try:
+            warn_users()
+        except Exception as e:
+            # one failed run must not stop the subscriptions, the next run tries again
+            print("ERROR: warning the users failed\n" + str(e))
         time.sleep(subscription_timer_in_seconds)
 
 
+def _on_warning_done(chat_id: int, warning_id: str, error: Exception or None):
+    """
+    Marks the warning as received once Telegram accepted it. A warning that could not be sent for a while (e.g. the
+    Nina API or Telegram were not reachable) is not marked, so the next run of warn_users sends it again. A warning
+    Telegram refused for good (e.g. the user blocked the bot) is marked too, it would fail again on every run.
+
+    Args:
+        chat_id: of the user
+        warning_id: of the warning
+        error: None if Telegram accepted the message, else the error
+    """
+    is_permanent_error = error is not None and sender.is_permanent_error(error)
+    if is_permanent_error:
+        print("ERROR: warning " + warning_id + " cannot be sent to chat " + str(chat_id) + "\n" + str(error))
+    if error is None or is_permanent_error:
+        data_service.add_warning_id_to_users_warnings_received_list(chat_id, warning_id)
+    with _PENDING_WARNINGS_LOCK:
+        _pending_warnings.discard((chat_id, warning_id))
+
+
 def warn_users() -> bool:
     """
 
     Warns every user following his warning subscriptions.
+    For every active warning the users to warn are looked up by the postal codes the warning is active in, so only
+    users with a matching subscription are looked at.
 
-    Returns: True if at least one user was warned
+    The warnings are enqueued in the sender, they are marked as received when Telegram accepted them.
+
+    Returns: True if at least one warning was enqueued
 
     """
-    chat_ids_of_warned_users = data_service.get_chat_ids_of_warned_users()
     active_warnings_with_category = nina_service.get_all_active_warnings()
+    postal_codes_of_warnings = data_service.get_active_warnings_dict()
     warnings_sent_counter = 0
-    for chat_id in chat_ids_of_warned_users:
-        postal_codes = data_service.get_user_subscription_postal_codes(chat_id)
-        filtered_warnings = list(filter(lambda x: not data_service.has_user_already_received_warning(chat_id, x[0].id),
-                                        active_warnings_with_category))
-
-        for (warning, warning_category) in filtered_warnings:
-
-            if _any_user_subscription_matches_warning(chat_id, warning, warning_category):
-                warnings_sent = controller.send_detailed_general_warnings(chat_id, [warning], postal_codes)
-                if warnings_sent > 0:
-                    data_service.add_warning_id_to_users_warnings_received_list(chat_id, warning.id)
-                warnings_sent_counter += warnings_sent
+    for (warning, warning_category) in active_warnings_with_category:
+        if warning.id not in postal_codes_of_warnings:
+            # the postal codes of the warning were not computed by the warning_handler yet
+            continue
+
+        subscribers = data_service.get_subscribers_for_postal_codes(postal_codes_of_warnings[warning.id],
+                                                                    str(warning_category.value))
+        if len(subscribers) == 0:
+            continue
+
+        chat_ids_already_warned = data_service.get_chat_ids_that_received_warning(warning.id)
+        for chat_id, subscriptions in subscribers.items():
+            if chat_id in chat_ids_already_warned:
+                continue
+
+            postal_codes = _get_postal_codes_of_matching_subscriptions(subscriptions, warning, warning_category)
+            if len(postal_codes) == 0:
+                continue
+
+            with _PENDING_WARNINGS_LOCK:
+                if (chat_id, warning.id) in _pending_warnings:
+                    continue
+                _pending_warnings.add((chat_id, warning.id))
+
+            try:
+                warnings_sent = controller.send_detailed_general_warnings(
+                    chat_id, [warning], postal_codes, in_background=True,
+                    on_done=lambda warning_id, error, warned_chat_id=chat_id: _on_warning_done(warned_chat_id,
+                                                                                                warning_id, error))
+            except Exception:
+                with _PENDING_WARNINGS_LOCK:
+                    _pending_warnings.discard((chat_id, warning.id))
+                raise
+            if warnings_sent == 0:
+                with _PENDING_WARNINGS_LOCK:
+                    _pending_warnings.discard((chat_id, warning.id))
+            warnings_sent_counter += warnings_sent
 
     print(f'There are {str(len(active_warnings_with_category))} active warnings.')
-    print(f'{warnings_sent_counter} warning(s) were sent out.\n')
+    print(f'{warnings_sent_counter} warning(s) were enqueued.\n')
 
     return warnings_sent_counter > 0
 
 
-def _any_user_subscription_matches_warning(chat_id: int, warning: GeneralWarning,
-                                           warning_category: WarningCategory) -> bool:
+def _get_postal_codes_of_matching_subscriptions(subscriptions: dict, warning: GeneralWarning,
+                                                warning_category: WarningCategory) -> list[str]:
     """
 
     Args:
-        chat_id: of the user
+        subscriptions: dict postal_code -> subscription of the user (like in data_service.get_subscriptions)
         warning: warning that should be checked
         warning_category: of the warning
 
-    Returns: True if user should receive the specified warning
+    Returns: list of the postal codes of all subscriptions the warning matches
 
     """
-    subscriptions = data_service.get_subscriptions(chat_id)
+    postal_codes = []
     for subscription in subscriptions.items():
         if _do_subscription_and_warning_match_severity_and_category(warning, subscription, warning_category):
-            return True
-    return False
+            postal_codes.append(subscription[0])
+    return postal_codes
 
 
 def _do_subscription_and_warning_match_severity_and_category(warning: GeneralWarning,
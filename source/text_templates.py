@@ -1,5 +1,8 @@
+import functools
 import json
 import os
+import re
+import threading
 
 from enum_types import Button, ReplaceableAnswer, Answers, WarningSeverity, BotUsageHelp
 
@@ -8,12 +11,80 @@ file_path = "data/text_templates.json"
 if not os.path.exists(file_path):
     raise FileNotFoundError("text templates file not found in given path")
 
+_templates = None
+"""the parsed text templates, see _index_templates"""
+
+_templates_file_version = None
+"""(modification time, size) of the file the _templates were parsed from"""
+
+_templates_generation = 0
+"""incremented whenever the text templates are (re)loaded"""
+
+_TEMPLATES_LOCK = threading.Lock()
+
 
 def _read_file(path: str):
     with open(path, "r", encoding="utf-8") as file:
         return json.load(file)
 
 
+def _index_templates(data: list) -> dict:
+    """
+    Arguments:
+        data: the decoded text_templates.json, a list of topics
+
+    Returns:
+        dict with 'buttons' (button name by Button value), 'answers' (text by Answers value), 'replaceable_answers'
+        (joined text by ReplaceableAnswer value) and 'complex_answers' (answer dict by name)
+    """
+    templates = {"buttons": {}, "answers": {}, "replaceable_answers": {}, "complex_answers": {}}
+    for topic in data:
+        if topic['topic'] == "buttons" and len(templates["buttons"]) == 0:
+            templates["buttons"] = topic['names']
+        elif topic['topic'] == "answers" and len(templates["answers"]) == 0:
+            templates["answers"] = topic['text']
+        elif topic['topic'] == "replaceable_answers":
+            for answer in topic['all_answers']:
+                text = "".join(information['text'] + "\n" for information in answer['information'])
+                templates["replaceable_answers"][answer['topic']] = \
+                    templates["replaceable_answers"].get(answer['topic'], "") + text
+        elif topic['topic'] == "complex_answers" and len(templates["complex_answers"]) == 0:
+            templates["complex_answers"] = topic["all_answers"]
+    return templates
+
+
+def _get_templates() -> dict:
+    """
+    Returns the indexed text templates. The file is only parsed again when its modification time or size changed, so
+    edits of text_templates.json are picked up without restarting the bot.
+
+    Returns:
+        dict, see _index_templates (must not be changed)
+    """
+    global _templates, _templates_file_version, _templates_generation
+    file_stat = os.stat(file_path)
+    file_version = (file_stat.st_mtime_ns, file_stat.st_size)
+    templates = _templates
+    if templates is not None and file_version == _templates_file_version:
+        return templates
+
+    with _TEMPLATES_LOCK:
+        if _templates is None or file_version != _templates_file_version:
+            _templates = _index_templates(_read_file(file_path))
+            _templates_file_version = file_version
+            _templates_generation += 1
+        return _templates
+
+
+def get_templates_generation() -> int:
+    """
+    Returns:
+        a number that changes whenever text_templates.json is reloaded, for caches of rendered messages
+    """
+    _get_templates()
+    return _templates_generation
+
+
 def get_button_name(button: Button) -> str:
     """
     Returns a string containing the button name of the desired button.
@@ -24,12 +95,7 @@ def get_button_name(button: Button) -> str:
     Returns:
         A String containing the desired button name.
     """
-
-    data = _read_file(file_path)
-
-    for topic in data:
-        if topic['topic'] == "buttons":
-            return topic['names'][button.value]
+    return _get_templates()["buttons"][button.value]
 
 
 def get_answers(answer: Answers) -> str:
@@ -42,12 +108,7 @@ def get_answers(answer: Answers) -> str:
     Returns:
         A String containing the desired answer text.
     """
-
-    data = _read_file(file_path)
-
-    for topic in data:
-        if topic['topic'] == "answers":
-            return topic['text'][answer.value]
+    return _get_templates()["answers"][answer.value]
 
 
 def get_replaceable_answer(r_answer: ReplaceableAnswer) -> str:
@@ -62,18 +123,7 @@ def get_replaceable_answer(r_answer: ReplaceableAnswer) -> str:
     Returns:
         A String containing the desired information.
     """
-    result = ""
-
-    data = _read_file(file_path)
-
-    for topic in data:
-        if topic['topic'] == "replaceable_answers":
-            for answer in topic['all_answers']:
-                if answer['topic'] == r_answer.value:
-                    for information in answer['information']:
-                        result += information['text'] + "\n"
-
-    return result
+    return _get_templates()["replaceable_answers"].get(r_answer.value, "")
 
 
 def _get_complex_answer_dict(name: str) -> dict:
@@ -84,18 +134,54 @@ def _get_complex_answer_dict(name: str) -> dict:
         name: string with the name to search for in the json
 
     Returns:
-        a dictionary with the format requested with name
+        a dictionary with the format requested with name (must not be changed)
     """
-    data = _read_file(file_path)
-
-    for topic in data:
-        if topic['topic'] == "complex_answers":
-            return topic["all_answers"][name]
+    return _get_templates()["complex_answers"][name]
 
 
 # fill in the replaceable answer ---------------------------------------------------------------------------------------
 
 
+@functools.lru_cache(maxsize=256)
+def _compile_template(template: str, placeholders: tuple[str, ...]) -> list[str]:
+    """
+    Splits the template at its placeholders. Longer placeholders are matched first, so %location_button is not taken
+    for %location.
+
+    Arguments:
+        template: string with placeholders of the form %name
+        placeholders: names of the placeholders without %
+
+    Returns:
+        list of segments, the literal text at the even indexes and the names of the placeholders at the odd indexes
+    """
+    if len(placeholders) == 0:
+        return [template]
+    pattern = "%(" + "|".join(re.escape(name) for name in sorted(placeholders, key=len, reverse=True)) + ")"
+    return re.split(pattern, template)
+
+
+def _fill_in(template: str, values: dict, default: str = "-") -> str:
+    """
+    Replaces the placeholders of the template with the values in a single pass, so a placeholder inside a value is
+    never replaced
+
+    Arguments:
+        template: string with placeholders of the form %name
+        values: dict name of the placeholder without % -> value, values that are None are replaced by default
+        default: string for the values that are None
+
+    Returns:
+        the template with the values inserted
+    """
+    segments = _compile_template(template, tuple(sorted(values)))
+    parts = segments.copy()
+    for i in range(1, len(parts), 2):
+        value = values[parts[i]]
+        parts[i] = default if value is None else value
+    return "".join(parts)
+
+
 def get_greeting_message(username: str) -> str:
     """
     This method will replace the placeholder (%name) with the given parameters from the greeting in the json
@@ -103,9 +189,7 @@ def get_greeting_message(username: str) -> str:
     Returns:
         Message that can be sent to the user with the parameter in the message
     """
-    message = get_replaceable_answer(ReplaceableAnswer.GREETING)
-    message = message.replace("%username", username)
-    return message
+    return _fill_in(get_replaceable_answer(ReplaceableAnswer.GREETING), {"username": username})
 
 
 def get_general_warning_message(event: str, headline: str, description: str, severity: str,
@@ -118,46 +202,10 @@ def get_general_warning_message(event: str, headline: str, description: str, sev
         Message that can be sent to the user with the parameter in the message
     """
 
-    placeholder = "-"
-
-    message = get_replaceable_answer(ReplaceableAnswer.GENERAL_WARNING)
-    if event is not None:
-        message = message.replace("%event", event)
-    else:
-        message = message.replace("%event", placeholder)
-    if headline is not None:
-        message = message.replace("%headline", headline)
-    else:
-        message = message.replace("%headline", placeholder)
-    if description is not None:
-        message = message.replace("%description", description)
-    else:
-        message = message.replace("%description", placeholder)
-    if severity is not None:
-        message = message.replace("%severity", severity)
-    else:
-        message = message.replace("%severity", placeholder)
-    if warning_type is not None:
-        message = message.replace("%type", warning_type)
-    else:
-        message = message.replace("%type", placeholder)
-    if start_date is not None:
-        message = message.replace("%start_date", start_date)
-    else:
-        message = message.replace("%start_date", placeholder)
-    if date_expires is not None:
-        message = message.replace("%date_expires", date_expires)
-    else:
-        message = message.replace("%date_expires", placeholder)
-    if status is not None:
-        message = message.replace("%status", status)
-    else:
-        message = message.replace("%status", placeholder)
-    if link is not None:
-        message = message.replace("%link", link)
-    else:
-        message = message.replace("%link", placeholder)
-    return message
+    return _fill_in(get_replaceable_answer(ReplaceableAnswer.GENERAL_WARNING),
+                    {"event": event, "headline": headline, "description": description, "severity": severity,
+                     "type": warning_type, "start_date": start_date, "date_expires": date_expires, "status": status,
+                     "link": link})
 
 
 def get_covid_info_message(location: str, infektionsgefahr_stufe: str, sieben_tage_inzidenz_bundesland: str,
@@ -169,13 +217,11 @@ def get_covid_info_message(location: str, infektionsgefahr_stufe: str, sieben_ta
     Returns:
         Message that can be sent to the user with the parameter in the message
     """
-    message = get_replaceable_answer(ReplaceableAnswer.COVID_INFO)
-    message = message.replace("%location", location)
-    message = message.replace("%infektionsgefahr_stufe", infektionsgefahr_stufe)
-    message = message.replace("%sieben_tage_inzidenz_bundesland", sieben_tage_inzidenz_bundesland)
-    message = message.replace("%sieben_tage_inzidenz_kreis", sieben_tage_inzidenz_kreis)
-    message = message.replace("%allgemeine_hinweise", allgemeine_hinweise)
-    return message
+    return _fill_in(get_replaceable_answer(ReplaceableAnswer.COVID_INFO),
+                    {"location": location, "infektionsgefahr_stufe": infektionsgefahr_stufe,
+                     "sieben_tage_inzidenz_bundesland": sieben_tage_inzidenz_bundesland,
+                     "sieben_tage_inzidenz_kreis": sieben_tage_inzidenz_kreis,
+                     "allgemeine_hinweise": allgemeine_hinweise})
 
 
 def get_covid_rules_message(location: str, vaccine_info: str, contact_terms: str, school_kita_rules: str,
@@ -187,30 +233,11 @@ def get_covid_rules_message(location: str, vaccine_info: str, contact_terms: str
     Returns:
         Message that can be sent to the user with the parameter in the message
     """
-    replacer = get_answers(Answers.UNKNOWN)
-    if location is None:
-        location = replacer
-    if vaccine_info is None:
-        vaccine_info = replacer
-    if contact_terms is None:
-        contact_terms = replacer
-    if school_kita_rules is None:
-        school_kita_rules = replacer
-    if hospital_rules is None:
-        hospital_rules = replacer
-    if travelling_rules is None:
-        travelling_rules = replacer
-    if fines is None:
-        fines = replacer
-    message = get_replaceable_answer(ReplaceableAnswer.COVID_RULES)
-    message = message.replace("%location", location)
-    message = message.replace("%vaccine_info", vaccine_info)
-    message = message.replace("%contact_terms", contact_terms)
-    message = message.replace("%school_kita_rules", school_kita_rules)
-    message = message.replace("%hospital_rules", hospital_rules)
-    message = message.replace("%travelling_rules", travelling_rules)
-    message = message.replace("%fines", fines)
-    return message
+    return _fill_in(get_replaceable_answer(ReplaceableAnswer.COVID_RULES),
+                    {"location": location, "vaccine_info": vaccine_info, "contact_terms": contact_terms,
+                     "school_kita_rules": school_kita_rules, "hospital_rules": hospital_rules,
+                     "travelling_rules": travelling_rules, "fines": fines},
+                    default=get_answers(Answers.UNKNOWN))
 
 
 def get_add_subscription_message() -> str:
@@ -221,9 +248,8 @@ def get_add_subscription_message() -> str:
     Returns:
         message from the json
     """
-    message = get_replaceable_answer(ReplaceableAnswer.ADD_SUBSCRIPTION)
-    message = message.replace("%location_button", get_button_name(Button.SEND_LOCATION))
-    return message
+    return _fill_in(get_replaceable_answer(ReplaceableAnswer.ADD_SUBSCRIPTION),
+                    {"location_button": get_button_name(Button.SEND_LOCATION)})
 
 
 def get_adding_subscription_level_message(location: str, warning: str) -> str:
@@ -238,10 +264,8 @@ def get_adding_subscription_level_message(location: str, warning: str) -> str:
     Returns:
         message from the json with the parameters inserted
     """
-    message = get_replaceable_answer(ReplaceableAnswer.ADDING_SUBSCRIPTION_LEVEL)
-    message = message.replace("%location", location)
-    message = message.replace("%warning", warning)
-    return message
+    return _fill_in(get_replaceable_answer(ReplaceableAnswer.ADDING_SUBSCRIPTION_LEVEL),
+                    {"location": location, "warning": warning})
 
 
 def get_adding_subscription_warning_message(location: str) -> str:
@@ -255,9 +279,7 @@ def get_adding_subscription_warning_message(location: str) -> str:
     Returns:
         message from the json with the parameters inserted
     """
-    message = get_replaceable_answer(ReplaceableAnswer.ADDING_SUBSCRIPTION_WARNING)
-    message = message.replace("%location", location)
-    return message
+    return _fill_in(get_replaceable_answer(ReplaceableAnswer.ADDING_SUBSCRIPTION_WARNING), {"location": location})
 
 
 def get_delete_subscription_message(location: str, warning: str) -> str:
@@ -271,10 +293,8 @@ def get_delete_subscription_message(location: str, warning: str) -> str:
     Returns:
         message from the json with the parameters inserted
     """
-    message = get_replaceable_answer(ReplaceableAnswer.DELETE_SUBSCRIPTION)
-    message = message.replace("%location", location)
-    message = message.replace("%warning", warning)
-    return message
+    return _fill_in(get_replaceable_answer(ReplaceableAnswer.DELETE_SUBSCRIPTION),
+                    {"location": location, "warning": warning})
 
 
 def get_no_current_warnings_message(warning_category: str) -> str:
@@ -284,9 +304,7 @@ def get_no_current_warnings_message(warning_category: str) -> str:
     Returns:
         Message that can be sent to the user with the parameter in the message
     """
-    message = get_replaceable_answer(ReplaceableAnswer.NO_CURRENT_WARNINGS)
-    message = message.replace("%category", warning_category)
-    return message
+    return _fill_in(get_replaceable_answer(ReplaceableAnswer.NO_CURRENT_WARNINGS), {"category": warning_category})
 
 
 # complex answers ------------------------------------------------------------------------------------------------------
@@ -309,14 +327,10 @@ def get_show_subscriptions_for_one_location_messsage(location: str, warnings: li
         string with text for all subscriptions of one location
     """
     dic = _get_complex_answer_dict("show_subscriptions")
-    message = dic["location"]
-    message = message.replace("%location", location)
+    lines = [_fill_in(dic["location"], {"location": location})]
     for (warning, level) in zip(warnings, levels):
-        single_warning = dic["warning"]
-        single_warning = single_warning.replace("%warning", warning)
-        single_warning = single_warning.replace("%level", level)
-        message = message + "\n" + single_warning
-    return message
+        lines.append(_fill_in(dic["warning"], {"warning": warning, "level": level}))
+    return "\n".join(lines)
 
 
 def get_show_subscriptions_message(subscriptions: list[str], only_show: bool = False) -> str:
@@ -359,15 +373,10 @@ def get_delete_subscriptions_for_one_location_messsage(location: str, warnings:
         string with text for all subscriptions of one location and an information to the corresponding button name
     """
     dic = _get_complex_answer_dict("delete_subscription")
-    message = dic["location"]
-    message = message.replace("%location", location)
+    lines = [_fill_in(dic["location"], {"location": location})]
     for (warning, level, button) in zip(warnings, levels, corresponding_button_names):
-        single_warning = dic["warning"]
-        single_warning = single_warning.replace("%warning", warning)
-        single_warning = single_warning.replace("%level", level)
-        single_warning = single_warning.replace("%button_name", button)
-        message = message + "\n" + single_warning
-    return message
+        lines.append(_fill_in(dic["warning"], {"warning": warning, "level": level, "button_name": button}))
+    return "\n".join(lines)
 
 
 def get_delete_subscriptions_message(subscriptions: list[str]) -> str:
@@ -407,17 +416,11 @@ def get_select_location_for_one_location_messsage(district_name: str, place_name
     """
     dic = _get_complex_answer_dict("select_location")
     if place_name is None or place_name == district_name:
-        message = dic["text_without_place"]
-        message = message.replace("%district_name", district_name)
-        message = message.replace("%button_name", corresponding_button_name)
-        message = message.replace("%postal_code", postal_code)
-        return message
-    message = dic["text"]
-    message = message.replace("%place_name", place_name)
-    message = message.replace("%district_name", district_name)
-    message = message.replace("%button_name", corresponding_button_name)
-    message = message.replace("%postal_code", postal_code)
-    return message
+        return _fill_in(dic["text_without_place"], {"district_name": district_name,
+                                                    "button_name": corresponding_button_name,
+                                                    "postal_code": postal_code})
+    return _fill_in(dic["text"], {"place_name": place_name, "district_name": district_name,
+                                  "button_name": corresponding_button_name, "postal_code": postal_code})
 
 
 def get_select_location_message(locations: list[str]) -> str:
@@ -451,9 +454,7 @@ def get_changed_auto_covid_updates_message(interval: str) -> str:
     Returns:
         string with the message informing the user what the new interval of auto covid updates is
     """
-    message = get_replaceable_answer(ReplaceableAnswer.CHANGED_AUTO_COVID_UPDATES)
-    message = message.replace("%interval", interval)
-    return message
+    return _fill_in(get_replaceable_answer(ReplaceableAnswer.CHANGED_AUTO_COVID_UPDATES), {"interval": interval})
 
 
 def get_quickly_add_to_subscriptions_message(location_name: str, warning_name: str) -> str:
@@ -468,10 +469,8 @@ def get_quickly_add_to_subscriptions_message(location_name: str, warning_name: s
     Returns:
         string with the message asking the user if they want to add the warning to their subscriptions
     """
-    message = get_replaceable_answer(ReplaceableAnswer.QUICKLY_ADD_TO_SUBSCRIPTIONS)
-    message = message.replace("%warning", warning_name)
-    message = message.replace("%location", location_name)
-    return message
+    return _fill_in(get_replaceable_answer(ReplaceableAnswer.QUICKLY_ADD_TO_SUBSCRIPTIONS),
+                    {"warning": warning_name, "location": location_name})
 
 
 def get_show_favorites_message(favorites: list[str]) -> str:
@@ -487,7 +486,7 @@ def get_show_favorites_message(favorites: list[str]) -> str:
     dic = _get_complex_answer_dict("favorites")
     message = dic["headline"]
     for favorite in favorites:
-        message = message + "\n" + dic["favorite"].replace("%f", favorite)
+        message = message + "\n" + _fill_in(dic["favorite"], {"f": favorite})
     return message
 
 
@@ -505,8 +504,7 @@ def get_set_default_level_message(level: WarningSeverity) -> str:
     if level == WarningSeverity.MANUAL:
         message = dic["manual"]
     else:
-        message = dic["other"]
-        message = message.replace("%level", get_button_name(Button[level.name]))
+        message = _fill_in(dic["other"], {"level": get_button_name(Button[level.name])})
     return message
 
 
@@ -526,10 +524,7 @@ def get_faq_message(questions: list[str], answers: list[str]) -> str:
 
     message = dic["headline"]
     for (question, answer) in zip(questions, answers):
-        one_faq = dic["question_format"]
-        one_faq = one_faq.replace("%question", question)
-        one_faq = one_faq.replace("%answer", answer)
-        message = message + "\n" + one_faq
+        message = message + "\n" + _fill_in(dic["question_format"], {"question": question, "answer": answer})
     message = message + "\n" + dic["end"]
     return message
 
@@ -547,10 +542,7 @@ def get_faq_message_from_templates() -> str:
 
     message = dic["headline"]
     for (question, answer) in zip(questions, answers):
-        one_faq = dic["question_format"]
-        one_faq = one_faq.replace("%question", question)
-        one_faq = one_faq.replace("%answer", answer)
-        message = message + "\n" + one_faq
+        message = message + "\n" + _fill_in(dic["question_format"], {"question": question, "answer": answer})
     message = message + "\n" + dic["end"]
     return message
 
@@ -1,9 +1,17 @@
+import multiprocessing
 import nina_service
 import place_converter
 import data_service
 import time
 import threading
 
+_warning_pool = None
+"""process pool computing the postal codes of new warnings, None if warnings are processed in this process"""
+
+_warning_pool_postal_codes = None
+"""postal code index table of place_converter when the workers of the _warning_pool were forked, the bitsets of the
+workers refer to it"""
+
 
 def get_all_relevant_warning_ids(general_warnings: list[nina_service.GeneralWarning],
                                  relevant_postal_codes: list[str]) -> list[str]:
@@ -18,19 +26,17 @@ def get_all_relevant_warning_ids(general_warnings: list[nina_service.GeneralWarn
     Returns:
         list of strings with the relevant warning ids for the given parameters
     """
-    all_warnings = data_service.get_active_warnings_dict()
+    all_warnings = data_service.get_active_warning_bitsets()
+    relevant_bitset = data_service.get_postal_code_bitset(relevant_postal_codes)
     result_ids = []
     for warning in general_warnings:
         try:
-            postal_codes_for_warning = all_warnings[warning.id]
+            bitset_of_warning = all_warnings[warning.id]
         except KeyError:
             continue
 
-        for postal_code in relevant_postal_codes:
-            if postal_code in postal_codes_for_warning:
-                if warning.id not in result_ids:
-                    result_ids.append(warning.id)
-                    break
+        if bitset_of_warning & relevant_bitset != 0 and warning.id not in result_ids:
+            result_ids.append(warning.id)
 
     return result_ids
 
@@ -53,6 +59,51 @@ def get_random_postal_code_for_active_warning(general_warning: nina_service.Gene
     return all_warnings[general_warning.id][0]
 
 
+def get_postal_code_bitset(geo_areas) -> int:
+    """
+    Gets the postal codes out of the polygons in geo_areas
+
+    Args:
+        geo_areas: list of GeoCoordinates, used to get the postal codes
+
+    Returns:
+        bitset of the postal codes whose area overlaps with one of the polygons
+        (see place_converter.get_postal_code_bitset)
+    """
+    bitset = 0
+    for area in geo_areas:
+        for coordinates in area.coordinates:
+
+            # this check is needed because sometimes the nina api send us list(list(list(list(float))))
+            # instead of list(list(list(float)))
+            if isinstance(coordinates[0][0], list):
+                for deeper_coordinates in coordinates:
+                    bitset |= place_converter.get_postal_code_bitset_in_polygon(deeper_coordinates)
+            else:
+                bitset |= place_converter.get_postal_code_bitset_in_polygon(coordinates)
+    return bitset
+
+
+def _process_warning(warning_id: str, geo_areas, counter: int):
+    """
+    Computes the postal codes of a warning, runs in a worker process of the _warning_pool
+
+    Args:
+        warning_id: id of the warning
+        geo_areas: used to get the postal codes
+        counter: int, used to count the entries
+
+    Returns:
+        tuple (warning_id, bitset of the postal codes), the bitset is None if the processing failed
+    """
+    try:
+        print("Processing Warning Number: " + str(counter))
+        return warning_id, get_postal_code_bitset(geo_areas)
+    except Exception as e:
+        print("ERROR: processing warning:" + str(counter) + " with id:" + str(warning_id) + " failed\n" + str(e))
+        return warning_id, None
+
+
 def write_postal_codes(warning_id: int, geo_areas, counter: int):
     """
     Gets postal code out of the polygones in geo_ares and writes them into active_warnings_dictionary using
@@ -63,67 +114,154 @@ def write_postal_codes(warning_id: int, geo_areas, counter: int):
         geo_areas: used to get the postal codes
         counter: int, used to count the entries
     """
-    try:
-        print("Processing Warning Number: " + str(counter))
+    warning_id, bitset = _process_warning(warning_id, geo_areas, counter)
+    if bitset is not None:
+        data_service.update_active_warnings_dict({warning_id: bitset}, place_converter.get_postal_code_index_table())
 
-        all_postal_codes = []
-        for area in geo_areas:
-            for coordinates in area.coordinates:
-
-                # this check is needed because sometimes the nina api send us list(list(list(list(float))))
-                # instead of list(list(list(float)))
-                if isinstance(coordinates[0][0], list):
-                    for deeper_coordinates in coordinates:
-                        dicts_in_polygon = place_converter.get_postal_code_dicts_in_polygon(deeper_coordinates)
-                        for dict_in_polygon in dicts_in_polygon:
-                            postal_code = place_converter.get_postal_code_from_dict(dict_in_polygon)
-                            if postal_code not in all_postal_codes:
-                                all_postal_codes.append(postal_code)
-                else:
-                    dicts_in_polygon = place_converter.get_postal_code_dicts_in_polygon(coordinates)
-                    for dict_in_polygon in dicts_in_polygon:
-                        postal_code = place_converter.get_postal_code_from_dict(dict_in_polygon)
-                        if postal_code not in all_postal_codes:
-                            all_postal_codes.append(postal_code)
-
-        data_service.write_to_active_warnings_dict(warning_id, all_postal_codes)
 
-    except Exception as e:
-        print("ERROR: processing warning:" + str(counter) + " with id:" + str(warning_id) + " failed\n" + str(e))
+def _translate_bitset(bitset: int, postal_codes: list[str]) -> int:
+    """
+    Args:
+        bitset: bitset of postal codes that refers to the index table postal_codes
+        postal_codes: an older postal code index table of place_converter
+
+    Returns:
+        the bitset referring to the current index table of place_converter, postal codes it does not have are left out
+    """
+    postal_codes_of_bitset = []
+    while bitset != 0:
+        lowest_bit = bitset & -bitset
+        postal_codes_of_bitset.append(postal_codes[lowest_bit.bit_length() - 1])
+        bitset ^= lowest_bit
+    return place_converter.get_postal_code_bitset(postal_codes_of_bitset)
+
+
+def get_postal_code_bitsets_of_warnings(warnings_with_geo_areas: list[tuple]) -> dict:
+    """
+    Computes the postal codes of many warnings at once, in the _warning_pool if there is one
+
+    Args:
+        warnings_with_geo_areas: list of tuples (warning_id, geo_areas, counter)
+
+    Returns:
+        dict warning_id -> bitset of the postal codes, warnings whose processing failed are left out
+    """
+    if len(warnings_with_geo_areas) == 0:
+        return {}
+
+    if _warning_pool is None:
+        results = [_process_warning(*warning) for warning in warnings_with_geo_areas]
+    else:
+        results = _warning_pool.starmap(_process_warning, warnings_with_geo_areas)
+        if _warning_pool_postal_codes is not place_converter.get_postal_code_index_table():
+            # the workers still use the postal code areas from before place_converter refreshed its reference data,
+            # they are not forked again because this process runs threads now
+            results = [(warning_id, _translate_bitset(bitset, _warning_pool_postal_codes) if bitset is not None
+                        else None) for warning_id, bitset in results]
+
+    return {warning_id: bitset for warning_id, bitset in results if bitset is not None}
+
+
+def update_active_warnings():
+    """
+    Brings active_warnings.json up to date with the active warnings of the Nina API in one write:
+    warnings that are not active anymore are removed, the postal codes of new warnings and of warnings with a new
+    version are computed.
+    """
+    postal_codes = place_converter.get_postal_code_index_table()
+    all_saved_warnings = data_service.get_active_warnings_dict()
+    saved_versions = data_service.get_active_warning_versions()
+    failed_feeds = set()
+    all_active_warnings = nina_service.get_all_active_warnings(failed_feeds)
+    active_versions = {warning.id: warning.version for (warning, _) in all_active_warnings}
+
+    """
+        First: find the warnings that are not active anymore, are new or have a new version
+    """
+    # the warnings of a failed feed are missing, they are kept until the feed can be polled again. Warnings of an
+    # unknown feed are only removed if no feed failed
+    removed_warning_ids = set()
+    for warning_id in all_saved_warnings.keys() - active_versions.keys():
+        feed = nina_service.get_feed_of_warning(warning_id)
+        if feed not in failed_feeds and (feed is not None or len(failed_feeds) == 0):
+            removed_warning_ids.add(warning_id)
+    added_warning_ids = active_versions.keys() - all_saved_warnings.keys()
+    changed_warning_ids = {warning_id for warning_id in active_versions.keys() & all_saved_warnings.keys()
+                           if warning_id in saved_versions and saved_versions[warning_id] != active_versions[warning_id]}
+
+    """
+        Second: compute the postal codes of all new and changed warnings
+    """
+    counter = 0
+    warnings_to_process = []
+    for (active_warning, _) in all_active_warnings:
+        counter += 1
+        if active_warning.id not in added_warning_ids and active_warning.id not in changed_warning_ids:
+            print("Warning Number: " + str(counter) + " already processed")
+            continue
+
+        try:
+            geo_areas = nina_service.get_detailed_warning_geo(active_warning.id, active_warning.version).affected_areas
+        except Exception as e:
+            print("ERROR: loading geo areas of warning:" + str(counter) + " with id:" + str(active_warning.id)
+                  + " failed\n" + str(e))
+            continue
+        warnings_to_process.append((active_warning.id, geo_areas, counter))
+
+    new_entries = get_postal_code_bitsets_of_warnings(warnings_to_process)
+
+    """
+        Third: write all changes at once
+    """
+    # a changed warning keeps its old version if it could not be processed, so it is processed again next time
+    versions = {}
+    for warning_id in all_saved_warnings.keys() - removed_warning_ids:
+        if warning_id in saved_versions:
+            versions[warning_id] = saved_versions[warning_id]
+    for warning_id, version in active_versions.items():
+        is_unchanged = warning_id in all_saved_warnings and warning_id not in changed_warning_ids
+        if warning_id in new_entries or is_unchanged:
+            versions[warning_id] = version
+
+    if len(removed_warning_ids) == 0 and len(new_entries) == 0 and versions == saved_versions:
+        return
+    if postal_codes is not place_converter.get_postal_code_index_table():
+        print("Reference data were refreshed while processing the warnings, they are processed again next time")
+        return
+    data_service.update_active_warnings_dict(new_entries, postal_codes, removed_warning_ids, versions)
 
 
 def start_warning_handler_loop():
     while True:
-        all_saved_warnings = data_service.get_active_warnings_dict()
-        all_active_warnings = nina_service.get_all_active_warnings()
-        """
-            First: remove all warnings in active_warnings.json that are not active anymore
-        """
-        for saved_warning_id in all_saved_warnings:
-            is_active = False
-            for active_warning in all_active_warnings:
-                if active_warning[0].id == saved_warning_id:
-                    is_active = True
-                    break
-            if not is_active:
-                data_service.remove_from_active_warnings_dict(saved_warning_id)
-
-        """
-            Second: compute and add all warnings that are new to active_warnings.json
-        """
-        counter = 0
-        for active_warning in all_active_warnings:
-            counter += 1
-            if active_warning[0].id in all_saved_warnings:
-                print("Warning Number: " + str(counter) + " already processed")
-                continue
-
-            geo_areas = nina_service.get_detailed_warning_geo(active_warning[0].id).affected_areas
-            write_postal_codes(active_warning[0].id, geo_areas, counter)
-
+        update_active_warnings()
         time.sleep(data_service.get_config()['warning_timer_in_seconds'])
 
 
+def init_warning_pool():
+    """
+    Starts the _warning_pool with warning_workers processes from config.json.
+    The workers are forked, so they share the postal code polygons already loaded by place_converter. Without fork
+    (e.g. on Windows) or with less than two workers, the warnings are processed in this process.
+    Has to be called before any thread is started, i.e. before the bot module is imported: a forked child only gets
+    the forking thread and would inherit the locks other threads hold at that moment (e.g. the one of stdout) forever.
+    If other threads are already running, the warnings are processed in this process.
+    """
+    global _warning_pool, _warning_pool_postal_codes
+    _warning_pool = None
+    warning_workers = data_service.get_config().get("warning_workers", 1)
+    if warning_workers < 2:
+        return
+    if "fork" not in multiprocessing.get_all_start_methods():
+        print("Processing warnings without worker processes, fork is not supported on this platform")
+        return
+    if threading.active_count() > 1:
+        print("Processing warnings without worker processes, other threads are running already: "
+              + ", ".join(thread.name for thread in threading.enumerate()))
+        return
+    _warning_pool_postal_codes = place_converter.get_postal_code_index_table()
+    _warning_pool = multiprocessing.get_context("fork").Pool(processes=warning_workers)
+
+
 def init_warning_handler():
     """
     This method will be called when the bot is initialized
@@ -0,0 +1,83 @@
+import sys
+import unittest
+from collections import OrderedDict
+
+import requests
+from mock import patch, MagicMock
+
+sys.path.insert(0, "../source")
+
+import controller
+import nina_service
+from enum_types import WarningSeverity, WarningType
+
+
+def get_test_warning(version: int) -> nina_service.GeneralWarning:
+    return nina_service.GeneralWarning(id="dwd.2.49.0.0.276.0.DWD.PVW", version=version, start_date="2023-01-25 06:00",
+                                       severity=WarningSeverity.SEVERE, type=WarningType.ALERT,
+                                       title="Amtliche WARNUNG vor FROST")
+
+
+test_detail = nina_service.DetailedWarning(
+    id="dwd.2.49.0.0.276.0.DWD.PVW", sender="DWD", date_sent="2023-01-25 05:00", status="Actual",
+    info=nina_service.DetailedWarningInfo(event="FROST", severity=WarningSeverity.SEVERE,
+                                          date_expires="2023-01-26 10:00", headline="Amtliche WARNUNG vor FROST",
+                                          description="Es tritt mäßiger Frost auf.", language="de-DE", area=[]),
+    government_warning_url="https://warnung.bund.de/meldung/dwd.2.49.0.0.276.0.DWD.PVW")
+
+
+@patch("controller._warning_messages", OrderedDict())
+@patch("controller.data_service.set_user_state")
+@patch("controller.warning_handler.get_all_relevant_warning_ids",
+       side_effect=lambda general_warnings, postal_codes: [warning.id for warning in general_warnings])
+@patch("controller.sender.enqueue_message")
+@patch("controller.nina_service.get_detailed_warning", return_value=test_detail)
+class MyTestCase(unittest.TestCase):
+    def test_warning_message_cache(self, get_detailed_warning_mock, enqueue_message_mock, *_):
+        with patch("controller._render_general_warning_message",
+                   wraps=controller._render_general_warning_message) as render_mock:
+            with self.subTest("A warning is fetched and rendered once for all recipients"):
+                for chat_id in range(10):
+                    controller.send_detailed_general_warnings(chat_id, [get_test_warning(1)], ["64283"],
+                                                              in_background=True)
+
+                self.assertEqual(1, get_detailed_warning_mock.call_count)
+                self.assertEqual(1, render_mock.call_count)
+                self.assertEqual(10, enqueue_message_mock.call_count)
+                messages = {enqueue_call.args[1] for enqueue_call in enqueue_message_mock.call_args_list}
+                self.assertEqual(1, len(messages))
+                self.assertIn("FROST", messages.pop())
+                self.assertEqual(WarningSeverity.SEVERE, enqueue_message_mock.call_args.kwargs["severity"])
+
+            with self.subTest("A new version of the warning is rendered again"):
+                controller.send_detailed_general_warnings(10, [get_test_warning(2)], ["64283"], in_background=True)
+
+                self.assertEqual(2, get_detailed_warning_mock.call_count)
+                self.assertEqual(2, render_mock.call_count)
+                get_detailed_warning_mock.assert_called_with(get_test_warning(2).id, language="de", version=2)
+
+            with self.subTest("Changed text templates are rendered again"):
+                with patch("controller.text_templates.get_templates_generation", return_value=-1):
+                    controller.send_detailed_general_warnings(11, [get_test_warning(2)], ["64283"],
+                                                              in_background=True)
+                    controller.send_detailed_general_warnings(12, [get_test_warning(2)], ["64283"],
+                                                              in_background=True)
+
+                self.assertEqual(3, render_mock.call_count)
+
+
+    def test_warning_that_cannot_be_fetched(self, get_detailed_warning_mock, enqueue_message_mock, *_):
+        get_detailed_warning_mock.side_effect = requests.Timeout("Nina API not reachable")
+        on_done = MagicMock()
+
+        controller.send_detailed_general_warnings(10, [get_test_warning(3)], ["64283"], in_background=True,
+                                                  on_done=on_done)
+
+        enqueue_message_mock.assert_not_called()
+        on_done.assert_called_once()
+        self.assertEqual(get_test_warning(3).id, on_done.call_args.args[0])
+        self.assertIsInstance(on_done.call_args.args[1], requests.Timeout)
+
+
+if __name__ == '__main__':
+    unittest.main()
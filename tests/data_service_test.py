@@ -1,7 +1,10 @@
 import importlib.util
+import os
 import unittest
 import sys
 
+from mock import patch
+
 sys.path.insert(0, "..\source")
 
 import data_service
@@ -10,6 +13,7 @@ import enum_types
 file_path = "../source/data/data.json"
 warnings_already_received_path = "../source/data/warnings_already_received.json"
 active_warnings_path = "../source/data/active_warnings.json"
+active_warnings_binary_path = "../source/data/active_warnings.bin"
 
 
 class MyTestCase(unittest.TestCase):
@@ -878,6 +882,190 @@ class MyTestCase(unittest.TestCase):
         # write data back to json from before the test
         data_service._write_file(warnings_already_received_path, saved_received_warnings)
 
+    def test_user_cache_async_flush(self):
+        # read json file and safe the current content before the test
+        user_entries = data_service._read_file(file_path)
+
+        # clear the json file
+        data_service._write_file(file_path, {})
+
+        with patch("data_service._user_cache_flush_mode", "async"), \
+                patch("data_service._user_cache_flush_interval_in_ms", 60000):
+            statistics_before = data_service.get_user_cache_statistics()
+
+            # a read that loads the users from the storage is no cache hit
+            self.assertEqual(0, data_service.get_user_state(10))
+            statistics = data_service.get_user_cache_statistics()
+            self.assertEqual(statistics_before["hits"], statistics["hits"])
+            self.assertEqual(statistics_before["reloads"] + 1, statistics["reloads"])
+
+            # both changes are served from memory but not written yet
+            data_service.set_user_state(10, 2)
+            data_service.set_user_state(10, 3)
+            self.assertEqual(3, data_service.get_user_state(10))
+            self.assertEqual({}, data_service._read_file(file_path))
+
+            # one flush writes both changes
+            data_service.flush_user_cache()
+            self.assertEqual(3, data_service._read_file(file_path)["10"]["current_state"])
+
+            statistics_after = data_service.get_user_cache_statistics()
+            self.assertEqual(statistics_before["flushes"] + 1, statistics_after["flushes"])
+            self.assertLess(statistics_before["hits"], statistics_after["hits"])
+            self.assertLess(statistics_before["bytes_written"], statistics_after["bytes_written"])
+
+        # write data back to json from before the test
+        data_service._write_file(file_path, user_entries)
+
+    def test_user_session(self):
+        # read json file and safe the current content before the test
+        user_entries = data_service._read_file(file_path)
+
+        # clear the json file
+        data_service._write_file(file_path, {})
+        data_service.set_user_state(10, 1)
+
+        statistics_before = data_service.get_user_cache_statistics()
+        with data_service.UserSession(10):
+            data_service.set_user_state(10, 12)
+            data_service.set_last_bot_message_id(10, "42")
+            data_service.add_favorite(10, "22559", "02000")
+
+            # changes are visible inside the session but not written yet
+            self.assertEqual(12, data_service.get_user_state(10))
+            self.assertEqual("42", data_service.get_last_bot_message_id(10))
+            self.assertEqual(1, data_service._read_file(file_path)["10"]["current_state"])
+
+            # changes of another user are not part of the session
+            data_service.set_user_state(20, 2)
+            self.assertEqual(2, data_service._read_file(file_path)["20"]["current_state"])
+
+        # all changes are written together when the session is closed
+        user_10 = data_service._read_file(file_path)["10"]
+        self.assertEqual(12, user_10["current_state"])
+        self.assertEqual("42", user_10["last_bot_message_id"])
+        self.assertEqual({"postal_code": "22559", "district_id": "02000"}, user_10["favorites"][0])
+        statistics_after = data_service.get_user_cache_statistics()
+        self.assertEqual(statistics_before["flushes"] + 2, statistics_after["flushes"])
+
+        # nothing is written if the session is left with an exception
+        with self.assertRaises(RuntimeError):
+            with data_service.UserSession(10):
+                data_service.set_user_state(10, 13)
+                data_service.set_last_bot_message_id(10, "43")
+                raise RuntimeError("handler failed")
+        self.assertEqual(12, data_service.get_user_state(10))
+        self.assertEqual("42", data_service.get_last_bot_message_id(10))
+        self.assertEqual(12, data_service._read_file(file_path)["10"]["current_state"])
+
+        # deleting the user inside a session
+        with data_service.UserSession(10):
+            data_service.set_user_state(10, 0)
+            data_service.delete_user(10)
+        self.assertNotIn("10", data_service._read_file(file_path))
+
+        # write data back to json from before the test
+        data_service._write_file(file_path, user_entries)
+
+    def test_get_district_ids_of_all_favorites(self):
+        # read json file and safe the current content before the test
+        user_entries = data_service._read_file(file_path)
+
+        # clear the json file
+        data_service._write_file(file_path, {})
+        self.assertEqual(set(), data_service.get_district_ids_of_all_favorites())
+
+        data_service.add_favorite(10, "22559", "02000")
+        data_service.add_favorite(20, "01067", "14612")
+        expected_district_ids = {favorite["district_id"] for chat_id in [10, 20]
+                                 for favorite in data_service.get_favorites(chat_id)}
+        self.assertIn("02000", expected_district_ids)
+        self.assertIn("14612", expected_district_ids)
+        self.assertEqual(expected_district_ids, data_service.get_district_ids_of_all_favorites())
+
+        # write data back to json from before the test
+        data_service._write_file(file_path, user_entries)
+
+    def test_get_subscribers_for_postal_codes(self):
+        # read json files and safe the current content before the test
+        user_entries = data_service._read_file(file_path)
+        saved_received_warnings = data_service._read_file(warnings_already_received_path)
+
+        # clear the json files
+        data_service._write_file(file_path, {})
+        data_service._write_file(warnings_already_received_path, {})
+
+        data_service.add_subscription(10, "64283", "06411", "1", "Minor")
+        data_service.add_subscription(10, "10827", "11000", "1", "Severe")
+        data_service.add_subscription(20, "64283", "06411", "2", "Minor")
+
+        # only subscriptions of the requested category and postal codes are returned
+        self.assertEqual({10: {"64283": {"district_id": "06411", "1": "Minor"}}},
+                         data_service.get_subscribers_for_postal_codes(["64283", "99999"], "1"))
+        self.assertEqual({20: {"64283": {"district_id": "06411", "2": "Minor"}}},
+                         data_service.get_subscribers_for_postal_codes(["64283"], "2"))
+
+        # the index follows changes of the subscriptions
+        data_service.delete_subscription(10, "64283", "1")
+        self.assertEqual({10: {"10827": {"district_id": "11000", "1": "Severe"}}},
+                         data_service.get_subscribers_for_postal_codes(["64283", "10827"], "1"))
+
+        # users who do not want to be warned are left out
+        data_service.set_receive_warnings(20, False)
+        self.assertEqual({}, data_service.get_subscribers_for_postal_codes(["64283"], "2"))
+
+        # deleted users are left out
+        data_service.delete_user(10)
+        self.assertEqual({}, data_service.get_subscribers_for_postal_codes(["10827"], "1"))
+
+        data_service.add_warning_id_to_users_warnings_received_list(10, "dwd.1")
+        data_service.add_warning_id_to_users_warnings_received_list(20, "dwd.1")
+        self.assertEqual({10, 20}, data_service.get_chat_ids_that_received_warning("dwd.1"))
+
+        # write data back to json from before the test
+        data_service._write_file(file_path, user_entries)
+        data_service._write_file(warnings_already_received_path, saved_received_warnings)
+
+    def test_update_active_warnings_dict(self):
+        saved_active_warnings = data_service._read_file(active_warnings_path)
+        saved_active_warnings_binary = None
+        if os.path.exists(active_warnings_binary_path):
+            with open(active_warnings_binary_path, "rb") as file_object:
+                saved_active_warnings_binary = file_object.read()
+            os.remove(active_warnings_binary_path)
+
+        # without the binary file the active warnings are converted once from the json file
+        data_service._write_file(active_warnings_path, {"dwd.1": ["64283", "10827"]})
+        self.assertEqual({"dwd.1": ["10827", "64283"]}, data_service.get_active_warnings_dict())
+        self.assertEqual({}, data_service.get_active_warning_versions())
+
+        # entries are added, replaced and removed with one write, the saved bitsets are converted to the new table
+        postal_codes = ["01067", "10827", "22559", "64283", "64291"]
+        data_service.update_active_warnings_dict({"dwd.2": 0b10010, "mow.3": 0}, postal_codes, set(),
+                                                 {"dwd.1": 1, "dwd.2": 2, "mow.3": 1})
+        self.assertEqual({"dwd.1": ["10827", "64283"], "dwd.2": ["10827", "64291"], "mow.3": []},
+                         data_service.get_active_warnings_dict())
+        self.assertEqual({"dwd.1": 0b01010, "dwd.2": 0b10010, "mow.3": 0}, data_service.get_active_warning_bitsets())
+
+        data_service.update_active_warnings_dict({"dwd.2": 0b00100}, postal_codes, {"dwd.1"})
+        self.assertEqual({"dwd.2": ["22559"], "mow.3": []}, data_service.get_active_warnings_dict())
+        self.assertEqual({"dwd.2": 2, "mow.3": 1}, data_service.get_active_warning_versions())
+
+        # membership tests with the bitset of the postal codes of a user
+        user_bitset = data_service.get_postal_code_bitset(["22559", "99999"])
+        self.assertNotEqual(0, data_service.get_active_warning_bitsets()["dwd.2"] & user_bitset)
+        self.assertEqual(0, data_service.get_active_warning_bitsets()["mow.3"] & user_bitset)
+
+        data_service.remove_from_active_warnings_dict("dwd.2")
+        self.assertEqual({"mow.3": []}, data_service.get_active_warnings_dict())
+
+        # write data back to the files from before the test
+        data_service._write_file(active_warnings_path, saved_active_warnings)
+        os.remove(active_warnings_binary_path)
+        if saved_active_warnings_binary is not None:
+            with open(active_warnings_binary_path, "wb") as file_object:
+                file_object.write(saved_active_warnings_binary)
+
     def test_active_warnings_getter_and_setter(self):
         saved_active_warnings = data_service._read_file(active_warnings_path)
 
@@ -0,0 +1,47 @@
+"""
+Compares filter_html_tags with the previous char by char implementation on descriptions like the Nina API sends them.
+Run it from the tests folder: python nina_string_helper_benchmark.py
+"""
+import importlib.util
+import timeit
+
+nina_string_helper = importlib.util.spec_from_file_location \
+    ("nina_string_helper", "../source/nina_string_helper.py").loader.load_module()
+nina_string_helper_test = importlib.util.spec_from_file_location \
+    ("nina_string_helper_test", "nina_string_helper_test.py").loader.load_module()
+
+dwd_description = "Es tritt mäßiger Frost zwischen -5 °C und -10 °C auf. In Bodennähe wird strenger Frost um " \
+                  "-12 °C erwartet.<br/>Es besteht Glättegefahr durch Reif und überfrierende Nässe.&nbsp;" \
+                  "Verbreitet tritt Nebel mit Sichtweiten unter 150 Metern auf.<br/><br/>"
+
+mowas_description = "<p>Im Stadtgebiet ist es zu einem Großbrand gekommen. Dabei entsteht eine erhebliche " \
+                    "Rauchentwicklung.</p><p>Halten Sie Fenster und Türen geschlossen und schalten Sie Lüftungs- " \
+                    "und Klimaanlagen ab.&nbsp;Meiden Sie das betroffene Gebiet.</p><p>Weitere Informationen " \
+                    "erhalten Sie unter <a href=\"https://www.feuerwehr.de/einsatz\">www.feuerwehr.de</a> und im " \
+                    "Radio.</p>"
+
+covid_rules = "<p>Es gelten die Regeln der <a href=\"https://www.bundesregierung.de/regeln\">Bundesregierung" \
+              "</a>.</p><ul><li>Maskenpflicht im Fernverkehr</li><li>Testpflicht in Pflegeheimen</li></ul>"
+
+descriptions = {
+    "dwd": dwd_description,
+    "mowas": mowas_description,
+    "covid rules": covid_rules,
+    "long mowas (x50)": mowas_description * 50,
+}
+
+
+def benchmark(number: int = 200):
+    for name, description in descriptions.items():
+        assert nina_string_helper_test._filter_html_tags_char_by_char(description) == \
+               nina_string_helper.filter_html_tags(description)
+
+        old_time = timeit.timeit(lambda: nina_string_helper_test._filter_html_tags_char_by_char(description),
+                                 number=number)
+        new_time = timeit.timeit(lambda: nina_string_helper.filter_html_tags(description), number=number)
+        print(f"{name:>18} ({len(description):>5} chars): char by char {old_time / number * 1e6:9.1f} µs, "
+              f"single pass {new_time / number * 1e6:7.1f} µs ({old_time / new_time:4.1f}x)")
+
+
+if __name__ == '__main__':
+    benchmark()
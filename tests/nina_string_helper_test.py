@@ -1,10 +1,51 @@
 import importlib.util
+import random
 import unittest
 
 nina_string_helper = importlib.util.spec_from_file_location \
     ("nina_string_helper", "../source/nina_string_helper.py").loader.load_module()
 
 
+def _filter_html_tags_char_by_char(s: str) -> str:
+    """
+    the previous implementation of filter_html_tags, the new one has to return the same for every input
+    """
+    filtered_string = ""
+    opened_brackets_counter = 0
+    link = ""
+    in_text = False
+
+    s = s.replace("&nbsp;", " ")
+
+    for i in range(0, len(s)):
+        c = s[i]
+
+        if c == '<':
+            in_text = False
+            opened_brackets_counter += 1
+
+        if opened_brackets_counter == 0:
+            filtered_string += c
+            if len(link) != 0 and i + 1 < len(s) and s[i + 1] == "<" and in_text:
+                filtered_string += ": " + link
+                link = ""
+
+        if nina_string_helper.find_specific(s, i, "/p"):
+            filtered_string += '\n'
+
+        if not in_text and nina_string_helper.find_specific(s, i, "br"):
+            filtered_string += '\n'
+
+        if nina_string_helper.find_specific(s, i, "href="):
+            link = nina_string_helper.extract_till_char(s, i + len("href=\""), '"')
+
+        if c == '>':
+            opened_brackets_counter -= 1
+            in_text = True
+
+    return filtered_string
+
+
 class MyTestCase(unittest.TestCase):
     def test_expand_location_id_with_zeros(self):
         # test with a string length 3, so 9 zeros have to be appended
@@ -51,6 +92,17 @@ class MyTestCase(unittest.TestCase):
         self.assertEqual(should_be, nina_string_helper.filter_html_tags(input_value))
 
 
+    def test_filter_html_tags_same_as_char_by_char(self):
+        # random strings made of the parts the filter reacts to, including unbalanced tags and links without quotes
+        parts = ["<", ">", "/", "p", "b", "r", "href=", "\"", "&nbsp;", "<a href=\"https://www.dwd.de\">", "</a>",
+                 "</p>", "<br>", "<br/>", "Text", " ", "Februar", "km/pro", "x"]
+        random_generator = random.Random(42)
+        for _ in range(5000):
+            input_value = "".join(random_generator.choice(parts) for _ in range(random_generator.randint(0, 30)))
+            self.assertEqual(_filter_html_tags_char_by_char(input_value),
+                             nina_string_helper.filter_html_tags(input_value), input_value)
+
+
 if __name__ == '__main__':
     unittest.main()
 
@@ -1,35 +1,39 @@
 import unittest
 import importlib.util
+import sys
+
+import numpy
+import shapely
+
+sys.path.insert(0, "../source")
 
 place_converter = importlib.util.spec_from_file_location("place_converter", "../source/place_converter.py") \
     .loader.load_module()
+import reference_data
 
 
-class MyTestCase(unittest.TestCase):
+def _set_reference_data_again():
+    """
+    builds the indices of the reference data in use again, like a refresh of the reference data does
+    """
+    place_converter._set_reference_data(place_converter._districts_dictionary, place_converter._places_dictionary,
+                                        place_converter._postal_code_dictionary,
+                                        place_converter.get_reference_data_statistics()["created_at"])
+
 
-    def test_fill_districts_dict(self):
-        # method does not return anything
-        self.assertEqual(None, place_converter._fill_districts_dict())
+class MyTestCase(unittest.TestCase):
 
-        # dictionary test
+    def test_districts_dict(self):
         input_value = "06434"
         should_be = "Hochtaunuskreis"
         self.assertEqual(should_be, place_converter._districts_dictionary[input_value])
 
-    def test_fill_places_dict(self):
-        # method does not return anything
-        self.assertEqual(None, place_converter._fill_places_dict())
-
-        # dictionary test
+    def test_places_dict(self):
         input_value = "064120000000"
         should_be = "Frankfurt am Main, Stadt"
         self.assertEqual(should_be, place_converter._places_dictionary[input_value])
 
-    def test_fill_postal_code_dict(self):
-        # method does not return anything
-        self.assertEqual(None, place_converter._fill_postal_code_dict())
-
-        # dictionary test
+    def test_postal_code_dict(self):
         input_value = "84076"
         should_be = ["Pfeffenhausen", "09274", [[11.8779226, 48.6537032], [11.8779944, 48.6539414],
                                                 [11.8782944, 48.654433], [11.8783462, 48.6545877],
@@ -478,17 +482,37 @@ class MyTestCase(unittest.TestCase):
                                                 [11.8800234, 48.6540692], [11.8791838, 48.653649],
                                                 [11.8788852, 48.6535999], [11.8782872, 48.6537154],
                                                 [11.8779226, 48.6537032]]]
-        self.assertEqual(should_be, place_converter._postal_code_dictionary[input_value])
-
-    def test_fill_postal_place_dict(self):
-        # method does not return anything
-        self.assertEqual(None, place_converter._fill_postal_place_dict())
+        # the polygon area is a numpy array if the reference data were read from the snapshot
+        record = place_converter._postal_code_dictionary[input_value]
+        self.assertEqual(should_be[0:2], record[0:2])
+        self.assertEqual(should_be[2], numpy.asarray(record[2]).tolist())
 
-        # dictionary test
+    def test_postal_place_dict(self):
         input_value = "84076"
         should_be = "Pfeffenhausen"
         self.assertEqual(should_be, place_converter._postal_place_dictionary[input_value])
 
+    def test_set_reference_data(self):
+        previous_reference_data = (place_converter._districts_dictionary, place_converter._places_dictionary,
+                                   place_converter._postal_code_dictionary,
+                                   place_converter.get_reference_data_statistics()["created_at"])
+        content = reference_data.encode_snapshot(
+            {"06434": "Hochtaunuskreis"}, {"064340008008": "Oberursel (Taunus), Stadt"},
+            {"61440": ["Oberursel (Taunus)", "06434", [[8.55, 50.19], [8.59, 50.19], [8.59, 50.21], [8.55, 50.19]]]},
+            1700000000.5)
+        try:
+            created_at, districts, places, postal_codes = reference_data.decode_snapshot(content)
+            place_converter._set_reference_data(districts, places, postal_codes, created_at)
+
+            self.assertEqual({"61440": "Oberursel (Taunus)"}, place_converter._postal_place_dictionary)
+            self.assertEqual(["61440"], place_converter.get_postal_code_index_table())
+            self.assertEqual(1700000000.5, place_converter.get_reference_data_statistics()["created_at"])
+            self.assertEqual(0, place_converter.get_suggestion_cache_statistics()["size"])
+            self.assertEqual("Oberursel (Taunus)",
+                             place_converter.get_non_covid_dict_suggestions("Oberursel")[0]["place_name"])
+        finally:
+            place_converter._set_reference_data(*previous_reference_data)
+
     def test_get_exact_address_from_coordinates(self):
         # if district is not mentioned in address
         input_lat = 49.866888380007595
@@ -502,6 +526,20 @@ class MyTestCase(unittest.TestCase):
         should_be = ("Groß-Gerau", "64521")
         self.assertEqual(should_be, place_converter._get_exact_address_from_coordinates(input_lat, input_lon))
 
+    def test_get_postal_code_of_coordinates(self):
+        # a point inside of the area of 84076
+        point = shapely.Polygon(place_converter._postal_code_dictionary["84076"][2]).representative_point()
+        self.assertEqual("84076", place_converter._get_postal_code_of_coordinates(point.y, point.x))
+
+        # Darmstadt (the same coordinates Nominatim resolves in test_get_non_covid_dict_from_coordinates)
+        result = place_converter._get_postal_code_of_coordinates(49.866888380007595, 8.637452871622893)
+        self.assertEqual("Darmstadt", place_converter.get_place_name_for_postal_code(result))
+
+        # the north sea is outside of all postal code areas
+        self.assertEqual(None, place_converter._get_postal_code_of_coordinates(54.5, 6.5))
+        with self.assertRaises(KeyError):
+            place_converter.get_non_covid_dict_from_coordinates(54.5, 6.5, nominatim_fallback=False)
+
     def test_get_suggestions_for_place_name(self):
         input_name = "Oberursel"
         input_limit = 11
@@ -532,6 +570,22 @@ class MyTestCase(unittest.TestCase):
         should_be = "Hochtaunuskreis"
         self.assertEqual(should_be, result_list[0]['district_name'])
 
+    def test_extract_suggestions(self):
+        # the trigram shortlist has to return the same top 11 as scoring the whole dictionary
+        input_names = ["Oberursel", "Frankfurt", "Frankfurt am Main", "Darmstadt", "Darmstdt", "Muenchen", "München",
+                       "Berlin", "Hamburg", "Köln", "Pfeffenhausen", "Landshut", "Gießen", "Giessen", "Bad Homburg",
+                       "Groß-Gerau", "Gross Gerau", "Halle (Saale)", "Freiburg", "Hochtaunuskreis", "Stadt",
+                       "Neustadt an der Weinstraße", "Rothenburg ob der Tauber", "Xyz"]
+        dictionaries = {'places': place_converter._places_dictionary,
+                        'postal_places': place_converter._postal_place_dictionary,
+                        'districts': place_converter._districts_dictionary}
+        for index_name, dictionary in dictionaries.items():
+            for input_name in input_names:
+                with self.subTest(index_name=index_name, input_name=input_name):
+                    should_be = place_converter.process.extract(input_name, dictionary, limit=11)
+                    self.assertEqual(should_be,
+                                     place_converter._extract_suggestions(input_name, dictionary, index_name, 11))
+
     def test_get_district_dict_suggestions(self):
         input_name = "Hochtaunuskreis"
         input_limit = 11
@@ -640,6 +694,15 @@ class MyTestCase(unittest.TestCase):
         should_be = []
         self.assertEqual(should_be, place_converter.get_dicts_for_exact_place_name(input_value))
 
+    def test_is_exact_location_name(self):
+        # name of a postal code area
+        self.assertTrue(place_converter.is_exact_location_name("Oberursel (Taunus)"))
+        # name of a district
+        self.assertTrue(place_converter.is_exact_location_name("Hochtaunuskreis"))
+        # only fuzzy matches
+        self.assertFalse(place_converter.is_exact_location_name("oberursel"))
+        self.assertFalse(place_converter.is_exact_location_name("no"))
+
     def test_get_dict_suggestions(self):
         # numeric string -> postal code search
         input_value = "61440"
@@ -672,6 +735,32 @@ class MyTestCase(unittest.TestCase):
         should_be = "06434"
         self.assertEqual(should_be, result_list[0]['district_id'])
 
+    def test_suggestion_cache(self):
+        _set_reference_data_again()
+        result = place_converter.get_non_covid_dict_suggestions("Darmstadt")
+        statistics = place_converter.get_suggestion_cache_statistics()
+        self.assertEqual(1, statistics['size'])
+
+        # the same normalized query is answered from the cache
+        self.assertIs(result, place_converter.get_non_covid_dict_suggestions(" DARMSTADT "))
+        self.assertIs(result, place_converter.get_non_covid_dict_suggestions("darmstadt!"))
+        self.assertEqual(statistics['hits'] + 2, place_converter.get_suggestion_cache_statistics()['hits'])
+        self.assertEqual("Darmstadt", result[0]['place_name'])
+
+        # other functions and limits are cached separately
+        self.assertIsNot(result, place_converter.get_dict_suggestions("Darmstadt"))
+        self.assertIsNot(result, place_converter.get_non_covid_dict_suggestions("Darmstadt", 5))
+        self.assertEqual(3, place_converter.get_suggestion_cache_statistics()['size'])
+
+        # cached results cannot be changed
+        with self.assertRaises(TypeError):
+            result[0]['place_name'] = "changed"
+
+        # new reference data invalidate the cache
+        _set_reference_data_again()
+        self.assertEqual(0, place_converter.get_suggestion_cache_statistics()['size'])
+        self.assertIsNot(result, place_converter.get_non_covid_dict_suggestions("Darmstadt"))
+
     def test_get_place_name_from_dict(self):
         # place name is not None
         input_value = {'district_name': 'district', 'district_id': '12345', 'place_name': 'place',
@@ -0,0 +1,93 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, "../source")
+
+import reference_data
+
+test_districts = {"06411": "Darmstadt", "06434": "Hochtaunuskreis"}
+
+test_places = {"064110000000": "Darmstadt, Wissenschaftsstadt", "064340008008": "Oberursel (Taunus), Stadt"}
+
+test_postal_codes = {
+    "64283": ["Darmstadt", "06411", [[8.64, 49.87], [8.66, 49.87], [8.66, 49.88], [8.64, 49.87]]],
+    "61440": ["Oberursel (Taunus)", "06434", [[8.55, 50.19], [8.59, 50.19], [8.59, 50.21], [8.57, 50.22],
+                                              [8.55, 50.19]]]
+}
+
+
+class MyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_parse(self):
+        converted_covid_districts = {"06411": {"n": "Darmstadt", "k": 12}}
+        self.assertEqual({"06411": "Darmstadt"}, reference_data.parse_districts(converted_covid_districts))
+
+        # places of unknown districts are left out, unless they are no municipality (third entry is None)
+        bevoelkerungsstaat_key = {"daten": [["064110000000", "Darmstadt, Wissenschaftsstadt", "1"],
+                                            ["099990000000", "Unbekannt", "1"],
+                                            ["060000000000", "Hessen", None]]}
+        self.assertEqual({"064110000000": "Darmstadt, Wissenschaftsstadt", "060000000000": "Hessen"},
+                         reference_data.parse_places(bevoelkerungsstaat_key, {"06411": "Darmstadt"}))
+
+        postal_code_table = {"records": [{"fields": {"plz_code": "64283", "plz_name": "Darmstadt", "krs_code": "06411",
+                                                     "geometry": {"coordinates": [test_postal_codes["64283"][2]]}}}]}
+        self.assertEqual({"64283": test_postal_codes["64283"]}, reference_data.parse_postal_codes(postal_code_table))
+
+    def test_snapshot(self):
+        path = os.path.join(self.directory.name, "reference_data.bin")
+        reference_data.write_snapshot(path, test_districts, test_places, test_postal_codes, 1700000000.5)
+        created_at, districts, places, postal_codes = reference_data.read_snapshot(path)
+        self.assertEqual(1700000000.5, created_at)
+        self.assertEqual(test_districts, districts)
+        self.assertEqual(test_places, places)
+
+        # the polygon areas are read only numpy arrays, the order of the dictionaries is kept
+        self.assertEqual(list(test_postal_codes), list(postal_codes))
+        for postal_code, record in postal_codes.items():
+            self.assertEqual(test_postal_codes[postal_code][0:2], record[0:2])
+            self.assertEqual(test_postal_codes[postal_code][2], record[2].tolist())
+            self.assertFalse(record[2].flags.writeable)
+
+        # empty reference data
+        reference_data.write_snapshot(path, {}, {}, {}, 0.0)
+        self.assertEqual((0.0, {}, {}, {}), reference_data.read_snapshot(path))
+
+    def test_broken_snapshot(self):
+        content = reference_data.encode_snapshot(test_districts, test_places, test_postal_codes, 0.0)
+        with self.assertRaises(ValueError):
+            reference_data.decode_snapshot(b"NWAW" + content[4:])
+        with self.assertRaises(ValueError):
+            reference_data.decode_snapshot(content[:4] + bytes([reference_data._SNAPSHOT_FORMAT_VERSION + 1])
+                                           + content[5:])
+        with self.assertRaises(ValueError):
+            reference_data.decode_snapshot(content[:-8])
+        with self.assertRaises(ValueError):
+            reference_data.decode_snapshot(content[:10])
+
+        # polygon areas have to be lists of points
+        with self.assertRaises(ValueError):
+            reference_data.encode_snapshot({}, {}, {"64283": ["Darmstadt", "06411", [[[8.64, 49.87]]]]}, 0.0)
+
+    def test_read_reference_data_files(self):
+        paths = []
+        for name, content in [("districts.json", {"06411": {"n": "Darmstadt"}}),
+                              ("places.json", {"daten": [["064110000000", "Darmstadt, Wissenschaftsstadt", "1"]]}),
+                              ("postal_codes.json", {"records": []})]:
+            paths.append(os.path.join(self.directory.name, name))
+            with open(paths[-1], "w", encoding="utf-8") as file_object:
+                json.dump(content, file_object)
+
+        self.assertEqual(({"06411": "Darmstadt"}, {"064110000000": "Darmstadt, Wissenschaftsstadt"}, {}),
+                         reference_data.read_reference_data_files(*paths))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,206 @@
+import sys
+import threading
+import time
+import unittest
+from collections import deque
+
+import telebot.apihelper
+from mock import patch
+
+sys.path.insert(0, "../source")
+
+import sender
+from enum_types import WarningSeverity
+
+
+def get_too_many_requests_exception(retry_after: int) -> telebot.apihelper.ApiTelegramException:
+    return telebot.apihelper.ApiTelegramException("sendMessage", None, {
+        "ok": False, "error_code": 429, "description": "Too Many Requests: retry after " + str(retry_after),
+        "parameters": {"retry_after": retry_after}})
+
+
+class MyTestCase(unittest.TestCase):
+    def test_token_bucket(self):
+        bucket = sender.TokenBucket(10, 2)
+
+        # the burst of the capacity is allowed right away, then one token every 1/rate seconds
+        self.assertEqual(0, bucket.reserve())
+        self.assertEqual(0, bucket.reserve())
+        self.assertAlmostEqual(0.1, bucket.reserve(), delta=0.01)
+        self.assertAlmostEqual(0.2, bucket.reserve(), delta=0.01)
+
+        # retry_after of Telegram blocks the bucket
+        bucket.pause(1)
+        self.assertAlmostEqual(1.1, bucket.reserve(), delta=0.01)
+
+    @patch("sender.bot.send_message")
+    def test_send_message(self, send_message_mock):
+        send_message_mock.side_effect = lambda chat_id, text, reply_markup=None: text
+
+        self.assertEqual("Hallo", sender.send_message(10, "Hallo"))
+        send_message_mock.assert_called_with(10, "Hallo", reply_markup=None)
+
+        with self.subTest("Telegram answers with 429 Too Many Requests"):
+            send_message_mock.side_effect = [get_too_many_requests_exception(1), "Hallo"]
+            statistics = sender.get_send_statistics()
+            start_time = time.monotonic()
+            self.assertEqual("Hallo", sender.send_message(20, "Hallo"))
+            self.assertGreaterEqual(time.monotonic() - start_time, 0.9)
+            self.assertEqual(statistics["retries"] + 1, sender.get_send_statistics()["retries"])
+
+        with self.subTest("Other errors are raised in the calling thread"):
+            send_message_mock.side_effect = telebot.apihelper.ApiTelegramException("sendMessage", None, {
+                "ok": False, "error_code": 403, "description": "Forbidden: bot was blocked by the user"})
+            with self.assertRaises(telebot.apihelper.ApiTelegramException):
+                sender.send_message(30, "Hallo")
+
+    def test_is_permanent_error(self):
+        self.assertTrue(sender.is_permanent_error(telebot.apihelper.ApiTelegramException("sendMessage", None, {
+            "ok": False, "error_code": 403, "description": "Forbidden: bot was blocked by the user"})))
+        self.assertFalse(sender.is_permanent_error(get_too_many_requests_exception(5)))
+        self.assertFalse(sender.is_permanent_error(ConnectionError("Telegram not reachable")))
+
+    @patch("sender.bot.send_message")
+    def test_interactive_messages_first(self, send_message_mock):
+        sent_messages = []
+        blocked_workers = threading.Semaphore(0)
+        release_first_message = threading.Event()
+
+        def send_message(chat_id, text, reply_markup=None):
+            if text == "first":
+                blocked_workers.release()
+                release_first_message.wait(timeout=10)
+            sent_messages.append(text)
+            return text
+
+        send_message_mock.side_effect = send_message
+
+        try:
+            # all workers are busy with the first messages until the interactive reply is enqueued
+            blocking_messages = [sender.enqueue_message(100 + i, "first") for i in range(sender._sender_workers)]
+            for _ in range(sender._sender_workers):
+                self.assertTrue(blocked_workers.acquire(timeout=10), "not all workers took a first message")
+            background_message = sender.enqueue_message(200, "background")
+            interactive_thread = threading.Thread(target=sender.send_message, args=(300, "interactive"))
+            interactive_thread.start()
+            deadline = time.monotonic() + 10
+            while sender.get_send_statistics()["queue_depth"] < 2 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertGreaterEqual(sender.get_send_statistics()["queue_depth"], 2)
+        finally:
+            release_first_message.set()
+
+        interactive_thread.join(timeout=10)
+        self.assertFalse(interactive_thread.is_alive())
+        background_message.result(timeout=10)
+        for message in blocking_messages:
+            message.result(timeout=10)
+        self.assertLess(sent_messages.index("interactive"), sent_messages.index("background"))
+        lane_statistics = sender.get_send_statistics()["lanes"]["interactive"]
+        self.assertGreater(lane_statistics["sent"], 0)
+        self.assertEqual(lane_statistics["sent"], sum(lane_statistics["latency_histogram"]))
+
+    @patch("sender.bot.send_message")
+    def test_reply_before_queued_warnings_of_same_chat(self, send_message_mock):
+        sent_messages = []
+        first_message_sent = threading.Event()
+        release_first_message = threading.Event()
+
+        def send_message(chat_id, text, reply_markup=None):
+            if text == "first":
+                first_message_sent.set()
+                release_first_message.wait(timeout=10)
+            sent_messages.append(text)
+            return text
+
+        send_message_mock.side_effect = send_message
+
+        try:
+            first_message = sender.enqueue_message(500, "first")
+            self.assertTrue(first_message_sent.wait(timeout=10))
+            warnings = [sender.enqueue_message(500, "warning " + str(i)) for i in range(2)]
+            interactive_thread = threading.Thread(target=sender.send_message, args=(500, "interactive"))
+            interactive_thread.start()
+            deadline = time.monotonic() + 10
+            while sender.get_send_statistics()["lanes"]["interactive"]["queue_depth"] < 1 \
+                    and time.monotonic() < deadline:
+                time.sleep(0.01)
+        finally:
+            release_first_message.set()
+
+        interactive_thread.join(timeout=10)
+        self.assertFalse(interactive_thread.is_alive())
+        first_message.result(timeout=10)
+        for warning in warnings:
+            warning.result(timeout=10)
+        self.assertEqual(["first", "interactive", "warning 0", "warning 1"], sent_messages)
+
+    def test_pop_next_message(self):
+        def pop_next_text() -> str:
+            with sender._LANES_CONDITION:
+                message = sender._pop_next_message()
+                return message.send_function(message.chat_id) if message is not None else None
+
+        def get_test_message(text: str, lane: int, waited_in_seconds: float = 0,
+                             chat_id: int = 10) -> sender._OutboundMessage:
+            message = sender._OutboundMessage(chat_id, lambda _: text, lane)
+            message.enqueued_at -= waited_in_seconds
+            return message
+
+        overdue_in_seconds = sender._lane_max_wait_in_seconds + 1
+
+        # the messages are not enqueued with _enqueue, so the running workers are not woken up
+        with patch("sender._lanes", [deque() for _ in sender._LANE_NAMES]) as lanes, \
+                patch("sender._chats_in_progress", set()) as chats_in_progress, \
+                patch("sender._messages_since_promotion", sender._STARVATION_PROMOTION_INTERVAL):
+            with self.subTest("Interactive replies first, then the warnings by severity"):
+                for text, severity in [("minor", WarningSeverity.MINOR), ("severe", WarningSeverity.SEVERE),
+                                       ("extreme", WarningSeverity.EXTREME), ("unknown", None)]:
+                    lane = sender._WARNING_LANES.get(severity, sender.BULK_LANE)
+                    lanes[lane].append(get_test_message(text, lane))
+                lanes[sender.INTERACTIVE_LANE].append(get_test_message("interactive", sender.INTERACTIVE_LANE))
+
+                texts = [pop_next_text() for _ in range(5)]
+                self.assertEqual(["interactive", "extreme", "severe", "minor", "unknown"], texts)
+                self.assertIsNone(pop_next_text())
+
+            with self.subTest("Overdue Minor warnings of a storm do not go before replies and Extreme warnings"):
+                for i in range(3000):
+                    lanes[sender.BULK_LANE].append(get_test_message("minor", sender.BULK_LANE, overdue_in_seconds,
+                                                                    chat_id=1000 + i))
+                lanes[sender.EXTREME_LANE].append(get_test_message("extreme", sender.EXTREME_LANE))
+                lanes[sender.INTERACTIVE_LANE].append(get_test_message("interactive", sender.INTERACTIVE_LANE))
+
+                self.assertEqual("interactive", pop_next_text())
+                self.assertEqual("extreme", pop_next_text())
+
+            with self.subTest("At most one overdue message per promotion interval goes before higher lanes"):
+                statistics = sender.get_send_statistics()
+                for i in range(3 * sender._STARVATION_PROMOTION_INTERVAL):
+                    lanes[sender.SEVERE_LANE].append(get_test_message("severe", sender.SEVERE_LANE,
+                                                                      chat_id=5000 + i))
+                texts = [pop_next_text() for _ in range(3 * sender._STARVATION_PROMOTION_INTERVAL)]
+                promoted_positions = [i for i, text in enumerate(texts) if text == "minor"]
+
+                self.assertGreater(len(promoted_positions), 0)
+                self.assertLessEqual(len(promoted_positions), 3)
+                for previous_position, position in zip(promoted_positions, promoted_positions[1:]):
+                    self.assertGreaterEqual(position - previous_position, sender._STARVATION_PROMOTION_INTERVAL)
+                self.assertEqual(statistics["starvation_promotions"] + len(promoted_positions),
+                                 sender.get_send_statistics()["starvation_promotions"])
+                lanes[sender.SEVERE_LANE].clear()
+                lanes[sender.BULK_LANE].clear()
+
+            with self.subTest("Messages to chats a worker is sending to are skipped"):
+                lanes[sender.INTERACTIVE_LANE].append(get_test_message("busy", sender.INTERACTIVE_LANE, chat_id=10))
+                lanes[sender.BULK_LANE].append(get_test_message("free", sender.BULK_LANE, chat_id=20))
+                chats_in_progress.add(10)
+
+                self.assertEqual("free", pop_next_text())
+                self.assertIsNone(pop_next_text())
+                chats_in_progress.discard(10)
+                self.assertEqual("busy", pop_next_text())
+
+
+if __name__ == '__main__':
+    unittest.main()
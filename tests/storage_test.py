@@ -0,0 +1,107 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, "../source")
+
+import storage
+
+test_user = {
+    "current_state": 101,
+    "receive_warnings": False,
+    "receive_covid_information": 0,
+    "default_level": "Manual",
+    "locations": {
+        "64287": {
+            "district_id": "06411",
+            "weather": "Severe",
+            "flood": "Minor"
+        },
+        "99099": {
+            "district_id": "16051",
+            "civil_protection": "Minor"
+        }
+    },
+    "favorites": [
+        {
+            "postal_code": "64291",
+            "district_id": "06411"
+        },
+        {
+            "postal_code": "10827",
+            "district_id": "11000"
+        }
+    ],
+    "language": "german",
+    "last_bot_message_id": 1234
+}
+
+
+class MyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.database_path = os.path.join(self.directory.name, "data.sqlite")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_sqlite_storage_users(self):
+        sqlite_storage = storage.SqliteStorage(self.database_path)
+
+        # user is not in the database yet
+        self.assertEqual(None, sqlite_storage.load_user("10"))
+
+        # saving and loading a user returns the same record
+        sqlite_storage.save_user("10", test_user)
+        self.assertEqual(test_user, sqlite_storage.load_user("10"))
+        self.assertEqual({"10": test_user}, sqlite_storage.load_users())
+
+        # overwriting a user replaces subscriptions and favorites
+        changed_user = json.loads(json.dumps(test_user))
+        del changed_user["locations"]["99099"]
+        changed_user["favorites"].reverse()
+        sqlite_storage.save_user("10", changed_user)
+        self.assertEqual(changed_user, sqlite_storage.load_user("10"))
+
+        # deleting a user
+        self.assertTrue(sqlite_storage.delete_user("10"))
+        self.assertFalse(sqlite_storage.delete_user("10"))
+        self.assertEqual({}, sqlite_storage.load_users())
+        sqlite_storage.close()
+
+    def test_sqlite_storage_received_warnings(self):
+        sqlite_storage = storage.SqliteStorage(self.database_path)
+
+        self.assertEqual([], sqlite_storage.load_received_warning_ids("10"))
+
+        sqlite_storage.add_received_warning_id("10", "dwd.1")
+        sqlite_storage.add_received_warning_id("10", "mow.2")
+        sqlite_storage.add_received_warning_id("20", "dwd.1")
+        self.assertEqual(["dwd.1", "mow.2"], sqlite_storage.load_received_warning_ids("10"))
+        self.assertEqual({"10", "20"}, sqlite_storage.load_chat_ids_that_received_warning("dwd.1"))
+
+        sqlite_storage.delete_received_warning_ids("10")
+        self.assertEqual([], sqlite_storage.load_received_warning_ids("10"))
+        self.assertEqual(["dwd.1"], sqlite_storage.load_received_warning_ids("20"))
+        sqlite_storage.close()
+
+    def test_migrate_json_to_sqlite(self):
+        user_data_path = os.path.join(self.directory.name, "data.json")
+        received_path = os.path.join(self.directory.name, "warnings_already_received.json")
+        with open(user_data_path, "w") as file:
+            json.dump({"10": test_user, "20": test_user}, file)
+        with open(received_path, "w") as file:
+            json.dump({"10": ["dwd.1", "lhp.2"]}, file)
+
+        self.assertEqual(2, storage.migrate_json_to_sqlite(user_data_path, received_path, self.database_path))
+
+        sqlite_storage = storage.SqliteStorage(self.database_path)
+        self.assertEqual({"10": test_user, "20": test_user}, sqlite_storage.load_users())
+        self.assertEqual(["dwd.1", "lhp.2"], sqlite_storage.load_received_warning_ids("10"))
+        sqlite_storage.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
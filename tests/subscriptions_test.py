@@ -2,7 +2,8 @@ import unittest
 from unittest import TestCase
 import sys
 
-from mock import patch
+import telebot.apihelper
+from mock import patch, ANY
 
 sys.path.insert(0, "..\source")
 
@@ -48,6 +49,25 @@ def get_test_subscriptions(warning_category: WarningCategory, warning_severity:
             "081365001088": {str(WarningCategory.CIVIL_PROTECTION.value): WarningSeverity.MINOR.value}}
 
 
+def send_detailed_general_warnings_stub(error: Exception = None):
+    """
+    Returns: a replacement for controller.send_detailed_general_warnings that reports every warning as sent (error is
+    None) or as failed with error
+    """
+    def send_detailed_general_warnings(chat_id, general_warnings, relevant_postal_codes, in_background=False,
+                                       on_done=None):
+        for warning in general_warnings:
+            on_done(warning.id, error)
+        return len(general_warnings)
+
+    return send_detailed_general_warnings
+
+
+def get_telegram_exception(error_code: int, description: str) -> telebot.apihelper.ApiTelegramException:
+    return telebot.apihelper.ApiTelegramException("sendMessage", None, {
+        "ok": False, "error_code": error_code, "description": description})
+
+
 def get_test_general_warning(warning_id, severity: WarningSeverity, version=0, start_date=0,
                              warning_type=WarningType.ALERT, title="Test warning"):
     warning = GeneralWarning(warning_id, version, start_date, severity, warning_type, title)
@@ -56,21 +76,19 @@ def get_test_general_warning(warning_id, severity: WarningSeverity, version=0, s
 
 class TestSubscriptions(TestCase):
 
-    @patch('data_service.has_user_already_received_warning')
-    @patch('data_service.get_user_subscription_postal_codes')
     @patch('controller.send_detailed_general_warnings')
     @patch('data_service.add_warning_id_to_users_warnings_received_list')
-    @patch('subscriptions._any_user_subscription_matches_warning')
-    @patch('data_service.get_chat_ids_of_warned_users')
+    @patch('data_service.get_chat_ids_that_received_warning')
+    @patch('data_service.get_subscribers_for_postal_codes')
+    @patch('data_service.get_active_warnings_dict')
     @patch('nina_service.get_all_active_warnings')
     def test_warn_users(self,
                         get_all_active_warnings_mock,
-                        get_chat_ids_of_warned_users_mock,
-                        any_user_subscription_matches_warning_mock,
+                        get_active_warnings_dict_mock,
+                        get_subscribers_for_postal_codes_mock,
+                        get_chat_ids_that_received_warning_mock,
                         add_warning_id_to_users_warnings_received_list_mock,
-                        send_detailed_general_warnings_mock,
-                        get_user_subscription_postal_codes_mock,
-                        has_user_already_received_warning_mock
+                        send_detailed_general_warnings_mock
                         ):
         # Mock data_service (database should not be affected by tests)
         add_warning_id_to_users_warnings_received_list_mock.side_effect = \
@@ -82,67 +100,115 @@ class TestSubscriptions(TestCase):
         warning_2 = (get_test_general_warning(warning_id="WARNING_ID_DEF", severity=WarningSeverity.SEVERE),
                      WarningCategory.WEATHER)
 
-        # Mock chat ids
-        chat_ids = [123, 456]
+        # Mock postal codes of the active warnings
+        get_active_warnings_dict_mock.return_value = {"WARNING_ID_ABC": ["64283", "64297"],
+                                                      "WARNING_ID_DEF": ["64283"]}
 
-        # Mock subscription postal codes
-        get_user_subscription_postal_codes_mock.return_value = ["64283", "64297"]
+        # Mock subscribers: both users subscribed to 64283 for all categories with the lowest severity
+        subscribers = {123: {"64283": {str(WarningCategory.FLOOD.value): WarningSeverity.MINOR.value,
+                                       str(WarningCategory.WEATHER.value): WarningSeverity.MINOR.value}},
+                       456: {"64283": {str(WarningCategory.FLOOD.value): WarningSeverity.MINOR.value,
+                                       str(WarningCategory.WEATHER.value): WarningSeverity.MINOR.value}}}
+        get_chat_ids_that_received_warning_mock.return_value = set()
 
         with self.subTest('There are no active warnings'):
-            has_user_already_received_warning_mock.return_value = False
             get_all_active_warnings_mock.return_value = []
-            get_chat_ids_of_warned_users_mock.return_value = chat_ids
+            get_subscribers_for_postal_codes_mock.return_value = subscribers
             result = subscriptions.warn_users()
             self.assertFalse(result)
 
         with self.subTest('There are active warnings but no user wants to be warned'):
-            has_user_already_received_warning_mock.return_value = False
             get_all_active_warnings_mock.return_value = [warning_1, warning_2]
-            get_chat_ids_of_warned_users_mock.return_value = []
+            get_subscribers_for_postal_codes_mock.return_value = {}
             result = subscriptions.warn_users()
             self.assertFalse(result)
 
         with self.subTest('There are active warnings and all users want to be warned'):
-            has_user_already_received_warning_mock.return_value = False
-            any_user_subscription_matches_warning_mock.return_value = True
-            send_detailed_general_warnings_mock.return_value = 4
-            get_chat_ids_of_warned_users_mock.return_value = chat_ids
+            get_subscribers_for_postal_codes_mock.return_value = subscribers
+            send_detailed_general_warnings_mock.side_effect = send_detailed_general_warnings_stub()
+            send_detailed_general_warnings_mock.reset_mock()
+            add_warning_id_to_users_warnings_received_list_mock.reset_mock()
             result = subscriptions.warn_users()
+            self.assertEqual(send_detailed_general_warnings_mock.call_count, 4)
+            send_detailed_general_warnings_mock.assert_any_call(123, [warning_1[0]], ["64283"], in_background=True,
+                                                                on_done=ANY)
+            add_warning_id_to_users_warnings_received_list_mock.assert_any_call(123, "WARNING_ID_ABC")
+            self.assertEqual(add_warning_id_to_users_warnings_received_list_mock.call_count, 4)
             self.assertTrue(result)
 
-        with self.subTest('There are active warnings and some users want to be warned'):
-            any_user_subscription_matches_warning_mock.side_effect = (lambda chat_id, warning,
-                                                                             warning_category: chat_id == 123)
-            get_chat_ids_of_warned_users_mock.return_value = chat_ids
-            send_detailed_general_warnings_mock.call_count = 0
-            send_detailed_general_warnings_mock.return_value = 2
+        with self.subTest('Warnings that could not be sent are not marked as received'):
+            send_detailed_general_warnings_mock.side_effect = send_detailed_general_warnings_stub(
+                get_telegram_exception(429, "Too Many Requests: retry after 5"))
+            send_detailed_general_warnings_mock.reset_mock()
+            add_warning_id_to_users_warnings_received_list_mock.reset_mock()
+            subscriptions.warn_users()
+            self.assertEqual(send_detailed_general_warnings_mock.call_count, 4)
+            add_warning_id_to_users_warnings_received_list_mock.assert_not_called()
+
+            # they are sent again in the next run
+            send_detailed_general_warnings_mock.reset_mock()
+            subscriptions.warn_users()
+            self.assertEqual(send_detailed_general_warnings_mock.call_count, 4)
+
+        with self.subTest('Warnings Telegram refused for good are marked as received'):
+            send_detailed_general_warnings_mock.side_effect = send_detailed_general_warnings_stub(
+                get_telegram_exception(403, "Forbidden: bot was blocked by the user"))
+            send_detailed_general_warnings_mock.reset_mock()
+            add_warning_id_to_users_warnings_received_list_mock.reset_mock()
+            subscriptions.warn_users()
+            self.assertEqual(send_detailed_general_warnings_mock.call_count, 4)
+            add_warning_id_to_users_warnings_received_list_mock.assert_any_call(123, "WARNING_ID_ABC")
+            self.assertEqual(add_warning_id_to_users_warnings_received_list_mock.call_count, 4)
+
+        with self.subTest('Warnings that are still enqueued are not enqueued again'):
+            send_detailed_general_warnings_mock.side_effect = None
+            send_detailed_general_warnings_mock.return_value = 1
+            send_detailed_general_warnings_mock.reset_mock()
+            subscriptions.warn_users()
+            self.assertEqual(send_detailed_general_warnings_mock.call_count, 4)
+            send_detailed_general_warnings_mock.reset_mock()
+            subscriptions.warn_users()
+            self.assertEqual(send_detailed_general_warnings_mock.call_count, 0)
+            subscriptions._pending_warnings.clear()
+            send_detailed_general_warnings_mock.side_effect = send_detailed_general_warnings_stub()
+
+        with self.subTest('A warning that failed with an error is not kept as enqueued'):
+            send_detailed_general_warnings_mock.side_effect = RuntimeError("enqueue failed")
+            with self.assertRaises(RuntimeError):
+                subscriptions.warn_users()
+            self.assertEqual(set(), subscriptions._pending_warnings)
+            send_detailed_general_warnings_mock.side_effect = send_detailed_general_warnings_stub()
+
+        with self.subTest('There are active warnings and some users already received them'):
+            get_chat_ids_that_received_warning_mock.return_value = {456}
+            send_detailed_general_warnings_mock.reset_mock()
             result = subscriptions.warn_users()
             self.assertEqual(send_detailed_general_warnings_mock.call_count, 2)  # only chat_id=123 should be warned
             self.assertTrue(result)
 
-    @patch('data_service.get_subscriptions')
-    def test_any_user_subscription_matches_warning(self, get_subscriptions_mock):
-        # Mock subscription
+        with self.subTest('The postal codes of the active warnings are not known yet'):
+            get_active_warnings_dict_mock.return_value = {}
+            get_chat_ids_that_received_warning_mock.return_value = set()
+            send_detailed_general_warnings_mock.reset_mock()
+            result = subscriptions.warn_users()
+            self.assertEqual(send_detailed_general_warnings_mock.call_count, 0)
+            self.assertFalse(result)
+
+    def test_get_postal_codes_of_matching_subscriptions(self):
+        # Mock subscriptions
         demo_subscriptions = get_test_subscriptions(postal_code="35394",
                                                     warning_category=WarningCategory.FLOOD,
                                                     warning_severity=WarningSeverity.MINOR)
+        warning = get_test_general_warning(warning_id="test warning abc", severity=WarningSeverity.MINOR)
 
-        # Mock chat id
-        chat_id = 123
-
-        with self.subTest('User has a subscription'):
-            get_subscriptions_mock.return_value = demo_subscriptions
-            warning_category = WarningCategory.FLOOD
-            warning = get_test_general_warning(warning_id="test warning abc", severity=WarningSeverity.MINOR)
-            result = subscriptions._any_user_subscription_matches_warning(chat_id, warning, warning_category)
-            self.assertTrue(result)
+        with self.subTest('User has a matching subscription'):
+            result = subscriptions._get_postal_codes_of_matching_subscriptions(demo_subscriptions, warning,
+                                                                               WarningCategory.FLOOD)
+            self.assertEqual(["35394"], result)
 
         with self.subTest('User has no subscriptions'):
-            get_subscriptions_mock.return_value = {}
-            warning_category = WarningCategory.FLOOD
-            warning = get_test_general_warning(warning_id="test warning abc", severity=WarningSeverity.MINOR)
-            result = subscriptions._any_user_subscription_matches_warning(chat_id, warning, warning_category)
-            self.assertFalse(result)
+            result = subscriptions._get_postal_codes_of_matching_subscriptions({}, warning, WarningCategory.FLOOD)
+            self.assertEqual([], result)
 
     def test_do_subscription_and_warning_match_severity_and_category(self):
         # Mock subscription
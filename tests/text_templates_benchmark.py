@@ -0,0 +1,98 @@
+"""
+Compares the text template lookups of one update with the previous implementation that parsed text_templates.json on
+every call. Run it from the tests folder: python text_templates_benchmark.py
+"""
+import json
+import sys
+import timeit
+
+sys.path.insert(0, "../source")
+
+import text_templates
+from enum_types import Button, Answers, ReplaceableAnswer, BotUsageHelp
+
+
+def _read_file(path: str):
+    with open(path, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def _get_button_name_from_file(button: Button) -> str:
+    for topic in _read_file(text_templates.file_path):
+        if topic['topic'] == "buttons":
+            return topic['names'][button.value]
+
+
+def _get_answers_from_file(answer: Answers) -> str:
+    for topic in _read_file(text_templates.file_path):
+        if topic['topic'] == "answers":
+            return topic['text'][answer.value]
+
+
+def _get_replaceable_answer_from_file(r_answer: ReplaceableAnswer) -> str:
+    result = ""
+    for topic in _read_file(text_templates.file_path):
+        if topic['topic'] == "replaceable_answers":
+            for answer in topic['all_answers']:
+                if answer['topic'] == r_answer.value:
+                    for information in answer['information']:
+                        result += information['text'] + "\n"
+    return result
+
+
+def _get_complex_answer_dict_from_file(name: str) -> dict:
+    for topic in _read_file(text_templates.file_path):
+        if topic['topic'] == "complex_answers":
+            return topic["all_answers"][name]
+
+
+def _update_from_file():
+    """
+    the lookups of a user asking for the warnings of a location: severity button, warning message, keyboard and help
+    """
+    return (_get_button_name_from_file(Button.SEVERE), _get_answers_from_file(Answers.YES),
+            _get_answers_from_file(Answers.NO), _get_replaceable_answer_from_file(ReplaceableAnswer.GENERAL_WARNING),
+            _get_complex_answer_dict_from_file("bot_usage")[BotUsageHelp.FAVORITES.value])
+
+
+def _update():
+    return (text_templates.get_button_name(Button.SEVERE), text_templates.get_answers(Answers.YES),
+            text_templates.get_answers(Answers.NO),
+            text_templates.get_replaceable_answer(ReplaceableAnswer.GENERAL_WARNING),
+            text_templates._get_complex_answer_dict("bot_usage")[BotUsageHelp.FAVORITES.value])
+
+
+warning_values = {"event": "FROST", "headline": "Amtliche WARNUNG vor FROST",
+                  "description": "Es tritt mäßiger Frost zwischen -5 °C und -10 °C auf." * 5, "severity": "Mittel",
+                  "type": "Alert", "start_date": "2023-01-25 18:00", "date_expires": "2023-01-26 10:00",
+                  "status": "Actual", "link": "https://warnung.bund.de/meldung/dwd.2.49.0.0.276.0.DWD.PVW"}
+
+
+def _render_with_replace(template: str, values: dict) -> str:
+    """
+    the previous rendering: one replace of the whole message per placeholder
+    """
+    message = template
+    for name, value in values.items():
+        message = message.replace("%" + name, value if value is not None else "-")
+    return message
+
+
+def benchmark(number: int = 500):
+    assert _update_from_file() == _update()
+
+    old_time = timeit.timeit(_update_from_file, number=number)
+    new_time = timeit.timeit(_update, number=number)
+    print(f"template lookups per update: parsing the file {old_time / number * 1e6:9.1f} µs, "
+          f"indexed {new_time / number * 1e6:7.1f} µs ({old_time / new_time:6.1f}x)")
+
+    template = text_templates.get_replaceable_answer(ReplaceableAnswer.GENERAL_WARNING)
+    assert _render_with_replace(template, warning_values) == text_templates._fill_in(template, warning_values)
+    old_time = timeit.timeit(lambda: _render_with_replace(template, warning_values), number=number * 10)
+    new_time = timeit.timeit(lambda: text_templates._fill_in(template, warning_values), number=number * 10)
+    print(f"rendering a general warning: replace per placeholder {old_time / number / 10 * 1e6:6.2f} µs, "
+          f"single pass {new_time / number / 10 * 1e6:6.2f} µs ({old_time / new_time:4.1f}x)")
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,76 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from mock import patch
+
+sys.path.insert(0, "../source")
+
+import text_templates
+from enum_types import Button, Answers, ReplaceableAnswer
+
+
+class MyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.templates_path = os.path.join(self.directory.name, "text_templates.json")
+        shutil.copyfile(text_templates.file_path, self.templates_path)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_lookups(self):
+        with open(text_templates.file_path, "r", encoding="utf-8") as file:
+            data = json.load(file)
+        buttons = next(topic["names"] for topic in data if topic["topic"] == "buttons")
+        answers = next(topic["text"] for topic in data if topic["topic"] == "answers")
+        replaceable_answers = next(topic["all_answers"] for topic in data if topic["topic"] == "replaceable_answers")
+        greeting = next(answer for answer in replaceable_answers if answer["topic"] == ReplaceableAnswer.GREETING.value)
+
+        self.assertEqual(buttons[Button.SEVERE.value], text_templates.get_button_name(Button.SEVERE))
+        self.assertEqual(answers[Answers.YES.value], text_templates.get_answers(Answers.YES))
+        self.assertEqual("".join(information["text"] + "\n" for information in greeting["information"]),
+                         text_templates.get_replaceable_answer(ReplaceableAnswer.GREETING))
+
+    def test_fill_in(self):
+        with self.subTest("Placeholders inside the values are not replaced"):
+            self.assertEqual("see %b and %a, -",
+                             text_templates._fill_in("see %a, %b", {"a": "%b and %a", "b": None}))
+
+        with self.subTest("Longer placeholders are not taken for shorter ones"):
+            self.assertEqual("Darmstadt (button)", text_templates._fill_in("%location (%location_button)",
+                                                                           {"location": "Darmstadt",
+                                                                            "location_button": "button"}))
+
+        with self.subTest("Values that are None are replaced by the default"):
+            self.assertEqual("unbekannt", text_templates._fill_in("%a", {"a": None}, default="unbekannt"))
+
+        with self.subTest("A warning description with placeholders is inserted as it is"):
+            message = text_templates.get_general_warning_message("event", "FROST", "siehe %headline", None, None,
+                                                                 None, None, None, None)
+            self.assertIn("siehe %headline", message)
+            self.assertIn("FROST", message)
+            self.assertNotIn("%description", message)
+
+    def test_reload_after_change(self):
+        with patch("text_templates.file_path", self.templates_path):
+            generation = text_templates.get_templates_generation()
+            self.assertEqual(generation, text_templates.get_templates_generation())
+
+            with open(self.templates_path, "r", encoding="utf-8") as file:
+                data = json.load(file)
+            for topic in data:
+                if topic["topic"] == "buttons":
+                    topic["names"][Button.SEVERE.value] = "Changed severe button"
+            with open(self.templates_path, "w", encoding="utf-8") as file:
+                json.dump(data, file)
+
+            self.assertEqual("Changed severe button", text_templates.get_button_name(Button.SEVERE))
+            self.assertNotEqual(generation, text_templates.get_templates_generation())
+
+
+if __name__ == '__main__':
+    unittest.main()